@@ -0,0 +1,68 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User, auth_version_cache, auth_version_cache_key, auth_version_cache_timeout
+from .tokens import AUTH_VERSION_CLAIM, CLAIMS
+
+
+class TokenPrincipal(TokenUser):
+    """
+    request.user built from access token claims. Exposes the attributes rbac,
+    CanEditEntry and the views read (pk/id, role, clinic_id, patient_id).
+    It is not a model instance: assign it to foreign keys via <field>_id=principal.pk.
+    """
+
+    @cached_property
+    def id(self):
+        # simplejwt stores the user id claim as a string
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def role(self):
+        return self.token["role"]
+
+    @property
+    def clinic_id(self):
+        return self.token["clinic_id"]
+
+    @property
+    def patient_id(self):
+        return self.token["patient_id"]
+
+
+def current_auth_version(user_id):
+    cache = auth_version_cache()
+    key = auth_version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        row = User.objects.filter(pk=user_id, is_active=True).values_list("auth_version", flat=True).first()
+        if row is None:
+            return None
+        version = row
+        cache.set(key, version, auth_version_cache_timeout())
+    return version
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    Stateless for tokens issued by PrincipalRefreshToken: the principal comes from
+    the claims and revocation is a cache lookup of the user's auth_version (the DB
+    is only read when that key is missing, at most once per AUTH_VERSION_CACHE_SECONDS
+    per user and process). Tokens without the claims fall back to the stock
+    per-request user lookup.
+    """
+
+    def get_user(self, validated_token):
+        if AUTH_VERSION_CLAIM not in validated_token or any(c not in validated_token for c in CLAIMS):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed("Token contained no recognizable user identification", code="token_not_valid")
+
+        if current_auth_version(user_id) != validated_token[AUTH_VERSION_CLAIM]:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return TokenPrincipal(validated_token)
@@ -1,6 +1,25 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import caches
 from django.db import models
 
+# fields baked into access tokens as claims; changing any of them revokes old tokens
+AUTH_CLAIM_FIELDS = ("role", "clinic_id", "patient_id", "is_active")
+
+
+def auth_version_cache_key(user_id) -> str:
+    return f"auth-version:{user_id}"
+
+
+def auth_version_cache():
+    return caches[getattr(settings, "AUTH_VERSION_CACHE_ALIAS", "default")]
+
+
+def auth_version_cache_timeout():
+    # bounds how long another process (with its own, or a stale, cache entry) accepts revoked tokens
+    return getattr(settings, "AUTH_VERSION_CACHE_SECONDS", 30)
+
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ("patient", "patient"),
@@ -11,3 +30,30 @@ class User(AbstractUser):
     role = models.CharField(max_length=16, choices=ROLE_CHOICES, default="staff")
     clinic_id = models.CharField(max_length=64, null=True, blank=True)
     patient_id = models.IntegerField(null=True, blank=True)
+    # bumped whenever an AUTH_CLAIM_FIELDS value changes; tokens carry the version they were issued at
+    auth_version = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_state = instance._current_auth_state()
+        return instance
+
+    def _current_auth_state(self):
+        if self.get_deferred_fields().intersection(AUTH_CLAIM_FIELDS):
+            return None
+        return tuple(getattr(self, f) for f in AUTH_CLAIM_FIELDS)
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, "_auth_state", None)
+        state = self._current_auth_state()
+        if loaded is not None and state is not None and loaded != state:
+            self.auth_version += 1
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "auth_version"}
+        super().save(*args, **kwargs)
+        self._auth_state = state
+        # token authentication compares claims against this, and reads the DB once it expires
+        # (queryset.update() skips save(); bump auth_version explicitly there)
+        auth_version_cache().set(auth_version_cache_key(self.pk), self.auth_version, auth_version_cache_timeout())
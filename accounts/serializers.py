@@ -0,0 +1,26 @@
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import AUTH_VERSION_CLAIM, PrincipalRefreshToken
+
+
+class PrincipalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = PrincipalRefreshToken
+
+
+class PrincipalTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = PrincipalRefreshToken
+
+    def validate(self, attrs):
+        # a refresh token minted before a role/clinic/patient change must not yield fresh access tokens
+        refresh = self.token_class(attrs["refresh"])
+        if AUTH_VERSION_CLAIM in refresh:
+            current = (
+                User.objects.filter(pk=refresh.get(api_settings.USER_ID_CLAIM))
+                .values_list("auth_version", flat=True).first()
+            )
+            if current != refresh[AUTH_VERSION_CLAIM]:
+                raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
@@ -0,0 +1,21 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# copied onto the access token, so requests can be authorized without loading the user
+CLAIMS = ("role", "clinic_id", "patient_id")
+AUTH_VERSION_CLAIM = "auth_ver"
+
+
+def add_principal_claims(token, user):
+    for name in CLAIMS:
+        token[name] = getattr(user, name)
+    token[AUTH_VERSION_CLAIM] = user.auth_version
+    token["username"] = user.get_username()
+    return token
+
+
+class PrincipalRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry role / clinic_id / patient_id and the user's auth_version."""
+
+    @classmethod
+    def for_user(cls, user):
+        return add_principal_claims(super().for_user(user), user)
@@ -0,0 +1,160 @@
+"""
+Database benchmarks: synthetic data, end-to-end latencies, run comparison.
+
+    python -m benchmarks generate --scale small --db var/bench.sqlite3
+    python -m benchmarks run --db var/bench.sqlite3 --out benchmarks/results/<name>.json [--baseline old.json]
+    python -m benchmarks compare old.json new.json [--threshold 0.2]
+
+The benchmarks use their own SQLite file (never the development database) and
+production-like settings: DEBUG off, so neither the query log nor the query
+budget middleware skews timings.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from . import compare
+
+
+def setup_django(db_path: str) -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    from django.conf import settings
+
+    path = Path(db_path).resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    settings.DATABASES["default"]["NAME"] = path
+    settings.DEBUG = False
+    settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE if m != "notes.querybudget.QueryBudgetMiddleware"]
+    # audit writes as in production: spooled per request, inserted by the background flusher
+    # (its inserts share SQLite's write lock with the measured requests, as they would live)
+    settings.AUDIT_SPOOL_DIR = path.parent / f"{path.stem}_audit_spool"
+    # the suite fires generation requests back to back; measure their cost, not the throttle
+    settings.ADMISSION_CONTROL = False
+
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def _meta_path(db_path: str) -> Path:
+    return Path(db_path).with_suffix(".meta.json")
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def cmd_generate(args) -> int:
+    setup_django(args.db)
+    from django.db import connection
+
+    from .datagen import generate, scale_from_args
+
+    with connection.cursor() as cur:
+        cur.execute("PRAGMA synchronous = OFF")  # disposable database: skip fsyncs during the bulk load
+
+    scale = scale_from_args(args.scale, clinics=args.clinics, patients_per_clinic=args.patients,
+                            entries_per_patient=args.entries, seed=args.seed)
+    print(f"generating {scale.entries:,} entries into {args.db}: {scale}")
+    started, last_report = time.monotonic(), [0.0]
+
+    def progress(counts):
+        if time.monotonic() - last_report[0] >= 5:
+            last_report[0] = time.monotonic()
+            print(f"  {counts['patients']:,} patients, {counts['entries']:,} entries")
+
+    counts = generate(scale, progress)
+    elapsed = time.monotonic() - started
+    _meta_path(args.db).write_text(json.dumps({"scale": vars(scale), "counts": counts}, indent=2))
+    print(f"done in {elapsed:.1f}s: {counts}")
+    return 0
+
+
+def cmd_run(args) -> int:
+    setup_django(args.db)
+    import django
+    from .suite import dataset_counts, run_suite
+
+    meta_path = _meta_path(args.db)
+    dataset = json.loads(meta_path.read_text()) if meta_path.exists() else {"counts": dataset_counts()}
+
+    def progress(name, r):
+        print(f"{name:<26} p50 {r['p50_ms']:>8.2f} ms  p99 {r['p99_ms']:>8.2f} ms  "
+              f"{r['ops_per_s']:>8.1f} ops/s  {r['max_queries']:>3} queries")
+
+    results = run_suite(samples=args.samples, seed=args.seed, progress=progress)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": __import__("sqlite3").sqlite_version,
+            "samples": args.samples,
+            "seed": args.seed,
+        },
+        "dataset": dataset,
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.out}")
+    if args.baseline:
+        if not args.out:
+            print("--baseline needs --out", file=sys.stderr)
+            return 2
+        return compare.main(args.baseline, args.out, args.threshold)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    return compare.main(args.baseline, args.candidate, args.threshold)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="bulk-load a synthetic dataset into an empty database")
+    gen.add_argument("--db", default="var/bench.sqlite3")
+    gen.add_argument("--scale", default="small", choices=["tiny", "small", "medium", "large"])
+    gen.add_argument("--clinics", type=int)
+    gen.add_argument("--patients", type=int, help="patients per clinic")
+    gen.add_argument("--entries", type=int, help="entries per patient")
+    gen.add_argument("--seed", type=int)
+    gen.set_defaults(func=cmd_generate)
+
+    run = sub.add_parser("run", help="run the benchmarks and store the results as JSON")
+    run.add_argument("--db", default="var/bench.sqlite3")
+    run.add_argument("--samples", type=int, default=200, help="requests per benchmark")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--out", help="results file")
+    run.add_argument("--baseline", help="results file to compare against (exit 1 on regression)")
+    run.add_argument("--threshold", type=float, default=0.2)
+    run.set_defaults(func=cmd_run)
+
+    cmp_ = sub.add_parser("compare", help="compare two results files (exit 1 on regression)")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("candidate")
+    cmp_.add_argument("--threshold", type=float, default=0.2)
+    cmp_.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Compare two benchmark result files (python -m benchmarks run --out ...).
+
+    python -m benchmarks compare baseline.json candidate.json [--threshold 0.2]
+
+Flags a regression when a latency percentile grows, or throughput drops, by more
+than the threshold (default 20%); exits 1 if any benchmark regressed. Pure
+JSON: no database or Django needed.
+"""
+import json
+from typing import Dict, List, Tuple
+
+LATENCY_KEYS = ("p50_ms", "p99_ms")
+THROUGHPUT_KEYS = ("ops_per_s",)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, dict], candidate: Dict[str, dict], threshold: float = 0.2) -> List[Tuple]:
+    """-> [(benchmark, metric, old, new, change, regressed)] for benchmarks present in both runs."""
+    rows = []
+    for name in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[name], candidate[name]
+        for key in LATENCY_KEYS + THROUGHPUT_KEYS:
+            if not old.get(key) or key not in new:
+                continue
+            change = new[key] / old[key] - 1
+            worse = change > threshold if key in LATENCY_KEYS else change < -threshold / (1 + threshold)
+            rows.append((name, key, old[key], new[key], change, worse))
+        if new.get("max_queries", 0) > old.get("max_queries", 0):
+            rows.append((name, "max_queries", old.get("max_queries", 0), new["max_queries"], None, True))
+    return rows
+
+
+def render(rows: List[Tuple]) -> str:
+    lines = [f"{'benchmark':<26} {'metric':<12} {'baseline':>10} {'candidate':>10} {'change':>8}"]
+    for name, key, old, new, change, worse in rows:
+        pct = f"{change:+.0%}" if change is not None else ""
+        lines.append(f"{name:<26} {key:<12} {old:>10} {new:>10} {pct:>8}{'  REGRESSION' if worse else ''}")
+    return "\n".join(lines)
+
+
+def main(baseline_path: str, candidate_path: str, threshold: float = 0.2) -> int:
+    baseline, candidate = load(baseline_path), load(candidate_path)
+    if baseline.get("dataset") != candidate.get("dataset"):
+        print("warning: the runs used different datasets; latencies are not directly comparable")
+    rows = compare(baseline["results"], candidate["results"], threshold)
+    print(render(rows))
+    return 1 if any(row[-1] for row in rows) else 0
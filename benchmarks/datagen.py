@@ -0,0 +1,265 @@
+"""
+Deterministic synthetic dataset for the database benchmarks (benchmarks/suite.py).
+
+    python -m benchmarks generate --scale small --db var/bench.sqlite3
+
+Per clinic: a staff and a clinician user and a patient login for the first
+patient; per patient: a timeline of staff/clinician notes with log-normal
+lengths, an occasional system event and one patient-facing summary, edit
+histories (VersionSnapshots) on a fraction of the notes, rule-based highlights
+with mixed review states and a highlight watermark, i.e. the state after
+highlight generation has run once.
+
+Notes are assembled from a fixed pool of sentences whose keyword matches are
+precomputed, so generating 1M entries does not need the matcher, and the same
+Scale (including seed) always produces the same rows.
+"""
+import json
+import math
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from difflib import SequenceMatcher
+from typing import Iterator, List
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from notes.highlights import RISK_KEYWORDS, highlight_snippet
+from notes.matching import KeywordMatcher
+from notes.models import Entry, Highlight, HighlightWatermark, Patient, VersionSnapshot
+from notes.search import drop_fts_index, ensure_fts_index
+from notes.versioning import keyframe_interval
+
+SUBJECTS = ["Patient", "Pt", "Resident", "Client"]
+FINDINGS = [
+    "reports mild cough", "denies fever", "slept poorly overnight", "ate most of breakfast",
+    "mobilised with frame", "blood pressure stable", "pain score 3/10", "wound dressing changed",
+    "reviewed medication list", "hydration encouraged", "family visited this afternoon",
+    "tolerating oral fluids", "skin intact on pressure areas", "bowels opened today",
+    "appears more settled", "oxygen saturation 96% on room air", "weight unchanged since last week",
+]
+RISKY = [
+    "reports chest pain on exertion", "new allergy to penicillin noted", "mild shortness of breath overnight",
+    "minor bleeding at the cannula site", "expressed suicidal thoughts, escalated to GP",
+]
+PLANS = [
+    "Continue current plan.", "Review again tomorrow.", "Escalate if symptoms worsen.",
+    "Follow up with clinic next week.", "Encourage fluids and rest.", "Repeat observations in 4 hours.",
+]
+STATUS_WEIGHTS = (("suggested", 6), ("accepted", 3), ("rejected", 1))
+
+
+@dataclass
+class Scale:
+    clinics: int = 2
+    patients_per_clinic: int = 20
+    entries_per_patient: int = 50
+    versioned_fraction: float = 0.05   # notes with an edit history
+    max_versions: int = 8
+    median_words: int = 60             # staff notes; clinician notes are twice as long
+    seed: int = 1
+
+    @property
+    def entries(self) -> int:
+        return self.clinics * self.patients_per_clinic * self.entries_per_patient
+
+
+SCALES = {
+    "tiny": Scale(clinics=1, patients_per_clinic=3, entries_per_patient=12),
+    "small": Scale(),
+    "medium": Scale(clinics=5, patients_per_clinic=100, entries_per_patient=100),
+    "large": Scale(clinics=10, patients_per_clinic=500, entries_per_patient=200),  # 1M entries
+}
+
+
+class SentencePool:
+    """Fixed sentences plus their keyword matches, so notes never need rescanning."""
+
+    def __init__(self, rng: random.Random, size: int = 2000, risky_share: float = 0.03):
+        matcher = KeywordMatcher(RISK_KEYWORDS)
+        self.sentences, self.matches = [], []
+        for _ in range(size):
+            finding = rng.choice(RISKY) if rng.random() < risky_share else rng.choice(FINDINGS)
+            text = f"{rng.choice(SUBJECTS)} {finding}, {rng.choice(FINDINGS)}. {rng.choice(PLANS)}"
+            self.sentences.append(text)
+            self.matches.append(list(matcher.find_all(text)))
+
+    def note(self, rng: random.Random, words: int) -> List[int]:
+        return [rng.randrange(len(self.sentences)) for _ in range(max(1, round(words / 12)))]
+
+    def text(self, ids: List[int]) -> str:
+        return " ".join(self.sentences[i] for i in ids)
+
+    def find_all(self, ids: List[int]):
+        offset = 0
+        for i in ids:
+            for m in self.matches[i]:
+                yield m._replace(start=m.start + offset, end=m.end + offset)
+            offset += len(self.sentences[i]) + 1
+
+
+def _words(rng: random.Random, median: int) -> int:
+    # log-normal: most notes are short, a few run to a page or more
+    return max(5, min(int(rng.lognormvariate(math.log(median), 0.8)), 2000))
+
+
+def _edit(rng: random.Random, pool: SentencePool, ids: List[int]) -> List[int]:
+    ids = list(ids)
+    pos = rng.randrange(len(ids) + 1)
+    if rng.random() < 0.6 and pos < len(ids):
+        ids[pos] = rng.randrange(len(pool.sentences))
+    else:
+        ids.insert(pos, rng.randrange(len(pool.sentences)))
+    return ids
+
+
+@dataclass
+class PlannedEntry:
+    type: str
+    author_role: str
+    created_at: datetime
+    sentences: List[int]
+    history: List[List[int]]   # sentences before each edit, oldest first (empty: never edited)
+
+
+def plan_patient(scale: Scale, pool: SentencePool, rng: random.Random, start: datetime) -> Iterator[PlannedEntry]:
+    at = start
+    for _ in range(scale.entries_per_patient - 1):
+        at += timedelta(minutes=rng.randint(20, 16 * 60))
+        roll = rng.random()
+        if roll < 0.03:
+            yield PlannedEntry("system_event", "system", at, pool.note(rng, 12), [])
+            continue
+        clinician = roll < 0.45
+        ids = pool.note(rng, _words(rng, scale.median_words * (2 if clinician else 1)))
+        history = []
+        if rng.random() < scale.versioned_fraction:
+            for _ in range(rng.randint(2, max(2, scale.max_versions))):
+                history.append(ids)
+                ids = _edit(rng, pool, ids)
+        yield PlannedEntry(
+            "clinician_note" if clinician else "staff_note", "clinician" if clinician else "staff", at, ids, history,
+        )
+    at += timedelta(minutes=5)
+    yield PlannedEntry("ai_patient_session_summary", "system", at, pool.note(rng, 40), [])
+
+
+def _tokens(ids: List[int]) -> List[int]:
+    # sentences interleaved with -1 for the separating space
+    out = []
+    for i in ids:
+        out += [-1, i] if out else [i]
+    return out
+
+
+def encode_sentence_snapshot(pool: SentencePool, version: int, prev_ids, ids: List[int]) -> dict:
+    """
+    Same storage rules as versioning.encode_snapshot, but diffing sentence ids instead
+    of words: notes are built from whole sentences, and word-level SequenceMatcher on
+    these highly repetitive texts would dominate the load time.
+    """
+    text = pool.text(ids)
+    if prev_ids is None or version == 1 or (version - 1) % keyframe_interval() == 0:
+        return {"is_keyframe": True, "content": text, "delta": None}
+    a, b = _tokens(prev_ids), _tokens(ids)
+    offsets = [0]
+    for t in a:
+        offsets.append(offsets[-1] + (len(pool.sentences[t]) if t >= 0 else 1))
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append("".join(pool.sentences[t] if t >= 0 else " " for t in b[j1:j2]))
+    if len(json.dumps(ops)) >= len(text):
+        return {"is_keyframe": True, "content": text, "delta": None}
+    return {"is_keyframe": False, "content": "", "delta": ops}
+
+
+def _create_users(clinic_ids: List[str]) -> dict:
+    User = get_user_model()
+    users = []
+    for clinic_id in clinic_ids:
+        for role in ("staff", "clinician"):
+            users.append(User(username=f"bench-{clinic_id}-{role}", role=role, clinic_id=clinic_id))
+    users.append(User(username="bench-admin", role="admin", clinic_id=clinic_ids[0]))
+    for u in users:
+        u.set_unusable_password()
+    User.objects.bulk_create(users)
+    return {(u.clinic_id, u.role): u for u in User.objects.filter(username__startswith="bench-")}
+
+
+def _load_patient(patient: Patient, planned: List[PlannedEntry], pool: SentencePool, users: dict,
+                  rng: random.Random, counts: dict) -> None:
+    entries = []
+    for p_i, p in enumerate(planned):
+        author = users.get((patient.clinic_id, p.author_role))
+        entries.append(Entry(
+            patient=patient, author=author, author_role=p.author_role, type=p.type,
+            created_at=p.created_at, provenance_pointer=f"synthetic:{patient.id}:{p_i}",
+            content=pool.text(p.sentences), current_version=len(p.history),
+        ))
+    Entry.objects.bulk_create(entries, batch_size=500)
+
+    snapshots, highlights, last = [], [], None
+    for e, p in zip(entries, planned):
+        if p.history:
+            # history[0] is the original text; every later state was saved by an edit (version 1..n)
+            prev = None
+            for v, ids in enumerate(p.history[1:] + [p.sentences], start=1):
+                snapshots.append(VersionSnapshot(
+                    entry=e, version=v, changed_by=e.author, **encode_sentence_snapshot(pool, v, prev, ids),
+                ))
+                prev = ids
+        if p.type.startswith("ai_"):
+            continue
+        last = e if last is None or (e.updated_at, e.id) > (last.updated_at, last.id) else last
+        for m in pool.find_all(p.sentences):
+            status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+            highlights.append(Highlight(
+                patient=patient, entry=e, text=f"{m.term}: {highlight_snippet(e.content, m.start, m.end)}"[:256],
+                risk_reason=m.reason, span_start=m.start, span_end=m.end, status=status,
+            ))
+    VersionSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    Highlight.objects.bulk_create(highlights, batch_size=500)
+    HighlightWatermark.objects.create(
+        patient=patient, last_updated_at=last and last.updated_at, last_entry_id=last.id if last else 0,
+    )
+    counts["entries"] += len(entries)
+    counts["versions"] += len(snapshots)
+    counts["highlights"] += len(highlights)
+
+
+def generate(scale: Scale, progress=None) -> dict:
+    """Bulk-load `scale` into an empty database; returns row counts."""
+    if Patient.objects.exists():
+        raise RuntimeError("benchmark data must be generated into an empty database")
+    rng = random.Random(scale.seed)
+    pool = SentencePool(random.Random(scale.seed))
+    clinic_ids = [f"clinic{c:03d}" for c in range(scale.clinics)]
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    counts = {"clinics": scale.clinics, "patients": 0, "entries": 0, "versions": 0, "highlights": 0}
+
+    # maintaining the FTS index row by row is the slowest part of a bulk load; rebuild it once at the end
+    drop_fts_index()
+    users = _create_users(clinic_ids)
+    for clinic_id in clinic_ids:
+        for n in range(scale.patients_per_clinic):
+            with transaction.atomic():
+                patient = Patient.objects.create(clinic_id=clinic_id, display_name=f"Synthetic {clinic_id}-{n:05d}")
+                _load_patient(patient, list(plan_patient(scale, pool, rng, start)), pool, users, rng, counts)
+            counts["patients"] += 1
+            if progress:
+                progress(counts)
+        first = Patient.objects.filter(clinic_id=clinic_id).order_by("id").first()
+        login = get_user_model()(username=f"bench-{clinic_id}-patient", role="patient",
+                                 clinic_id=clinic_id, patient_id=first.id)
+        login.set_unusable_password()
+        login.save()
+    ensure_fts_index()
+    return counts
+
+
+def scale_from_args(name: str, **overrides) -> Scale:
+    return Scale(**{**asdict(SCALES[name]), **{k: v for k, v in overrides.items() if v is not None}})
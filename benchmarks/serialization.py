@@ -0,0 +1,83 @@
+"""
+Timeline serialization microbenchmark: DRF serializers + JSONRenderer vs the
+.values_list() fast path + FastJSONRenderer.
+
+    python -m benchmarks.serialization [--sizes 100 10000 100000] [--repeat 3]
+
+Rows are built in memory (no database), so only serialization and rendering are
+measured. Each size also checks that both paths produce identical bytes.
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from notes.fast_serializers import ENTRY_COLUMNS, serialize_entry_rows  # noqa: E402
+from notes.models import Entry  # noqa: E402
+from notes.renderers import FastJSONRenderer, orjson  # noqa: E402
+from notes.serializers import EntrySerializer  # noqa: E402
+
+
+def make_entries(n: int, seed: int = 11):
+    rng = random.Random(seed)
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    out = []
+    for i in range(n):
+        ts = base + datetime.timedelta(seconds=i * 37, microseconds=rng.randrange(10**6))
+        out.append(Entry(
+            id=i + 1,
+            patient_id=1,
+            author_id=rng.choice([None, 2, 3]),
+            author_role=rng.choice(["staff", "clinician", "system"]),
+            type=rng.choice(["staff_note", "clinician_note", "ai_patient_session_summary"]),
+            created_at=ts,
+            updated_at=ts,
+            provenance_pointer=f"feed:{i}",
+            content="Patient reports mild cough; advise hydration. " * rng.randint(1, 12),
+        ))
+    return out
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"orjson: {'yes' if orjson else 'no (stdlib json fallback)'}")
+    print(f"{'entries':>8} {'drf (ms)':>10} {'fast (ms)':>10} {'speedup':>8}")
+    for n in args.sizes:
+        entries = make_entries(n)
+        rows = [tuple(getattr(e, col) for col in ENTRY_COLUMNS) for e in entries]
+
+        def drf():
+            return JSONRenderer().render({"timeline": EntrySerializer(entries, many=True).data})
+
+        def fast():
+            return FastJSONRenderer().render({"timeline": serialize_entry_rows(rows)})
+
+        assert drf() == fast(), "fast path output diverged from DRF serializers"
+        t_drf, t_fast = best_of(drf, args.repeat), best_of(fast, args.repeat)
+        print(f"{n:>8} {t_drf * 1000:>10.1f} {t_fast * 1000:>10.1f} {t_drf / t_fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
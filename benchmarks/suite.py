@@ -0,0 +1,136 @@
+"""
+End-to-end latency benchmarks against a dataset from benchmarks/datagen.py.
+
+    python -m benchmarks run --db var/bench.sqlite3 --out benchmarks/results/today.json [--baseline old.json]
+
+Every request goes through the full Django stack (URL routing, middleware, JWT
+authentication, DRF) with the test client, one request at a time, against a
+seeded random sample of patients/entries. Read-only benchmarks run first; the
+write benchmarks (edit, revert, highlight generation) then modify the sample,
+so regenerate the dataset before comparing runs.
+
+Each benchmark reports latency percentiles in milliseconds, throughput and the
+most queries a single request ran.
+"""
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from django.core.cache import cache
+from django.test import Client
+
+from accounts.models import User
+from accounts.tokens import PrincipalRefreshToken
+from notes.models import Entry, Patient
+from notes.querybudget import record_queries
+
+
+class BenchmarkError(RuntimeError):
+    pass
+
+
+def summarize(latencies: List[float], queries: List[int]) -> dict:
+    """latencies in seconds -> percentiles (ms), throughput and max queries per request."""
+    ms = sorted(t * 1000 for t in latencies)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    total = sum(latencies)
+    return {
+        "n": len(ms),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(ms[-1], 3),
+        "mean_ms": round(total * 1000 / len(ms), 3),
+        "ops_per_s": round(len(ms) / total, 1) if total else 0.0,
+        "max_queries": max(queries),
+    }
+
+
+class Runner:
+    def __init__(self, samples: int = 200, seed: int = 1):
+        self.samples = samples
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self._tokens = {}
+
+    def auth(self, user: User) -> dict:
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = f"Bearer {PrincipalRefreshToken.for_user(user).access_token}"
+        return {"HTTP_AUTHORIZATION": self._tokens[user.pk]}
+
+    def measure(self, calls: List[Callable], expect: int = 200, before: Callable = None) -> dict:
+        latencies, queries = [], []
+        for call in calls:
+            if before:
+                before()
+            with record_queries() as recorder:
+                t0 = time.perf_counter()
+                resp = call()
+                latencies.append(time.perf_counter() - t0)
+            queries.append(len(recorder))
+            if resp.status_code != expect:
+                raise BenchmarkError(f"{resp.status_code} (expected {expect}): {resp.content[:300]!r}")
+        if not latencies:
+            raise BenchmarkError("nothing to measure; is the dataset loaded?")
+        return summarize(latencies, queries)
+
+    def sample(self, population: list) -> list:
+        population = list(population)
+        return self.rng.sample(population, min(self.samples, len(population)))
+
+
+def run_suite(samples: int = 200, seed: int = 1, progress=None) -> Dict[str, dict]:
+    r = Runner(samples, seed)
+    clinicians = {u.clinic_id: u for u in User.objects.filter(role="clinician")}
+    patients = r.sample(Patient.objects.order_by("id").values_list("id", "clinic_id"))
+    notes = Entry.objects.filter(type="clinician_note").order_by("id")
+    versioned = r.sample(notes.filter(current_version__gt=1).values_list("id", "patient__clinic_id"))
+    unedited = r.sample(notes.filter(current_version=0).values_list("id", "patient__clinic_id"))
+    results = {}
+
+    def bench(name, *args, **kwargs):
+        results[name] = r.measure(*args, **kwargs)
+        if progress:
+            progress(name, results[name])
+
+    def get(url, clinic_id):
+        return lambda: r.client.get(url, **r.auth(clinicians[clinic_id]))
+
+    def post(url, clinic_id, data=None):
+        return lambda: r.client.post(url, data or {}, content_type="application/json", **r.auth(clinicians[clinic_id]))
+
+    # reads
+    care_notes = [get(f"/api/patients/{pid}/care-note/", cid) for pid, cid in patients]
+    bench("care_note_cold", care_notes, before=cache.clear)
+    for call in care_notes:
+        call()  # every sampled care note cached
+    bench("care_note_warm", care_notes)
+    pat = User.objects.filter(role="patient").first()
+    if pat:
+        bench("care_note_patient_view", [
+            lambda: r.client.get(f"/api/patients/{pat.patient_id}/care-note/", **r.auth(pat))
+            for _ in range(min(samples, 50))
+        ], before=cache.clear)
+    bench("version_listing", [get(f"/api/entries/{eid}/versions/", cid) for eid, cid in versioned])
+    bench("version_listing_content", [get(f"/api/entries/{eid}/versions/?include=content", cid) for eid, cid in versioned])
+
+    # writes
+    bench("entry_edit", [
+        post(f"/api/entries/{eid}/edit/", cid, {"content": f"Benchmark edit {i}: patient reports chest pain."})
+        for i, (eid, cid) in enumerate(unedited)
+    ])
+    bench("entry_revert", [post(f"/api/entries/{eid}/revert/1/", cid) for eid, cid in versioned])
+    bench("highlights_incremental", [post(f"/api/patients/{pid}/highlights/generate/", cid) for pid, cid in patients])
+    bench("highlights_full", [
+        post(f"/api/patients/{pid}/highlights/generate/?mode=full", cid) for pid, cid in patients
+    ])
+    return results
+
+
+def dataset_counts() -> dict:
+    return {
+        "patients": Patient.objects.count(),
+        "entries": Entry.objects.count(),
+        "versioned_entries": Entry.objects.filter(current_version__gt=0).count(),
+    }
@@ -0,0 +1,95 @@
+"""
+Storage vs rebuild-latency trade-off of delta-compressed VersionSnapshots.
+
+    python -m benchmarks.version_storage [--versions 60] [--note-words 400] [--intervals 1 5 10 20 50]
+
+Simulates a long clinician note edited many times (small edits per version) and,
+for each keyframe interval, reports bytes stored and the time to rebuild the
+worst-case version (the one furthest from its keyframe). Pure codec benchmark:
+no database needed.
+"""
+import argparse
+import json
+import random
+import time
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+
+from notes.versioning import encode_snapshot, rebuild_sequence  # noqa: E402
+
+WORDS = (
+    "patient reports mild cough fever resolved hydration advised follow up clinic "
+    "blood pressure stable pain score medication reviewed allergy none known plan continue"
+).split()
+
+
+def edit_chain(versions: int, note_words: int, seed: int = 7):
+    rng = random.Random(seed)
+    words = [rng.choice(WORDS) for _ in range(note_words)]
+    chain = []
+    for _ in range(versions):
+        for _ in range(rng.randint(1, 4)):
+            i = rng.randrange(len(words))
+            op = rng.random()
+            if op < 0.5:
+                words[i] = rng.choice(WORDS)
+            elif op < 0.8:
+                words.insert(i, rng.choice(WORDS))
+            elif len(words) > 1:
+                del words[i]
+        chain.append(" ".join(words))
+    return chain
+
+
+def encode_chain(chain, interval: int):
+    rows, prev = [], None
+    for v, text in enumerate(chain, start=1):
+        f = encode_snapshot(v, prev, text, interval=interval)
+        rows.append((v, f["is_keyframe"], f["content"], f["delta"]))
+        prev = text
+    return rows
+
+
+def stored_bytes(rows) -> int:
+    return sum(len(content.encode()) + (len(json.dumps(delta)) if delta else 0) for _, _, content, delta in rows)
+
+
+def worst_rebuild_seconds(rows, repeat: int = 50) -> float:
+    # the version with the most deltas since its keyframe: keyframe .. that version
+    kf, worst = 0, (0, 0)
+    for i, (_, is_keyframe, _, _) in enumerate(rows):
+        if is_keyframe:
+            kf = i
+        worst = max(worst, (i - kf, kf))
+    depth, start = worst
+    segment = rows[start:start + depth + 1]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for _ in rebuild_sequence(segment):
+            pass
+    return (time.perf_counter() - t0) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--versions", type=int, default=60)
+    parser.add_argument("--note-words", type=int, default=400)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    args = parser.parse_args(argv)
+
+    chain = edit_chain(args.versions, args.note_words)
+    full = sum(len(t.encode()) for t in chain)
+    print(f"{args.versions} versions of a ~{args.note_words}-word note; full-copy storage {full} bytes")
+    print(f"{'interval':>8} {'bytes':>10} {'ratio':>7} {'worst rebuild (ms)':>19}")
+    for interval in args.intervals:
+        rows = encode_chain(chain, interval)
+        assert [t for _, t in rebuild_sequence(rows)] == chain
+        size = stored_bytes(rows)
+        print(f"{interval:>8} {size:>10} {size / full:>7.2f} {worst_rebuild_seconds(rows) * 1000:>19.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# care note push (notes/events.py): connect the event backend at startup rather than on first publish
+from notes.events import get_broker  # noqa: E402
+
+get_broker()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,10 +50,40 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "notes.replicas.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+if DEBUG:
+    # logs views that run more queries than their declared query_budget
+    MIDDLEWARE.append("notes.querybudget.QueryBudgetMiddleware")
+QUERY_BUDGET_ACTION = "log"  # or "raise"
+
+# care note push events (notes/events.py); serve with an ASGI server, e.g. `uvicorn config.asgi:application`
+CARE_NOTE_EVENTS_BACKEND = "notes.events.LocalBackend"
+CARE_NOTE_EVENTS_QUEUE_SIZE = 100
+CARE_NOTE_EVENTS_HEARTBEAT = 15.0
+CARE_NOTE_EVENTS_MAX_AGE = 300.0  # streams end after this long; clients reconnect (Django 4.2 misses disconnects)
+
+# per-clinic admission control for highlight/summary generation (notes/admission.py);
+# ADMISSION_CACHE_ALIAS must name a cache shared by all server processes for the limits to be global
+ADMISSION_CONTROL = True
+ADMISSION_RATE = 1.0          # tokens per second per clinic
+ADMISSION_BURST = 10
+ADMISSION_CONCURRENCY = 4     # in-flight generation requests per clinic
+ADMISSION_MAX_WAIT = 2.0      # seconds a request may queue before 429
+ADMISSION_SLOT_TTL = 300
+ADMISSION_CACHE_ALIAS = "shared"
+
+# database-backed job queue (notes/jobs.py), drained by `manage.py run_jobs`
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+
+# patient summary backend (notes/summarizers.py); HTTPSummarizer + `manage.py run_summarizer_stub` for a local service
+SUMMARIZER_BACKEND = "notes.summarizers.MockSummarizer"
+SUMMARIZER_OPTIONS = {}
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -84,6 +115,40 @@ DATABASES = {
     }
 }
 
+# read replica (notes/replicas.py): care note / version reads go to REPLICA_DATABASE, and a
+# user who just wrote reads from the primary for REPLICA_STICKY_SECONDS. Locally, point
+# NIGHTINGALE_REPLICA_DB at a second SQLite file and run `manage.py simulate_replication`.
+DATABASE_ROUTERS = ["notes.sharding.ClinicShardRouter", "notes.replicas.ReplicaRouter"]
+REPLICA_DATABASE = None
+REPLICA_STICKY_SECONDS = 10
+if os.environ.get("NIGHTINGALE_REPLICA_DB"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["NIGHTINGALE_REPLICA_DB"],
+    }
+    REPLICA_DATABASE = "replica"
+
+# clinic sharding (notes/sharding.py): each clinic's entries, versions, highlights, comments
+# and audit rows live in the SHARD_DATABASES alias its ClinicShard row names (default if none);
+# users, patients and jobs stay in default. Move a clinic with `manage.py move_clinic`.
+CLINIC_SHARDING = False
+SHARD_DATABASES = ["default"]
+SHARD_ID_BLOCK = 100             # ids reserved per round trip to the directory sequence
+SHARD_MAP_CACHE_SECONDS = 60    # also how long move_clinic waits after refusing the clinic's writes
+
+# applied to every new SQLite connection (notes/sqlite.py)
+SQLITE_PRAGMAS = {
+    "busy_timeout": 5000,            # ms to wait for a lock before "database is locked"
+    "journal_mode": "WAL",           # readers are not blocked by a writer
+    "synchronous": "NORMAL",         # with WAL: durable at checkpoints, never corrupt
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,            # negative = KiB, i.e. a 64 MB page cache per connection
+    "temp_store": "MEMORY",
+}
+# @write_transaction (BEGIN IMMEDIATE) retries while the write lock is held elsewhere
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_BACKOFF = 0.05
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,11 +193,66 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # principal from token claims; no user query per request
+        "accounts.authentication.PrincipalJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    # same bytes as JSONRenderer; uses orjson when installed
+    "DEFAULT_RENDERER_CLASSES": (
+        "notes.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+}
+
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "accounts.serializers.PrincipalTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.PrincipalTokenRefreshSerializer",
 }
 
+# claims-token revocation (accounts/authentication.py): users' auth_version is cached for this long, so a
+# process with a per-process cache sees a change made elsewhere within AUTH_VERSION_CACHE_SECONDS
+AUTH_VERSION_CACHE_ALIAS = "default"
+AUTH_VERSION_CACHE_SECONDS = 30
+
 ALLOWED_HOSTS = ["127.0.0.1", "localhost", "testserver"]
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # seen by every server process (its table is created by `migrate`); state that must be global
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "shared_cache",
+    },
+}
+
+# rendered care note payloads keyed by (patient, role view, generation); see notes/caching.py
+CARE_NOTE_CACHE_ENABLED = True
+CARE_NOTE_CACHE_ALIAS = "default"
+CARE_NOTE_CACHE_TIMEOUT = 300
+
+# rule-based highlight dictionary (notes/matching.py); JSON {"term": "reason"} or [["term", "reason"], ...]
+# defaults to notes.highlights.RISK_KEYWORDS when neither is set
+HIGHLIGHT_RULES = []
+HIGHLIGHT_RULES_FILE = None
+# clinic batch run (notes/batch.py): a running run not checkpointed for this long may be resumed by another runner
+HIGHLIGHT_RUN_LEASE_SECONDS = 600
+
+# VersionSnapshot storage: full keyframe every N versions, word-level deltas in between
+VERSION_KEYFRAME_INTERVAL = 10
+
+# AuditLog writer (notes/audit.py): events are spooled on commit and bulk-inserted by a background flusher
+AUDIT_WRITER = "spool"
+AUDIT_SPOOL_DIR = BASE_DIR / "var" / "audit_spool"
+AUDIT_SPOOL_FSYNC = True
+AUDIT_SPOOL_MAX_BACKLOG = 64 * 1024 * 1024
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_FLUSH_THREAD = True
+# `manage.py archive_audit_log` moves older rows to gzipped segments (notes/audit_archive.py)
+AUDIT_RETENTION_DAYS = 90
+AUDIT_ARCHIVE_DIR = BASE_DIR / "var" / "audit_archive"
+AUDIT_ARCHIVE_SEGMENT_ROWS = 50000
+AUDIT_ARCHIVE_RETENTION_DAYS = None  # keep segments forever
@@ -0,0 +1,208 @@
+"""
+Per-clinic admission control for expensive generation endpoints.
+
+Highlight generation and patient summaries cost work proportional to a
+patient's history. admit(clinic_id) lets such a request in only if the clinic
+    - has a token: ADMISSION_BURST tokens per clinic, refilled at ADMISSION_RATE per second
+    - has fewer than ADMISSION_CONCURRENCY generation requests in flight
+Otherwise the request waits, up to ADMISSION_MAX_WAIT seconds, and is then
+rejected with AdmissionRejected (views answer 429 + Retry-After). If the next
+token is further away than the wait allows, the request is rejected at once.
+
+State lives in the cache (ADMISSION_CACHE_ALIAS), so limits hold across
+processes only if that cache is shared; settings point it at a DatabaseCache
+("shared", whose table `migrate` creates), since locmem is per
+process. Each clinic's state (bucket, in-flight slots, counters) is one cache
+entry, read-modify-written under a short cache.add() lock (waiting for it counts
+against ADMISSION_MAX_WAIT). A request rejected for concurrency gets its token
+back. Every in-flight slot carries its own expiry, ADMISSION_SLOT_TTL after it
+was taken, so a slot held by a crashed worker frees itself and a late release
+never undercounts.
+
+Each decision is counted per clinic (admitted, queued, rejected_rate,
+rejected_concurrency, and wait_ms for queued requests); admission_metrics() and
+GET /api/admin/admission/ report the counters and the current in-flight count.
+
+Settings:
+    ADMISSION_CONTROL       enforce limits (default True)
+    ADMISSION_RATE          tokens per second per clinic (default 1.0)
+    ADMISSION_BURST         bucket size (default 10)
+    ADMISSION_CONCURRENCY   in-flight generation requests per clinic (default 4)
+    ADMISSION_MAX_WAIT      seconds a request may queue before 429 (default 2.0)
+    ADMISSION_SLOT_TTL      seconds before a leaked in-flight slot expires (default 300)
+    ADMISSION_CACHE_ALIAS   cache holding the state (default "default")
+"""
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Patient
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("admitted", "queued", "rejected_rate", "rejected_concurrency", "wait_ms")
+POLL_INTERVAL = 0.05
+LOCK_TIMEOUT = 2  # a crashed lock holder blocks its clinic's bucket this long at most
+# statements an uncontended admit() + release cost on a DatabaseCache: two locked
+# read-modify-writes of the clinic's state (add = set = count + select + write)
+ADMISSION_QUERIES = 16
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, clinic_id: str, reason: str, retry_after: int):
+        super().__init__(f"Too many generation requests for clinic {clinic_id}; retry in {retry_after}s")
+        self.clinic_id = clinic_id
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _cache():
+    return caches[getattr(settings, "ADMISSION_CACHE_ALIAS", "default")]
+
+
+def _state_key(clinic_id: str) -> str:
+    return f"admission:clinic:{clinic_id}"
+
+
+class _LockTimeout(Exception):
+    pass
+
+
+@contextmanager
+def _lock(cache, name: str, deadline: float):
+    """Hold the named lock; raises _LockTimeout once time.monotonic() would pass deadline."""
+    key = f"admission:lock:{name}"
+    delay = 0.001
+    # the lock key expires, so a holder that died cannot block forever; each
+    # attempt is a few statements on a database cache, so back off between them
+    while not cache.add(key, 1, LOCK_TIMEOUT):
+        if time.monotonic() + delay > deadline:
+            raise _LockTimeout(name)
+        time.sleep(delay)
+        delay = min(2 * delay, POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def _load(cache, clinic_id: str, now: float) -> dict:
+    """The clinic's state as of now: bucket refilled, expired slots dropped. Call under _lock."""
+    burst = getattr(settings, "ADMISSION_BURST", 10)
+    state = cache.get(_state_key(clinic_id))
+    if state is None:
+        state = {"tokens": burst, "stamp": now, "slots": {}, "metrics": dict.fromkeys(METRICS, 0)}
+    refill = max(0.0, now - state["stamp"]) * getattr(settings, "ADMISSION_RATE", 1.0)
+    state["tokens"] = min(burst, state["tokens"] + refill)
+    state["stamp"] = now
+    state["slots"] = {slot: expires for slot, expires in state["slots"].items() if expires > now}
+    return state
+
+
+def _save(cache, clinic_id: str, state: dict) -> None:
+    cache.set(_state_key(clinic_id), state, None)
+
+
+class Admission:
+    """Returned by admit(); holds the clinic's in-flight slot until the with block ends."""
+
+    def __init__(self, cache=None, clinic_id: Optional[str] = None, slot: Optional[str] = None):
+        self.cache = cache
+        self.clinic_id = clinic_id
+        self.slot = slot
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.cache is None:
+            return
+        try:
+            with _lock(self.cache, self.clinic_id, time.monotonic() + LOCK_TIMEOUT):
+                state = self.cache.get(_state_key(self.clinic_id))
+                # gone already if it expired (ADMISSION_SLOT_TTL) while the request ran
+                if state is not None and state["slots"].pop(self.slot, None) is not None:
+                    _save(self.cache, self.clinic_id, state)
+        except _LockTimeout:
+            logger.warning("admission: could not release a slot for clinic %s; it expires instead", self.clinic_id)
+
+
+def _refund_token(cache, clinic_id: str, deadline: float) -> None:
+    # best effort: the lock is contended, so the token may stay spent
+    try:
+        with _lock(cache, clinic_id, deadline):
+            state = _load(cache, clinic_id, time.time())
+            state["tokens"] = min(getattr(settings, "ADMISSION_BURST", 10), state["tokens"] + 1)
+            _save(cache, clinic_id, state)
+    except _LockTimeout:
+        pass
+
+
+def admit(clinic_id: str) -> Admission:
+    """Wait for a token and an in-flight slot for clinic_id; raises AdmissionRejected."""
+    if not getattr(settings, "ADMISSION_CONTROL", True):
+        return Admission()
+    cache = _cache()
+    rate = getattr(settings, "ADMISSION_RATE", 1.0)
+    burst = getattr(settings, "ADMISSION_BURST", 10)
+    started = time.monotonic()
+    deadline = started + getattr(settings, "ADMISSION_MAX_WAIT", 2.0)
+    has_token = queued = False
+    while True:
+        try:
+            # waiting for the lock counts against ADMISSION_MAX_WAIT too
+            with _lock(cache, clinic_id, deadline):
+                now = time.time()
+                state = _load(cache, clinic_id, now)
+                changed = False
+                if not has_token and state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    has_token = changed = True
+                if has_token and len(state["slots"]) < getattr(settings, "ADMISSION_CONCURRENCY", 4):
+                    slot = uuid.uuid4().hex
+                    state["slots"][slot] = now + getattr(settings, "ADMISSION_SLOT_TTL", 300)
+                    if queued:
+                        state["metrics"]["queued"] += 1
+                        state["metrics"]["wait_ms"] += round((time.monotonic() - started) * 1000)
+                    state["metrics"]["admitted"] += 1
+                    _save(cache, clinic_id, state)
+                    return Admission(cache, clinic_id, slot)
+                reason, wait = ("concurrency", POLL_INTERVAL) if has_token else ("rate", (1 - state["tokens"]) / rate)
+                rejected = time.monotonic() + wait > deadline
+                if rejected:
+                    state["metrics"][f"rejected_{reason}"] += 1
+                    if has_token:
+                        # no work ran: hand the token back, or the clinic is rate limited for it too
+                        state["tokens"] = min(burst, state["tokens"] + 1)
+                if rejected or changed:
+                    _save(cache, clinic_id, state)
+        except _LockTimeout:
+            if has_token:
+                _refund_token(cache, clinic_id, time.monotonic() + POLL_INTERVAL)
+            reason, wait, rejected = "concurrency", 1, True
+        if rejected:
+            logger.warning("admission: rejected a generation request for clinic %s (%s)", clinic_id, reason)
+            raise AdmissionRejected(clinic_id, reason, max(1, math.ceil(wait)))
+        queued = True
+        time.sleep(wait)
+
+
+def admission_metrics() -> dict:
+    """{clinic_id: {admitted, queued, rejected_rate, rejected_concurrency, wait_ms, in_flight}}"""
+    cache = _cache()
+    clinics = sorted(set(Patient.objects.values_list("clinic_id", flat=True)))
+    states = cache.get_many([_state_key(clinic_id) for clinic_id in clinics])
+    now = time.time()
+    metrics = {}
+    for clinic_id in clinics:
+        state = states.get(_state_key(clinic_id))
+        if state is not None:
+            in_flight = sum(1 for expires in state["slots"].values() if expires > now)
+            metrics[clinic_id] = {**state["metrics"], "in_flight": in_flight}
+    return metrics
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def _ensure_search_index(using, **kwargs):
+    # a later migration that rebuilds notes_entry drops the FTS triggers; recreate + reindex
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import ensure_fts_index
+    conn = connections[using]
+    if ("notes", "0010_entry_fts") in MigrationRecorder(conn).applied_migrations():
+        ensure_fts_index(conn)
 
 
 class NotesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "notes"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .sharding import relax_shard_constraints
+        from .sqlite import apply_pragmas
+        post_migrate.connect(_ensure_search_index, sender=self)
+        connection_created.connect(apply_pragmas, dispatch_uid="notes.sqlite.apply_pragmas")
+        connection_created.connect(relax_shard_constraints, dispatch_uid="notes.sharding.relax_shard_constraints")
@@ -0,0 +1,275 @@
+"""
+Buffered AuditLog writer.
+
+record_audit() queues the event with transaction.on_commit, so nothing is written
+while the business transaction holds its locks. After commit the event is appended
+to a local spool (JSONL segments on disk) and a background flusher inserts spooled
+events with bulk_create. Spooled events carry an event_id (unique on AuditLog), so
+replaying a segment after a crash never duplicates rows.
+
+Settings:
+    AUDIT_WRITER                 "spool" (default) or "sync" (AuditLog.objects.create inline)
+    AUDIT_SPOOL_DIR              spool directory
+    AUDIT_SPOOL_FSYNC            fsync each append (default True)
+    AUDIT_SPOOL_MAX_BACKLOG      spooled bytes before writers apply backpressure
+    AUDIT_FLUSH_INTERVAL         seconds between background flushes
+    AUDIT_FLUSH_THREAD           start the in-process flusher thread (default True)
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AuditLog
+from .sharding import ClinicMoving, current_shard, shard_for_write
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+FLUSH_BATCH_SIZE = 500
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditSpool:
+    """
+    Segment files in one directory:
+        active-<pid>-<seq>.jsonl    being appended to by process <pid>
+        ready-<ns>-<pid>.jsonl      closed, waiting to be flushed
+        flushing-<pid>-<name>       claimed by the flusher in process <pid>
+    Renames are atomic, so several processes can share a spool directory. A
+    segment whose insert fails is renamed back to ready-* for the next drain.
+    """
+
+    def __init__(self, directory, fsync: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._fh = None
+        self._active = None
+        self.backlog_bytes = self._scan_backlog()
+
+    def _scan_backlog(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.glob("*.jsonl*"))
+
+    def append(self, events) -> None:
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events).encode()
+        with self._lock:
+            if self._fh is None:
+                self._seq += 1
+                self._active = self.directory / f"active-{self.pid}-{self._seq}.jsonl"
+                self._fh = open(self._active, "ab")
+            self._fh.write(data)
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            self.backlog_bytes += len(data)
+            if self._fh.tell() >= SEGMENT_MAX_BYTES:
+                self._rotate_locked()
+
+    def _rotate_locked(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._active.rename(self.directory / f"ready-{time.time_ns()}-{self.pid}.jsonl")
+        self._fh = self._active = None
+
+    def rotate(self) -> None:
+        with self._lock:
+            self._rotate_locked()
+
+    def _claim(self):
+        # own active segment, segments left behind by dead processes, then ready segments
+        self.rotate()
+        for path in self.directory.glob("active-*.jsonl"):
+            pid = int(path.name.split("-")[1])
+            if pid != self.pid and not _pid_alive(pid):
+                self._try_rename(path, self.directory / f"ready-{time.time_ns()}-{pid}.jsonl")
+        for path in self.directory.glob("flushing-*"):
+            pid = int(path.name.split("-")[1])
+            if pid != self.pid and not _pid_alive(pid):
+                self._try_rename(path, self.directory / path.name.split("-", 2)[2])
+
+        claimed = []
+        for path in sorted(self.directory.glob("ready-*.jsonl")):
+            target = self.directory / f"flushing-{self.pid}-{path.name}"
+            if self._try_rename(path, target):
+                claimed.append(target)
+        return claimed
+
+    @staticmethod
+    def _try_rename(src: Path, dst: Path) -> bool:
+        try:
+            src.rename(dst)
+            return True
+        except FileNotFoundError:
+            return False  # another process got it first
+
+    def drain(self) -> int:
+        """Insert every spooled event; returns the number of events flushed."""
+        flushed = 0
+        claimed = self._claim()
+        for n, path in enumerate(claimed):
+            try:
+                flushed += self._flush_segment(path)
+            except BaseException:
+                # hand this and the not yet flushed segments back, so the next drain
+                # (here or in another process) retries them; event_ids dedupe replays
+                for left in claimed[n:]:
+                    self._try_rename(left, self.directory / left.name.split("-", 2)[2])
+                raise
+        return flushed
+
+    def _flush_segment(self, path: Path) -> int:
+        rows = []
+        with open(path, "rb") as fh:
+            for line in fh:
+                try:
+                    rows.append(_row_from_event(json.loads(line)))
+                except (ValueError, KeyError, TypeError):
+                    # torn tail of a segment whose writer crashed mid-append
+                    logger.warning("skipping unreadable audit spool line in %s", path.name)
+        by_shard = defaultdict(list)
+        for row in rows:
+            by_shard[shard_for_write(row.patient_id)].append(row)  # a moving clinic: retried later
+        for alias, shard_rows in by_shard.items():
+            for i in range(0, len(shard_rows), FLUSH_BATCH_SIZE):
+                AuditLog.objects.using(alias).bulk_create(shard_rows[i:i + FLUSH_BATCH_SIZE], ignore_conflicts=True)
+        size = path.stat().st_size
+        path.unlink()
+        with self._lock:
+            self.backlog_bytes = max(0, self.backlog_bytes - size)
+        return len(rows)
+
+
+def _row_from_event(event) -> AuditLog:
+    return AuditLog(
+        event_id=uuid.UUID(event["event_id"]),
+        patient_id=event["patient_id"],
+        actor_id=event["actor_id"],
+        action=event["action"],
+        meta=event["meta"],
+        created_at=datetime.fromisoformat(event["created_at"]),
+    )
+
+
+class AuditFlusher(threading.Thread):
+    def __init__(self, spool: AuditSpool, interval: float):
+        super().__init__(name="audit-flusher", daemon=True)
+        self.spool = spool
+        self.interval = interval
+        self.wake = threading.Event()
+        self.flushed = threading.Condition()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                if self.spool.backlog_bytes:
+                    self.spool.drain()
+            except Exception:
+                logger.exception("audit spool flush failed; events stay spooled")
+            finally:
+                close_old_connections()
+            with self.flushed:
+                self.flushed.notify_all()
+
+
+_writer_lock = threading.Lock()
+_spool = None
+_flusher = None
+
+
+def get_spool(start_flusher: bool = True) -> AuditSpool:
+    global _spool, _flusher
+    with _writer_lock:
+        directory = Path(getattr(settings, "AUDIT_SPOOL_DIR", Path(settings.BASE_DIR) / "var" / "audit_spool"))
+        if _spool is None or _spool.directory != directory or _spool.pid != os.getpid():
+            _spool = AuditSpool(directory, fsync=getattr(settings, "AUDIT_SPOOL_FSYNC", True))
+            _flusher = None
+        if start_flusher and _flusher is None and getattr(settings, "AUDIT_FLUSH_THREAD", True):
+            _flusher = AuditFlusher(_spool, getattr(settings, "AUDIT_FLUSH_INTERVAL", 1.0))
+            _flusher.start()
+        return _spool
+
+
+def _spool_event(event) -> None:
+    # an on_commit callback: the audited write has committed, so nothing here may fail the request
+    try:
+        spool = get_spool()
+        spool.append([event])
+    except Exception:
+        # the log keeps the event for recovery
+        logger.exception("could not spool audit event %s", json.dumps(event, separators=(",", ":")))
+        return
+
+    # backpressure: once the backlog is over budget, writers wait for the flusher
+    # (or flush inline) instead of letting the spool grow without bound
+    limit = getattr(settings, "AUDIT_SPOOL_MAX_BACKLOG", 64 * 1024 * 1024)
+    if spool.backlog_bytes <= limit:
+        return
+    flusher = _flusher
+    if flusher is not None and flusher.is_alive():
+        with flusher.flushed:
+            flusher.wake.set()
+            flusher.flushed.wait(timeout=getattr(settings, "AUDIT_BACKPRESSURE_TIMEOUT", 5.0))
+    if spool.backlog_bytes > limit:
+        try:
+            spool.drain()
+        except ClinicMoving:
+            pass  # its clinic's events flush once the move is over
+        except Exception:
+            logger.exception("inline audit spool flush failed; events stay spooled")
+
+
+def record_audit(patient_id: int, actor, action: str, meta=None) -> None:
+    """Record an AuditLog row once the surrounding transaction commits (dropped on rollback)."""
+    actor_id = getattr(actor, "pk", None)
+    if getattr(settings, "AUDIT_WRITER", "spool") == "sync":
+        AuditLog.objects.using(shard_for_write(patient_id)).create(
+            patient_id=patient_id, actor_id=actor_id, action=action, meta=meta or {},
+        )
+        return
+
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "patient_id": patient_id,
+        "actor_id": actor_id,
+        "action": action,
+        "meta": meta or {},
+        "created_at": timezone.now().isoformat(),
+    }
+    # the write being audited may be on a clinic shard; spool once that commits
+    transaction.on_commit(lambda: _spool_event(event), using=current_shard())
+
+
+@atexit.register
+def _final_flush():
+    if _spool is not None and _spool.pid == os.getpid():
+        try:
+            _spool.drain()
+        except Exception:
+            # left on disk; the next process (or flush_audit_spool) recovers it
+            pass
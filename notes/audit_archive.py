@@ -0,0 +1,292 @@
+"""
+AuditLog retention: old rows move to compressed segment files.
+
+`python manage.py archive_audit_log` moves AuditLog rows older than
+AUDIT_RETENTION_DAYS out of the table (on every clinic shard) into gzipped
+JSONL segments under AUDIT_ARCHIVE_DIR, one UTC day per segment, split every
+AUDIT_ARCHIVE_SEGMENT_ROWS rows:
+
+    2024-01/audit-2024-01-31-<shard>-<first id>.jsonl.gz
+    2024-01/audit-2024-01-31-<shard>-<first id>.idx.json
+
+The sidecar index holds the segment's time range and row counts per patient and
+per action, so lookups only open segments that can match. It is written after
+the segment, and a segment without one is ignored. Rows are deleted only once
+both files are on disk. After a crash in between, the rows are in both places:
+a rerun rewrites the same segment (same day, shard and first id), and readers
+drop duplicate ids.
+
+query_audit() reads the table and the segments as one newest-first stream;
+iter_archived() yields a patient's archived events oldest first (used by the
+patient export).
+
+Settings:
+    AUDIT_RETENTION_DAYS          days rows stay in the table (default 90; None: never archive)
+    AUDIT_ARCHIVE_DIR             segment directory
+    AUDIT_ARCHIVE_SEGMENT_ROWS    rows per segment at most (default 50000)
+    AUDIT_ARCHIVE_RETENTION_DAYS  delete segments this much older than now (default None: keep)
+"""
+import gzip
+import heapq
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AuditLog
+from .pagination import decode_cursor, encode_cursor
+from .sharding import shard_aliases, shard_for_patient
+from .sqlite import write_transaction
+
+ARCHIVE_FIELDS = ("id", "event_id", "patient_id", "actor_id", "action", "meta", "created_at")
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx.json"
+DELETE_BATCH_SIZE = 500
+
+
+def archive_dir() -> Path:
+    return Path(getattr(settings, "AUDIT_ARCHIVE_DIR", Path(settings.BASE_DIR) / "var" / "audit_archive"))
+
+
+def retention_cutoff(now: Optional[datetime] = None) -> Optional[datetime]:
+    days = getattr(settings, "AUDIT_RETENTION_DAYS", 90)
+    if days is None:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _key(row: dict):
+    return row["created_at"], row["id"]
+
+
+# --- writing -----------------------------------------------------------------------
+
+def _fsync_replace(tmp: Path, path: Path) -> None:
+    os.replace(tmp, path)
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_segment(alias: str, day: datetime, rows: List[dict]) -> Path:
+    month_dir = archive_dir() / f"{day:%Y-%m}"
+    month_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"audit-{day:%Y-%m-%d}-{alias}-{rows[0]['id']}"
+    segment = month_dir / f"{stem}{SEGMENT_SUFFIX}"
+
+    tmp = segment.with_name(segment.name + ".tmp")
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+            for row in rows:
+                line = {
+                    **row,
+                    "event_id": row["event_id"] and str(row["event_id"]),
+                    "created_at": row["created_at"].isoformat(),
+                }
+                gz.write(json.dumps(line, separators=(",", ":"), ensure_ascii=False).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    _fsync_replace(tmp, segment)
+
+    index = {
+        "segment": segment.name,
+        "shard": alias,
+        "rows": len(rows),
+        "min_created_at": rows[0]["created_at"].isoformat(),
+        "max_created_at": rows[-1]["created_at"].isoformat(),
+        "patients": dict(Counter(str(r["patient_id"]) for r in rows)),
+        "actions": dict(Counter(r["action"] for r in rows)),
+    }
+    index_path = month_dir / f"{stem}{INDEX_SUFFIX}"
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    _fsync_replace(tmp, index_path)
+    return segment
+
+
+def _delete_rows(alias: str, ids: List[int]) -> None:
+    @write_transaction(using=alias)
+    def delete():
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            AuditLog.objects.using(alias).filter(pk__in=ids[i:i + DELETE_BATCH_SIZE]).delete()
+
+    delete()
+
+
+def archive_audit_log(cutoff: Optional[datetime] = None) -> dict:
+    """
+    Move rows older than cutoff (default: AUDIT_RETENTION_DAYS ago) into segments,
+    then drop expired segments. Returns {"rows", "segments", "pruned"}.
+    """
+    stats = {"rows": 0, "segments": 0, "pruned": 0}
+    cutoff = cutoff or retention_cutoff()
+    max_rows = getattr(settings, "AUDIT_ARCHIVE_SEGMENT_ROWS", 50000)
+    for alias in shard_aliases() if cutoff is not None else ():
+        old = AuditLog.objects.using(alias).filter(created_at__lt=cutoff).order_by("created_at", "id")
+        while True:
+            first = old.values_list("created_at", flat=True).first()
+            if first is None:
+                break
+            # one UTC day per segment, starting from the oldest row left
+            day = first.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            rows = list(old.filter(created_at__lt=day + timedelta(days=1)).values(*ARCHIVE_FIELDS)[:max_rows])
+            _write_segment(alias, day, rows)
+            _delete_rows(alias, [r["id"] for r in rows])
+            stats["rows"] += len(rows)
+            stats["segments"] += 1
+    stats["pruned"] = prune_segments()
+    return stats
+
+
+def prune_segments(now: Optional[datetime] = None) -> int:
+    """Delete segments past AUDIT_ARCHIVE_RETENTION_DAYS; returns how many."""
+    days = getattr(settings, "AUDIT_ARCHIVE_RETENTION_DAYS", None)
+    if days is None:
+        return 0
+    expire_before = (now or timezone.now()) - timedelta(days=days)
+    pruned = 0
+    for index_path, index in _indexes():
+        if datetime.fromisoformat(index["max_created_at"]) < expire_before:
+            # index first: readers never see an index without its segment
+            index_path.unlink(missing_ok=True)
+            (index_path.parent / index["segment"]).unlink(missing_ok=True)
+            pruned += 1
+    return pruned
+
+
+# --- reading -----------------------------------------------------------------------
+
+def _indexes() -> Iterator[Tuple[Path, dict]]:
+    for path in sorted(archive_dir().glob(f"*/*{INDEX_SUFFIX}")):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            continue  # pruned (or being replaced) meanwhile
+        yield path, index
+
+
+def read_segment(path: Path) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            row = json.loads(line)
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+            yield row
+
+
+def _matching_segments(patient_id=None, action=None, since=None, until=None) -> List[Tuple[Path, dict]]:
+    """Segments whose index says they can hold a match, as (segment path, index)."""
+    found = []
+    for index_path, index in _indexes():
+        index["min_created_at"] = datetime.fromisoformat(index["min_created_at"])
+        index["max_created_at"] = datetime.fromisoformat(index["max_created_at"])
+        if patient_id is not None and str(patient_id) not in index["patients"]:
+            continue
+        if action is not None and action not in index["actions"]:
+            continue
+        if since is not None and index["max_created_at"] < since:
+            continue
+        if until is not None and index["min_created_at"] >= until:
+            continue
+        found.append((index_path.parent / index["segment"], index))
+    return found
+
+
+def _row_filter(patient_id=None, action=None, actor_id=None, since=None, until=None, before=None):
+    def keep(row: dict) -> bool:
+        return (
+            (patient_id is None or row["patient_id"] == patient_id)
+            and (action is None or row["action"] == action)
+            and (actor_id is None or row["actor_id"] == actor_id)
+            and (since is None or row["created_at"] >= since)
+            and (until is None or row["created_at"] < until)
+            and (before is None or _key(row) < before)
+        )
+    return keep
+
+
+def iter_archived(patient_id: int) -> Iterator[dict]:
+    """A patient's archived events, oldest first; only overlapping segments are open at once."""
+    segments = sorted(_matching_segments(patient_id=patient_id), key=lambda s: s[1]["min_created_at"])
+    keep = _row_filter(patient_id=patient_id)
+
+    def merged(paths):
+        return heapq.merge(*[filter(keep, read_segment(p)) for p in paths], key=_key)
+
+    group, group_end = [], None
+    for path, index in segments:
+        if group and index["min_created_at"] > group_end:
+            yield from merged(group)
+            group = []
+        group_end = max(group_end, index["max_created_at"]) if group else index["max_created_at"]
+        group.append(path)
+    if group:
+        yield from merged(group)
+
+
+def _archived_page(limit: int, keep, segments, before=None) -> List[dict]:
+    # newest segments first; stop once no older segment can beat the current page
+    if before is not None:
+        # whole segments newer than the cursor were served by earlier pages
+        segments = [(path, index) for path, index in segments if index["min_created_at"] <= before[0]]
+    hits = []
+    for path, index in sorted(segments, key=lambda s: s[1]["max_created_at"], reverse=True):
+        if len(hits) > limit and index["max_created_at"] < hits[-1]["created_at"]:
+            break
+        hits.extend(row for row in read_segment(path) if keep(row))
+        hits = sorted(hits, key=_key, reverse=True)[:limit + 1]
+    return hits
+
+
+def query_audit(patient_id: Optional[int] = None, action: Optional[str] = None, actor_id: Optional[int] = None,
+                since: Optional[datetime] = None, until: Optional[datetime] = None,
+                cursor: Optional[str] = None, limit: int = 100):
+    """
+    Newest-first audit events from the table and the archive together.
+    since is inclusive, until exclusive; cursor comes from a previous page.
+    Returns (rows, next_cursor); rows are dicts of ARCHIVE_FIELDS plus "archived".
+    """
+    before = decode_cursor(cursor) if cursor else None
+
+    filters = Q()
+    if patient_id is not None:
+        filters &= Q(patient_id=patient_id)
+    if action is not None:
+        filters &= Q(action=action)
+    if actor_id is not None:
+        filters &= Q(actor_id=actor_id)
+    if since is not None:
+        filters &= Q(created_at__gte=since)
+    if until is not None:
+        filters &= Q(created_at__lt=until)
+    if before is not None:
+        filters &= Q(created_at__lt=before[0]) | Q(created_at=before[0], id__lt=before[1])
+
+    rows = {}
+    aliases = [shard_for_patient(patient_id)] if patient_id is not None else shard_aliases()
+    for alias in aliases:
+        qs = AuditLog.objects.using(alias).filter(filters).order_by("-created_at", "-id")
+        for row in qs.values(*ARCHIVE_FIELDS)[:limit + 1]:
+            rows[row["id"]] = {**row, "event_id": row["event_id"] and str(row["event_id"]), "archived": False}
+
+    keep = _row_filter(patient_id, action, actor_id, since, until, before)
+    for row in _archived_page(limit, keep, _matching_segments(patient_id, action, since, until), before):
+        rows.setdefault(row["id"], {**row, "archived": True})  # a crashed run can leave a row in both
+
+    page = sorted(rows.values(), key=_key, reverse=True)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*_key(page[-1]))
+    return page, next_cursor
@@ -0,0 +1,183 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .highlights import RISK_KEYWORDS, chunked, finish_patient_run, write_matched_chunk
+from .matching import get_highlight_matcher, init_worker_matcher, match_rows
+from .models import Entry, HighlightBatchRun, HighlightWatermark
+from .sharding import current_shard, use_clinic
+from .sqlite import write_transaction
+
+
+class RunInProgress(Exception):
+    def __init__(self, run: HighlightBatchRun):
+        super().__init__(f"Highlight run {run.id} for clinic {run.clinic_id} is still running")
+        self.run = run
+
+
+def start_run(clinic_id: str, actor=None, resume: bool = False) -> HighlightBatchRun:
+    """
+    resume picks up the clinic's last unfinished run: a failed one, or a running one
+    whose runner stopped checkpointing for HIGHLIGHT_RUN_LEASE_SECONDS (the checkpoint
+    save renews updated_at). Otherwise a new run is created, unless one is still live.
+    A live run raises RunInProgress instead of being shared or run twice.
+    """
+    lease = timedelta(seconds=getattr(settings, "HIGHLIGHT_RUN_LEASE_SECONDS", 600))
+    if resume:
+        run = (
+            HighlightBatchRun.objects.filter(clinic_id=clinic_id)
+            .exclude(status="completed")
+            .order_by("-id")
+            .first()
+        )
+        if run:
+            if run.status == "running" and run.updated_at > timezone.now() - lease:
+                raise RunInProgress(run)
+            # compare-and-set on the row we read: of two concurrent resumes only one takes the run
+            claimed = HighlightBatchRun.objects.filter(
+                id=run.id, status=run.status, updated_at=run.updated_at,
+            ).update(status="running", error="", updated_at=timezone.now())
+            if not claimed:
+                raise RunInProgress(run)
+            run.refresh_from_db()
+            return run
+
+    # check and create under one write lock: of two concurrent starts only one creates a run
+    @write_transaction(using=DEFAULT_DB_ALIAS)
+    def create():
+        live = (
+            HighlightBatchRun.objects
+            .filter(clinic_id=clinic_id, status="running", updated_at__gt=timezone.now() - lease)
+            .order_by("-id")
+            .first()
+        )
+        if live:
+            raise RunInProgress(live)
+        return HighlightBatchRun.objects.create(clinic_id=clinic_id, started_by_id=getattr(actor, "pk", None))
+
+    return create()
+
+
+def _clinic_entries(run: HighlightBatchRun):
+    # non-AI entries past each patient's watermark, grouped by patient; skips patients
+    # already committed by this run (resume checkpoint)
+    wm = "patient__highlight_watermark__"
+    return (
+        Entry.objects
+        .filter(patient__clinic_id=run.clinic_id, patient_id__gt=run.last_patient_id)
+        .exclude(type__startswith="ai_")
+        .filter(
+            Q(**{f"{wm}last_updated_at__isnull": True})
+            | Q(updated_at__gt=F(f"{wm}last_updated_at"))
+            | Q(updated_at=F(f"{wm}last_updated_at"), id__gt=F(f"{wm}last_entry_id"))
+        )
+        .only("id", "patient_id", "content", "updated_at")
+        .order_by("patient_id", "updated_at", "id")
+    )
+
+
+def _matched(entries, matcher, pool, chunk_size: int, window: int):
+    """Yield (entry, matches); with a pool, up to `window` chunks are matched concurrently."""
+    if pool is None:
+        for e in entries:
+            yield e, list(matcher.find_all(e.content or ""))
+        return
+
+    inflight = deque()
+    for chunk in chunked(entries, chunk_size):
+        rows = [(e.id, e.content or "") for e in chunk]
+        inflight.append((chunk, pool.submit(match_rows, rows)))
+        if len(inflight) >= window:
+            done, fut = inflight.popleft()
+            yield from zip(done, fut.result())
+    while inflight:
+        done, fut = inflight.popleft()
+        yield from zip(done, fut.result())
+
+
+def _process_patient(run: HighlightBatchRun, patient_id: int, pairs, actor, batch_size: int) -> None:
+    # a BEGIN that finds the database locked is retried, so the group must be replayable
+    pairs = list(pairs)
+
+    # BEGIN IMMEDIATE on both: the watermark is read before it is written, and a deferred
+    # transaction whose snapshot went stale meanwhile fails instead of waiting. Clinic shard
+    # inside, so the checkpoint (directory) never commits ahead of the highlights.
+    @write_transaction(using=DEFAULT_DB_ALIAS)
+    @write_transaction(using=current_shard())
+    def write():
+        created = scanned = 0
+        last = None
+        watermark, _ = HighlightWatermark.objects.select_for_update().get_or_create(patient_id=patient_id)
+        for chunk in chunked(pairs, batch_size):
+            created += len(write_matched_chunk(patient_id, actor, chunk, batch_size=batch_size))
+            last, scanned = chunk[-1][0], scanned + len(chunk)
+
+        # an interactive run may have moved the watermark past us meanwhile; never regress it
+        if watermark.last_updated_at and (watermark.last_updated_at, watermark.last_entry_id) >= (last.updated_at, last.id):
+            last = None
+        finish_patient_run(patient_id, actor, watermark, last, created, scanned, "batch")
+
+        run.last_patient_id = patient_id
+        run.patients_done += 1
+        run.entries_scanned += scanned
+        run.highlights_created += created
+        run.save(update_fields=[
+            "last_patient_id", "patients_done", "entries_scanned", "highlights_created", "updated_at",
+        ])
+
+    write()
+
+
+def execute_run(run: HighlightBatchRun, workers: int = 0, chunk_size: int = 1000,
+                batch_size: int = 500, progress=None) -> HighlightBatchRun:
+    """
+    Stream the clinic's changed entries with .iterator(chunk_size), match them in a
+    process pool (workers > 0) or inline, and commit per patient: bulk_create in
+    batches, one summary AuditLog, and the run checkpoint in the same transaction,
+    so an interrupted run resumes from the last committed patient.
+    """
+    actor = run.started_by
+    matcher = get_highlight_matcher(RISK_KEYWORDS)
+    pool = None
+    if workers:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # spawn: children never inherit the parent's database connection
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_matcher,
+            initargs=(matcher.rules, matcher.whole_words),
+        )
+
+    started = time.monotonic()
+    base_elapsed = run.elapsed_seconds
+    try:
+        with use_clinic(run.clinic_id):
+            entries = _clinic_entries(run).iterator(chunk_size=chunk_size)
+            pairs = _matched(entries, matcher, pool, chunk_size, window=max(2, workers * 2))
+            for patient_id, group in groupby(pairs, key=lambda p: p[0].patient_id):
+                _process_patient(run, patient_id, group, actor, batch_size)
+                run.elapsed_seconds = base_elapsed + time.monotonic() - started
+                if progress:
+                    progress(run)
+    except BaseException as exc:
+        run.status, run.error = "failed", repr(exc)
+        run.elapsed_seconds = base_elapsed + time.monotonic() - started
+        run.save(update_fields=["status", "error", "elapsed_seconds", "updated_at"])
+        raise
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    run.status = "completed"
+    run.finished_at = timezone.now()
+    run.elapsed_seconds = base_elapsed + time.monotonic() - started
+    run.save(update_fields=["status", "finished_at", "elapsed_seconds", "updated_at"])
+    return run
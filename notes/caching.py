@@ -0,0 +1,92 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+from .models import Patient
+from .sharding import current_shard
+
+
+_pending_bumps = ContextVar("pending_generation_bumps", default=None)
+
+
+def bump_generation(patient_id: int) -> None:
+    # any write to a patient's entries/highlights invalidates every cached care note view of it
+    pending = _pending_bumps.get()
+    if pending is not None:
+        pending.add(patient_id)
+        return
+    shard = current_shard()
+    if shard != DEFAULT_DB_ALIAS and connections[shard].in_atomic_block:
+        # the generation lives in the directory: bump it once the shard write is visible,
+        # or a reader could cache the old rows under the new generation
+        transaction.on_commit(lambda: bump_generation(patient_id), using=shard)
+        return
+    Patient.objects.filter(pk=patient_id).update(generation=F("generation") + 1)
+
+
+@contextmanager
+def coalesce_generation_bumps():
+    """
+    One generation UPDATE per patient for the whole block, instead of one per
+    saved/deleted row (post_save/post_delete fire per object). Nests.
+    """
+    if _pending_bumps.get() is not None:
+        yield
+        return
+    token = _pending_bumps.set(set())
+    try:
+        yield
+    finally:
+        pending = _pending_bumps.get()
+        _pending_bumps.reset(token)
+        for patient_id in sorted(pending):
+            bump_generation(patient_id)
+
+
+def role_view(user) -> str:
+    # the care note payload only differs between patients and everyone else
+    return "patient" if user.role == "patient" else "staff"
+
+
+def care_note_etag(patient: Patient, view: str, params: str = "") -> str:
+    digest = hashlib.sha1(params.encode()).hexdigest()[:12]
+    return f'"cn-{patient.id}-{patient.generation}-{view}-{digest}"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _cache():
+    if not getattr(settings, "CARE_NOTE_CACHE_ENABLED", False):
+        return None
+    return caches[getattr(settings, "CARE_NOTE_CACHE_ALIAS", "default")]
+
+
+def _cache_key(patient: Patient, view: str, params: str) -> str:
+    digest = hashlib.sha1(params.encode()).hexdigest()
+    return f"care-note:{patient.id}:{view}:{patient.generation}:{digest}"
+
+
+def get_cached_care_note(patient: Patient, view: str, params: str = ""):
+    cache = _cache()
+    if cache is None:
+        return None
+    return cache.get(_cache_key(patient, view, params))
+
+
+def set_cached_care_note(patient: Patient, view: str, params: str, payload) -> None:
+    cache = _cache()
+    if cache is None:
+        return
+    timeout = getattr(settings, "CARE_NOTE_CACHE_TIMEOUT", 300)
+    cache.set(_cache_key(patient, view, params), payload, timeout)
@@ -0,0 +1,92 @@
+"""
+Comment threads on timeline entries.
+
+A thread is opened with its first comment and can be resolved/unresolved by
+staff, clinicians and admins; patients never see threads. Counts shown in the
+care note timeline come from with_comment_counts(): two correlated COUNT
+subqueries on the timeline query itself (served by the thread/comment
+indexes), so a page of entries still costs one query.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .audit import record_audit
+from .caching import bump_generation
+from .events import publish_event
+from .models import Comment, CommentThread, Entry
+from .replicas import stick_to_primary
+from .sqlite import write_transaction
+
+
+def _count(qs, group_by: str):
+    counted = qs.order_by().values(group_by).annotate(n=Count("id")).values("n")
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def with_comment_counts(entries_qs):
+    """Annotate open_threads (unresolved) and comment_count (all threads) per entry."""
+    return entries_qs.annotate(
+        open_threads=_count(CommentThread.objects.filter(entry=OuterRef("pk"), is_resolved=False), "entry"),
+        comment_count=_count(Comment.objects.filter(thread__entry=OuterRef("pk")), "thread__entry"),
+    )
+
+
+def check_can_comment(user) -> None:
+    if user.role == "patient":
+        raise PermissionError("patient cannot access comment threads")
+
+
+def _written(entry: Entry, actor, kind: str, **data) -> None:
+    # cached care notes carry the counts; the writer reads them back from the primary
+    bump_generation(entry.patient_id)
+    publish_event(entry.patient_id, kind, entry_id=entry.id, **data)
+    stick_to_primary(actor)
+
+
+def _new_comment(thread: CommentThread, content: str, actor) -> Comment:
+    return Comment.objects.create(thread=thread, author_id=actor.pk, author_role=actor.role, content=content)
+
+
+@write_transaction
+def open_thread(entry: Entry, content: str, actor) -> CommentThread:
+    thread = CommentThread.objects.create(entry=entry)
+    comment = _new_comment(thread, content, actor)
+    thread.comment_count = 1
+    record_audit(
+        patient_id=entry.patient_id, actor=actor, action="open_comment_thread",
+        meta={"entry_id": entry.id, "thread_id": thread.id, "comment_id": comment.id},
+    )
+    _written(entry, actor, "thread.opened", thread_id=thread.id)
+    return thread
+
+
+@write_transaction
+def add_comment(thread: CommentThread, content: str, actor) -> Comment:
+    comment = _new_comment(thread, content, actor)
+    record_audit(
+        patient_id=thread.entry.patient_id, actor=actor, action="add_comment",
+        meta={"entry_id": thread.entry_id, "thread_id": thread.id, "comment_id": comment.id},
+    )
+    _written(thread.entry, actor, "comment.created", thread_id=thread.id, comment_id=comment.id)
+    return comment
+
+
+@write_transaction
+def set_thread_resolved(thread: CommentThread, resolved: bool, actor) -> bool:
+    """Resolve/unresolve; returns False (and writes nothing) if it already was."""
+    now = timezone.now() if resolved else None
+    changed = CommentThread.objects.filter(pk=thread.pk, is_resolved=not resolved).update(
+        is_resolved=resolved, resolved_at=now, resolved_by_id=actor.pk if resolved else None,
+    )
+    thread.is_resolved = resolved
+    if not changed:
+        return False
+    thread.resolved_at, thread.resolved_by_id = now, actor.pk if resolved else None
+    record_audit(
+        patient_id=thread.entry.patient_id, actor=actor,
+        action="resolve_comment_thread" if resolved else "unresolve_comment_thread",
+        meta={"entry_id": thread.entry_id, "thread_id": thread.id},
+    )
+    _written(thread.entry, actor, "thread.resolved" if resolved else "thread.reopened", thread_id=thread.id)
+    return True
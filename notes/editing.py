@@ -1,55 +1,91 @@
-from django.db import transaction
 from django.utils import timezone
-from .models import Entry, VersionSnapshot, AuditLog
+from .models import Entry, VersionSnapshot
+from .audit import record_audit
+from .caching import bump_generation
+from .events import publish_event
+from .replicas import stick_to_primary
+from .sqlite import write_transaction
+from .versioning import encode_snapshot, rebuild_version
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version: int):
+        super().__init__("version_conflict")
+        self.current_version = current_version
+
 
 def get_latest_version(entry: Entry) -> int:
-    last = entry.versions.order_by("-version").first()
-    return last.version if last else 0
+    return entry.current_version
+
+
+def _apply_new_version(entry: Entry, new_content: str, actor, expected_version=None) -> int:
+    # compare-and-swap on Entry.current_version: one conditional UPDATE,
+    # zero rows changed means someone else moved the version first
+    base = entry.current_version if expected_version is None else expected_version
+    # the new snapshot is stored as a delta against the content being replaced
+    prev_content = entry.content if base == entry.current_version else None
+    while True:
+        if prev_content is None:
+            current, prev_content = Entry.objects.filter(pk=entry.pk).values_list("current_version", "content").get()
+            if current != base:
+                if expected_version is not None:
+                    raise VersionConflict(current)
+                # no If-Match: just append on top of whatever is latest now
+                base = current
+        now = timezone.now()
+        changed = Entry.objects.filter(pk=entry.pk, current_version=base).update(
+            content=new_content,
+            updated_at=now,
+            current_version=base + 1,
+        )
+        if changed:
+            break
+        prev_content = None
+
+    # queryset.update() skips post_save, so invalidate cached care notes here
+    bump_generation(entry.patient_id)
 
-@transaction.atomic
-def snapshot_and_update_entry(entry: Entry, new_content: str, actor):
-    # create snapshot before change
-    cur_ver = get_latest_version(entry)
+    new_ver = base + 1
     VersionSnapshot.objects.create(
         entry=entry,
-        version=cur_ver + 1,
-        content=new_content,
-        changed_by=actor,
+        version=new_ver,
+        changed_by_id=getattr(actor, "pk", None),
+        **encode_snapshot(new_ver, prev_content if base else None, new_content),
     )
     entry.content = new_content
-    entry.updated_at = timezone.now()
-    entry.save(update_fields=["content", "updated_at"])
+    entry.updated_at = now
+    entry.current_version = new_ver
+    publish_event(entry.patient_id, "entry.updated", entry_id=entry.id, entry_type=entry.type, version=new_ver)
+    # read-your-writes while the replica catches up
+    stick_to_primary(actor)
+    return new_ver
 
-    AuditLog.objects.create(
-        patient=entry.patient,
+
+@write_transaction
+def snapshot_and_update_entry(entry: Entry, new_content: str, actor, expected_version=None):
+    new_ver = _apply_new_version(entry, new_content, actor, expected_version)
+
+    record_audit(
+        patient_id=entry.patient_id,
         actor=actor,
         action="edit_entry",
-        meta={"entry_id": entry.id, "new_version": cur_ver + 1},
+        meta={"entry_id": entry.id, "new_version": new_ver},
     )
-    return cur_ver + 1
+    return new_ver
 
-@transaction.atomic
-def revert_entry_to_version(entry: Entry, target_version: int, actor):
-    snap = entry.versions.filter(version=target_version).first()
-    if not snap:
-        raise ValueError("version_not_found")
 
-    # create a new snapshot that records the revert result as latest version
-    cur_ver = get_latest_version(entry)
-    VersionSnapshot.objects.create(
-        entry=entry,
-        version=cur_ver + 1,
-        content=snap.content,
-        changed_by=actor,
-    )
-    entry.content = snap.content
-    entry.updated_at = timezone.now()
-    entry.save(update_fields=["content", "updated_at"])
+@write_transaction
+def revert_entry_to_version(entry: Entry, target_version: int, actor, expected_version=None):
+    # raises ValueError("version_not_found"); only the deltas since the nearest keyframe are applied
+    content = rebuild_version(entry, target_version)
+
+    # record the revert result as a new latest version
+    new_ver = _apply_new_version(entry, content, actor, expected_version)
 
-    AuditLog.objects.create(
-        patient=entry.patient,
+    record_audit(
+        patient_id=entry.patient_id,
         actor=actor,
         action="revert_entry",
-        meta={"entry_id": entry.id, "reverted_to": target_version, "new_version": cur_ver + 1},
+        meta={"entry_id": entry.id, "reverted_to": target_version, "new_version": new_ver},
     )
-    return cur_ver + 1
+    return new_ver
@@ -0,0 +1,206 @@
+"""
+Care note push events.
+
+Domain code calls publish_event(); after the transaction commits the event goes to
+the configured backend, which delivers it to the Broker of every process that
+has viewers of that patient. The Broker fans out to per-viewer asyncio queues
+read by the SSE view (views.care_note_events), filtered for the viewer's role.
+Events are small pointers ("entry 12 changed, now v3"); clients refetch the care
+note, which the ETag makes cheap.
+
+Settings:
+    CARE_NOTE_EVENTS_BACKEND     dotted path, default "notes.events.LocalBackend"
+    CARE_NOTE_EVENTS_QUEUE_SIZE  buffered events per viewer before it is told to resync
+    CARE_NOTE_EVENTS_HEARTBEAT   seconds between keep-alive comments (and access re-checks)
+    CARE_NOTE_EVENTS_MAX_AGE     seconds before a stream ends and the client reconnects (default 300)
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .rbac import PATIENT_VISIBLE_TYPES
+from .sharding import current_shard
+
+RESYNC = {"type": "resync"}
+
+
+def patient_visible(event: dict) -> bool:
+    # mirrors rbac: patients see patient-facing entries and accepted highlights only
+    kind = event["type"]
+    if kind in {"entry.created", "entry.updated", "summary.generated"}:
+        return event.get("entry_type") in PATIENT_VISIBLE_TYPES
+    if kind == "entries.ingested":
+        return bool(PATIENT_VISIBLE_TYPES.intersection(event.get("entry_types", ())))
+    if kind == "highlight.status":
+        return "accepted" in (event.get("from"), event.get("to"))
+    return kind == "resync"
+
+
+def visible_to(view: str, event: dict) -> bool:
+    return view != "patient" or patient_visible(event)
+
+
+class Subscription:
+    def __init__(self, broker: "Broker", patient_id: int, view: str, maxsize: int):
+        self.broker = broker
+        self.patient_id = patient_id
+        self.view = view
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, event: dict) -> None:
+        # called from any thread; the queue belongs to the viewer's event loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # slow viewer: drop the backlog and tell it to refetch instead of growing without bound
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process fan-out: patient id -> open viewers. Thread-safe."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subs = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, patient_id: int, view: str) -> Subscription:
+        sub = Subscription(self, patient_id, view, self.queue_size)
+        with self._lock:
+            self._subs[patient_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.patient_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.patient_id]
+
+    def viewer_count(self, patient_id: int = None) -> int:
+        with self._lock:
+            if patient_id is not None:
+                return len(self._subs.get(patient_id, ()))
+            return sum(len(s) for s in self._subs.values())
+
+    def deliver(self, patient_id: int, event: dict) -> None:
+        event = {"id": next(self._ids), **event}
+        with self._lock:
+            subs = list(self._subs.get(patient_id, ()))
+        for sub in subs:
+            if visible_to(sub.view, event):
+                sub.push(event)
+
+
+class LocalBackend:
+    """
+    Single-process delivery. A multi-process backend (e.g. Redis pub/sub) publishes
+    to a shared channel and calls deliver(patient_id, event) from its listener.
+    """
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, patient_id: int, event: dict) -> None:
+        self.deliver(patient_id, event)
+
+
+_lock = threading.Lock()
+_broker = None
+_backend = None
+
+
+def get_broker() -> Broker:
+    global _broker, _backend
+    with _lock:
+        if _broker is None:
+            _broker = Broker(getattr(settings, "CARE_NOTE_EVENTS_QUEUE_SIZE", 100))
+            backend_class = import_string(getattr(settings, "CARE_NOTE_EVENTS_BACKEND", "notes.events.LocalBackend"))
+            _backend = backend_class(_broker.deliver)
+        return _broker
+
+
+def publish_event(patient_id: int, type: str, **data) -> None:
+    """Push {type, patient_id, **data} to the patient's viewers once the transaction commits."""
+    event = {"type": type, "patient_id": patient_id, **data}
+
+    def send():
+        get_broker()
+        _backend.publish(patient_id, event)
+
+    transaction.on_commit(send, using=current_shard())
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event.get('id', 0)}\nevent: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+class EventStream:
+    """
+    Async iterator of SSE frames for one viewer. Subscribes on first read;
+    close() (called by the response when the stream ends) unsubscribes.
+
+    Django 4.2 does not notice a client that goes away mid-stream, so a stream
+    ends by itself after max_age seconds; live clients reconnect after the
+    `retry:` delay and are authorized again. authorized() (sync, optional) is
+    re-run every heartbeat, so a revoked or expired token ends the stream too.
+    """
+
+    def __init__(self, patient_id: int, view: str, heartbeat: float, max_age: float = 300.0, authorized=None):
+        self.patient_id = patient_id
+        self.view = view
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.authorized = authorized
+        self.sub = None
+        self.ends_at = self.checked_at = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        now = asyncio.get_running_loop().time()
+        if self.sub is None:
+            self.sub = get_broker().subscribe(self.patient_id, self.view)
+            self.ends_at, self.checked_at = now + self.max_age, now
+            return "retry: 3000\n\n"
+        if now >= self.ends_at:
+            return self._end()
+        if self.authorized is not None and now - self.checked_at >= self.heartbeat:
+            self.checked_at = now
+            if not await sync_to_async(self.authorized)():
+                return self._end()
+        try:
+            event = await self.sub.get(min(self.heartbeat, self.ends_at - now))
+        except asyncio.TimeoutError:
+            return ": keep-alive\n\n"
+        return format_sse(event)
+
+    def _end(self):
+        self.close()
+        raise StopAsyncIteration
+
+    def close(self) -> None:
+        if self.sub is not None:
+            self.sub.close()
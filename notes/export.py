@@ -0,0 +1,164 @@
+"""
+Streaming NDJSON export of one patient's record.
+
+One JSON object per line: a header, then entries, versions (full content, rebuilt
+from keyframes + deltas one entry at a time), highlights and audit events
+(archived ones included). Every
+section is read with .iterator(), and output is flushed in ~64 KiB pieces
+(optionally gzip-compressed piece by piece), so memory stays flat however long
+the history is. Under ASGI the chunks are handed to the server through
+pulled(), one at a time.
+"""
+import json
+import zlib
+from itertools import groupby, tee
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+
+from .audit_archive import iter_archived
+from .fast_serializers import ENTRY_FIELDS, HIGHLIGHT_FIELDS, compile_row_mapper
+from .models import AuditLog, Patient, VersionSnapshot
+from .rbac import filter_highlights_queryset, filter_patient_queryset
+from .sharding import shard_for_patient, use_shard
+from .versioning import rebuild_sequence
+
+EXPORT_FORMAT = 1
+ITERATOR_CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+VERSION_FIELDS = [
+    ("entry_id", "entry_id", None),
+    ("version", "version", None),
+    ("content", "content", None),
+    ("created_at", "created_at", "datetime"),
+    ("changed_by", "changed_by_id", None),
+]
+
+AUDIT_FIELDS = [
+    ("id", "id", None),
+    ("actor", "actor_id", None),
+    ("action", "action", None),
+    ("meta", "meta", None),
+    ("created_at", "created_at", "datetime"),
+    ("event_id", "event_id", "str"),
+]
+
+
+def _line(kind: str, data: dict) -> str:
+    return json.dumps({"kind": kind, **data}, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def _rows(qs, fields):
+    return qs.values_list(*[col for _, col, _ in fields]).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def _version_lines(entries_qs):
+    to_dict = compile_row_mapper(VERSION_FIELDS)
+    qs = VersionSnapshot.objects.filter(entry__in=entries_qs.order_by().values("id")).order_by("entry_id", "version")
+    rows = qs.values_list(
+        "entry_id", "version", "is_keyframe", "content", "delta", "created_at", "changed_by_id"
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    # rows arrive grouped by entry; only the current entry's text is held in memory
+    for entry_id, group in groupby(rows, key=itemgetter(0)):
+        codec_rows, stamp_rows = tee(group)
+        rebuilt = rebuild_sequence(r[1:5] for r in codec_rows)
+        for (version, text), row in zip(rebuilt, stamp_rows):
+            yield _line("version", to_dict((entry_id, version, text, row[5], row[6])))
+
+
+def _on_shard(lines, alias: str, clinic_id: str):
+    # the body streams after the request context is gone: run each step on the patient's shard
+    # (set and reset within one next(), so no context leaks between chunks)
+    while True:
+        with use_shard(alias, clinic_id):
+            line = next(lines, None)
+        if line is None:
+            return
+        yield line
+
+
+def export_lines(user, patient: Patient):
+    """Yields NDJSON lines; raises PermissionError (before any output) like filter_patient_queryset."""
+    entries_qs = filter_patient_queryset(user, patient)
+    highlights_qs = filter_highlights_queryset(user, patient)
+    # the audit trail is staff-facing, like everything outside PATIENT_VISIBLE_TYPES
+    with_audit = user.role != "patient"
+
+    def generate():
+        yield _line("header", {
+            "format": EXPORT_FORMAT,
+            "patient_id": patient.id,
+            "patient_display_name": patient.display_name,
+            "clinic_id": patient.clinic_id,
+            "exported_at": timezone.now().isoformat(),
+        })
+        to_dict = compile_row_mapper(ENTRY_FIELDS)
+        for row in _rows(entries_qs.order_by("created_at", "id"), ENTRY_FIELDS):
+            yield _line("entry", to_dict(row))
+        yield from _version_lines(entries_qs)
+        to_dict = compile_row_mapper(HIGHLIGHT_FIELDS)
+        for row in _rows(highlights_qs.order_by("created_at", "id"), HIGHLIGHT_FIELDS):
+            yield _line("highlight", to_dict(row))
+        if with_audit:
+            to_dict = compile_row_mapper(AUDIT_FIELDS)
+            # archived events (notes/audit_archive.py) are older than the ones still in the table
+            last = None
+            for event in iter_archived(patient.id):
+                last = event
+                yield _line("audit", to_dict(tuple(event[col] for _, col, _ in AUDIT_FIELDS)))
+            table = AuditLog.objects.filter(patient=patient)
+            if last is not None:
+                # a run that crashed before deleting leaves archived rows in the table too;
+                # the archive is written oldest first, so they are the ones up to its last key
+                table = table.filter(
+                    Q(created_at__gt=last["created_at"]) | Q(created_at=last["created_at"], id__gt=last["id"])
+                )
+            for row in _rows(table.order_by("created_at", "id"), AUDIT_FIELDS):
+                yield _line("audit", to_dict(row))
+
+    return _on_shard(generate(), shard_for_patient(patient), patient.clinic_id)
+
+
+def buffered(lines, flush_bytes: int = FLUSH_BYTES):
+    """Joins lines into ~flush_bytes pieces of UTF-8 so the server does not write per row."""
+    buf, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buf.append(data)
+        size += len(data)
+        if size >= flush_bytes:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def gzipped(chunks):
+    # one gzip member compressed incrementally; each piece is sync-flushed so clients can decode as it arrives
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+async def pulled(chunks):
+    """
+    Async iterator over a chunk generator, for ASGI servers: Django 4.2 would list() a sync
+    iterator in full before sending a byte. Each chunk is pulled in the request's sync thread,
+    where its database connection lives.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # client gone or stream done: close the generator (and its cursors) on the same thread
+        await sync_to_async(chunks.close, thread_sensitive=True)()
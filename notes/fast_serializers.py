@@ -0,0 +1,109 @@
+"""
+Read-only fast path for timeline payloads.
+
+Builds the same dicts as EntrySerializer / HighlightSerializer straight from
+.values_list() tuples with per-field converters compiled once per call, instead
+of instantiating model objects and running DRF field introspection per row.
+Output is identical to the DRF serializers (see tests/test_fast_serialization.py).
+"""
+import datetime
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.settings import ISO_8601, api_settings
+
+# (output key, ORM column, converter kind)
+ENTRY_FIELDS = [
+    ("id", "id", None),
+    ("patient", "patient_id", None),
+    ("author", "author_id", None),
+    ("author_role", "author_role", None),
+    ("type", "type", None),
+    ("created_at", "created_at", "datetime"),
+    ("updated_at", "updated_at", "datetime"),
+    ("provenance_pointer", "provenance_pointer", None),
+    ("content", "content", None),
+]
+
+HIGHLIGHT_FIELDS = [
+    ("id", "id", None),
+    ("text", "text", None),
+    ("risk_reason", "risk_reason", None),
+    ("status", "status", None),
+    ("stale", "stale", None),
+    ("entry_id", "entry_id", None),
+    ("span_start", "span_start", None),
+    ("span_end", "span_end", None),
+    ("created_at", "created_at", "datetime"),
+]
+
+# staff timeline rows: entry fields + comment counts annotated by notes.comments.with_comment_counts
+TIMELINE_FIELDS = ENTRY_FIELDS + [
+    ("open_threads", "open_threads", None),
+    ("comment_count", "comment_count", None),
+]
+
+ENTRY_COLUMNS = [col for _, col, _ in ENTRY_FIELDS]
+TIMELINE_COLUMNS = [col for _, col, _ in TIMELINE_FIELDS]
+HIGHLIGHT_COLUMNS = [col for _, col, _ in HIGHLIGHT_FIELDS]
+
+# keyset pagination key for ENTRY_COLUMNS / TIMELINE_COLUMNS rows: (created_at, id)
+entry_row_key = itemgetter(ENTRY_COLUMNS.index("created_at"), ENTRY_COLUMNS.index("id"))
+
+
+def _datetime_converter():
+    # mirrors rest_framework.fields.DateTimeField.to_representation/enforce_timezone
+    output_format = api_settings.DATETIME_FORMAT
+    if output_format is None:
+        return None
+    tz = timezone.get_current_timezone() if settings.USE_TZ else None
+    iso = output_format.lower() == ISO_8601
+
+    def convert(value):
+        if not value:
+            return None
+        if isinstance(value, str):
+            return value
+        if tz is not None:
+            value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+        elif timezone.is_aware(value):
+            value = timezone.make_naive(value, datetime.timezone.utc)
+        if not iso:
+            return value.strftime(output_format)
+        out = value.isoformat()
+        if out.endswith("+00:00"):
+            out = out[:-6] + "Z"
+        return out
+
+    return convert
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def compile_row_mapper(fields):
+    """row tuple (in column order) -> output dict; converters resolved once, not per row."""
+    keys = [key for key, _, _ in fields]
+    converters = {"datetime": _datetime_converter(), "str": _str_or_none}
+    plan = [(i, converters[kind]) for i, (_, _, kind) in enumerate(fields) if kind and converters[kind]]
+
+    def to_dict(row):
+        if plan:
+            row = list(row)
+            for i, convert in plan:
+                row[i] = convert(row[i])
+        return dict(zip(keys, row))
+
+    return to_dict
+
+
+def serialize_entry_rows(rows, fields=ENTRY_FIELDS):
+    to_dict = compile_row_mapper(fields)
+    return [to_dict(row) for row in rows]
+
+
+def serialize_highlights(qs):
+    to_dict = compile_row_mapper(HIGHLIGHT_FIELDS)
+    return [to_dict(row) for row in qs.values_list(*HIGHLIGHT_COLUMNS)]
@@ -1,6 +1,15 @@
-from typing import List
-from .models import Patient, Entry, Highlight, AuditLog
+from itertools import islice
+from typing import Iterable, List, Optional, Sequence, Tuple
+from django.db import connections, router
+from django.db.models import Q
+from .models import Patient, Entry, Highlight, HighlightWatermark
+from .audit import record_audit
+from .caching import bump_generation, coalesce_generation_bumps
+from .events import publish_event
+from .matching import Match, get_highlight_matcher
+from .sqlite import write_transaction
 
+# default dictionary; override with settings.HIGHLIGHT_RULES / HIGHLIGHT_RULES_FILE
 RISK_KEYWORDS = [
     ("allergy", "Possible allergy mentioned"),
     ("chest pain", "Potential cardiac symptom"),
@@ -9,48 +18,169 @@ RISK_KEYWORDS = [
     ("suicidal", "Self-harm risk signal"),
 ]
 
-def generate_rule_based_highlights(patient: Patient, actor) -> List[Highlight]:
-    entries = (
-    Entry.objects
-    .filter(patient=patient)
-    .exclude(type__startswith="ai_")   # 关键：排除 AI entries
-    .order_by("-created_at")[:20]
-)
-
-    created = []
-    MAX = 1
-
-    for e in entries:
-        if len(created) >= MAX:
-            break
-        text_lower = (e.content or "").lower()
-        for kw, reason in RISK_KEYWORDS:
-            if kw in text_lower:
-                h = Highlight.objects.create(
-                    patient=patient,
-                    created_by=actor,
-                    text=f"{kw}: {e.content[:120]}",
-                    risk_reason=reason,
-                    entry=e,
-                    span_start=0,
-                    span_end=min(len(e.content), 120),
-                    status="suggested",
-                )
-                created.append(h)
-                break
-
-    AuditLog.objects.create(
-        patient=patient,
-        actor=actor,
-        action="generate_highlights_rule",
-        meta={"created": len(created)},
+SNIPPET_BEFORE = 40
+SNIPPET_LEN = 120
+
+
+def highlight_snippet(content: str, start: int, end: int) -> str:
+    lo = max(0, start - SNIPPET_BEFORE)
+    return content[lo:max(lo + SNIPPET_LEN, end)]
+
+
+def build_entry_highlights(entry: Entry, patient_id: int, actor, matches: Iterable[Match]) -> List[Highlight]:
+    content = entry.content or ""
+    return [
+        Highlight(
+            patient_id=patient_id,
+            created_by_id=getattr(actor, "pk", None),
+            text=f"{m.term}: {highlight_snippet(content, m.start, m.end)}"[:256],
+            risk_reason=m.reason,
+            entry=entry,
+            span_start=m.start,
+            span_end=m.end,
+            status="suggested",
+        )
+        for m in matches
+    ]
+
+
+def _rebase_reviewed(reviewed: List[Highlight], fresh: List[Highlight]) -> List[Highlight]:
+    # keep clinician decisions on an edited entry: move each reviewed highlight
+    # onto the nearest new match with the same reason instead of re-suggesting it;
+    # one whose term is gone keeps its decision but is marked stale
+    for h in reviewed:
+        same = [n for n in fresh if n.risk_reason == h.risk_reason]
+        if not same:
+            if not h.stale:
+                h.stale = True
+                h.save(update_fields=["stale"])
+            continue
+        best = min(same, key=lambda n: abs(n.span_start - h.span_start))
+        fresh.remove(best)
+        if (h.span_start, h.span_end, h.text, h.stale) != (best.span_start, best.span_end, best.text, False):
+            h.span_start, h.span_end, h.text, h.stale = best.span_start, best.span_end, best.text, False
+            h.save(update_fields=["span_start", "span_end", "text", "stale"])
+    return fresh
+
+
+def changed_entries_queryset(patient: Patient, watermark: HighlightWatermark):
+    # non-AI entries created/edited after the watermark, in watermark order
+    qs = (
+        Entry.objects
+        .filter(patient=patient)
+        .exclude(type__startswith="ai_")   # 关键：排除 AI entries
+        .only("id", "patient_id", "content", "updated_at")
+        .order_by("updated_at", "id")
     )
-    return created
+    if watermark.last_updated_at is not None:
+        qs = qs.filter(
+            Q(updated_at__gt=watermark.last_updated_at)
+            | Q(updated_at=watermark.last_updated_at, id__gt=watermark.last_entry_id)
+        )
+    return qs
+
+
+DELETE_CHUNK = 500  # entry ids per DELETE, under SQLite's 999 parameters
+
 
-    AuditLog.objects.create(
-        patient=patient,
+def delete_highlights(patient_id: int, entry_ids: Optional[Sequence[int]] = None,
+                      status: Optional[str] = None) -> int:
+    """
+    Delete a patient's highlights (only on entry_ids / with status, if given) with
+    plain DELETE statements. QuerySet.delete() would SELECT the rows, delete them in
+    100-id batches and send post_delete per row; highlights have no dependents and
+    callers bump the generation. Returns the number of rows deleted.
+    """
+    conn = connections[router.db_for_write(Highlight)]
+    where, params = ["patient_id = %s"], [patient_id]
+    if status is not None:
+        where.append("status = %s")
+        params.append(status)
+    sql = f"DELETE FROM {conn.ops.quote_name(Highlight._meta.db_table)} WHERE {' AND '.join(where)}"
+    if entry_ids is None:
+        chunks = [(sql, params)]
+    else:
+        chunks = [
+            (f"{sql} AND entry_id IN ({', '.join(['%s'] * len(ids))})", params + list(ids))
+            for ids in chunked(entry_ids, DELETE_CHUNK)
+        ]
+    deleted = 0
+    with conn.cursor() as cur:
+        for chunk_sql, chunk_params in chunks:
+            cur.execute(chunk_sql, chunk_params)
+            deleted += cur.rowcount
+    return deleted
+
+
+@coalesce_generation_bumps()
+def write_matched_chunk(patient_id: int, actor, chunk: Sequence[Tuple[Entry, List[Match]]],
+                        batch_size: int = 500) -> List[Highlight]:
+    """Replace suggestions for one chunk of (entry, matches) pairs; reviewed highlights are rebased."""
+    ids = [e.id for e, _ in chunk]
+    reviewed = {}
+    for h in Highlight.objects.filter(entry_id__in=ids).exclude(status="suggested"):
+        reviewed.setdefault(h.entry_id, []).append(h)
+    if delete_highlights(patient_id, entry_ids=ids, status="suggested"):
+        bump_generation(patient_id)
+
+    pending = []
+    for e, matches in chunk:
+        fresh = build_entry_highlights(e, patient_id, actor, matches)
+        pending.extend(_rebase_reviewed(reviewed.get(e.id, []), fresh))
+    return Highlight.objects.bulk_create(pending, batch_size=batch_size)
+
+
+def finish_patient_run(patient_id: int, actor, watermark: HighlightWatermark, last_entry,
+                       created: int, scanned: int, mode: str) -> None:
+    if last_entry is not None:
+        watermark.last_updated_at = last_entry.updated_at
+        watermark.last_entry_id = last_entry.id
+        watermark.save(update_fields=["last_updated_at", "last_entry_id", "updated_at"])
+    if created:
+        # bulk_create skips post_save
+        bump_generation(patient_id)
+        publish_event(patient_id, "highlights.generated", created=created)
+
+    record_audit(
+        patient_id=patient_id,
         actor=actor,
-        action="generate_highlights",
-        meta={"created": len(created)},
+        action="generate_highlights_rule",
+        meta={"created": created, "scanned": scanned, "mode": mode},
     )
+
+
+def chunked(iterable, size: int):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@write_transaction
+@coalesce_generation_bumps()
+def generate_rule_based_highlights(patient: Patient, actor, incremental: bool = True,
+                                   chunk_size: int = 500) -> List[Highlight]:
+    """
+    incremental: only rescan non-AI entries created/edited after the patient's
+    HighlightWatermark; highlights on untouched entries (and review status) are kept.
+    full: drop every highlight and rescan the whole timeline.
+    """
+    matcher = get_highlight_matcher(RISK_KEYWORDS)
+    watermark, _ = HighlightWatermark.objects.select_for_update().get_or_create(patient=patient)
+    if not incremental:
+        if delete_highlights(patient.id):
+            bump_generation(patient.id)
+        watermark.last_updated_at, watermark.last_entry_id = None, 0
+
+    created, last, scanned = [], None, 0
+    entries = changed_entries_queryset(patient, watermark).iterator(chunk_size=chunk_size)
+    for chunk in chunked(entries, chunk_size):
+        pairs = [(e, list(matcher.find_all(e.content or ""))) for e in chunk]
+        created.extend(write_matched_chunk(patient.id, actor, pairs, batch_size=chunk_size))
+        last, scanned = chunk[-1], scanned + len(chunk)
+
+    finish_patient_run(patient.id, actor, watermark, last, len(created), scanned,
+                       "incremental" if incremental else "full")
     return created
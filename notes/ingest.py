@@ -0,0 +1,200 @@
+"""
+Bulk NDJSON entry ingestion for upstream feeds (EHR exports, devices).
+
+One entry per line:
+    {"patient_id": 1, "type": "clinician_note", "author_role": "clinician",
+     "provenance_pointer": "ehr:note:123", "content": "...",
+     "created_at": "2024-01-01T09:00:00Z", "author_id": 5}    # last two optional
+
+Lines are validated without touching the database, then inserted per chunk with
+bulk_create, one transaction per clinic shard the chunk touches.
+(patient, provenance_pointer) is unique, so a retried batch only
+reports duplicates; bad lines are reported with their line number and never
+abort the rest of the batch.
+"""
+import datetime
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .audit import record_audit
+from .caching import bump_generation
+from .events import publish_event
+from .highlights import chunked
+from .models import Entry, Patient
+from .sharding import shard_for_clinic, use_shard
+
+ENTRY_TYPES = {value for value, _ in Entry.TYPE_CHOICES}
+AUTHOR_ROLES = {value for value, _ in Entry.ROLE_CHOICES}
+REQUIRED = ("patient_id", "type", "author_role", "provenance_pointer", "content")
+OPTIONAL = ("created_at", "author_id")
+POINTER_MAX = Entry._meta.get_field("provenance_pointer").max_length
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class IngestReport:
+    received: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "errors_truncated": self.failed > len(self.errors)}
+
+
+def _int(row: dict, key: str, required: bool = True) -> Optional[int]:
+    value = row.get(key)
+    if value is None and not required:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RowError(f"{key} must be an integer")
+    return value
+
+
+def validate_row(raw) -> dict:
+    """One NDJSON line -> Entry field values. Pure: no queries; raises RowError."""
+    try:
+        row = json.loads(raw)
+    except ValueError:
+        raise RowError("invalid JSON")
+    if not isinstance(row, dict):
+        raise RowError("line must be a JSON object")
+    missing = [k for k in REQUIRED if k not in row]
+    if missing:
+        raise RowError(f"missing field(s): {', '.join(missing)}")
+    unknown = sorted(set(row) - set(REQUIRED) - set(OPTIONAL))
+    if unknown:
+        raise RowError(f"unknown field(s): {', '.join(unknown)}")
+
+    if row["type"] not in ENTRY_TYPES:
+        raise RowError(f"type must be one of {sorted(ENTRY_TYPES)}")
+    if row["author_role"] not in AUTHOR_ROLES:
+        raise RowError(f"author_role must be one of {sorted(AUTHOR_ROLES)}")
+    pointer = row["provenance_pointer"]
+    if not isinstance(pointer, str) or not pointer.strip() or len(pointer) > POINTER_MAX:
+        raise RowError(f"provenance_pointer must be a non-empty string of at most {POINTER_MAX} chars")
+    if not isinstance(row["content"], str):
+        raise RowError("content must be a string")
+
+    values = {
+        "patient_id": _int(row, "patient_id"),
+        "author_id": _int(row, "author_id", required=False),
+        "type": row["type"],
+        "author_role": row["author_role"],
+        "provenance_pointer": pointer,
+        "content": row["content"],
+    }
+    if row.get("created_at") is not None:
+        created_at = parse_datetime(row["created_at"]) if isinstance(row["created_at"], str) else None
+        if created_at is None:
+            raise RowError("created_at must be an ISO 8601 datetime")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, datetime.timezone.utc)
+        values["created_at"] = created_at
+    return values
+
+
+def _check_references(rows, clinic_id: Optional[str]):
+    """-> ([(line_no, row, problem or None)], {patient_id: clinic_id}); one query each for patients and authors."""
+    patients = dict(
+        Patient.objects.filter(id__in={r["patient_id"] for _, r in rows}).values_list("id", "clinic_id")
+    )
+    author_ids = {r["author_id"] for _, r in rows if r["author_id"] is not None}
+    authors = set(get_user_model().objects.filter(id__in=author_ids).values_list("id", flat=True)) if author_ids else set()
+    checked = []
+    for line_no, r in rows:
+        if r["patient_id"] not in patients:
+            problem = "unknown patient_id"
+        elif clinic_id is not None and patients[r["patient_id"]] != clinic_id:
+            problem = "patient belongs to another clinic"
+        elif r["author_id"] is not None and r["author_id"] not in authors:
+            problem = "unknown author_id"
+        else:
+            problem = None
+        checked.append((line_no, r, problem))
+    return checked, patients
+
+
+def _ingest_chunk(rows, report: IngestReport, actor, clinic_id: Optional[str]) -> None:
+    checked, patients = _check_references(rows, clinic_id)
+    by_shard = {}
+    for line_no, r, problem in checked:
+        if problem:
+            report.error(line_no, problem)
+        else:
+            by_shard.setdefault(shard_for_clinic(patients[r["patient_id"]]), []).append(r)
+    for alias, valid in by_shard.items():
+        with use_shard(alias):
+            _insert_valid(valid, report, actor, alias)
+
+
+def _insert_valid(valid, report: IngestReport, actor, alias: str) -> None:
+    keys = {(r["patient_id"], r["provenance_pointer"]) for r in valid}
+    existing = set(
+        Entry.objects.filter(
+            patient_id__in={p for p, _ in keys}, provenance_pointer__in={ptr for _, ptr in keys}
+        ).values_list("patient_id", "provenance_pointer")
+    )
+    fresh, seen = [], set()
+    for r in valid:
+        key = (r["patient_id"], r["provenance_pointer"])
+        if key in existing or key in seen:
+            report.duplicates += 1
+            continue
+        seen.add(key)
+        fresh.append(Entry(**r))
+    if not fresh:
+        return
+
+    with transaction.atomic(using=alias):
+        # ignore_conflicts: a concurrent retry of the same feed may have inserted some rows
+        # meanwhile; those are then counted as created by both requests
+        Entry.objects.bulk_create(fresh, ignore_conflicts=True)
+        per_patient = {}
+        for e in fresh:
+            per_patient.setdefault(e.patient_id, []).append(e.type)
+        for patient_id, types in per_patient.items():
+            # bulk_create skips post_save
+            bump_generation(patient_id)
+            record_audit(patient_id=patient_id, actor=actor, action="ingest_entries", meta={"created": len(types)})
+            publish_event(patient_id, "entries.ingested", count=len(types), entry_types=sorted(set(types)))
+    report.created += len(fresh)
+
+
+def ingest_lines(lines: Iterable, actor=None, clinic_id: Optional[str] = None,
+                 chunk_size: int = 500) -> IngestReport:
+    """
+    lines: NDJSON lines (str or bytes), consumed lazily.
+    clinic_id: if set, rows for patients of other clinics are rejected.
+    """
+    report = IngestReport()
+
+    def parsed():
+        for line_no, raw in enumerate(lines, 1):
+            if not raw.strip():
+                continue
+            report.received += 1
+            try:
+                yield line_no, validate_row(raw)
+            except RowError as e:
+                report.error(line_no, str(e))
+
+    for chunk in chunked(parsed(), chunk_size):
+        _ingest_chunk(chunk, report, actor, clinic_id)
+    return report
@@ -0,0 +1,20 @@
+"""
+Entry point for `run_jobs --mode process` workers.
+
+Spawned children start with a fresh interpreter, so this module must not import
+models at load time: Django is set up first, then the worker loop is imported.
+"""
+import os
+
+
+def process_main(worker_id: str, once: bool, poll_interval: float) -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    import django
+
+    django.setup()
+    from notes.jobs import work
+
+    try:
+        work(worker_id, once=once, poll_interval=poll_interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,148 @@
+"""
+Database-backed background jobs.
+
+enqueue() inserts a queued BackgroundJob. A partial unique index allows one
+queued/running job per dedup_key, so a request for work that is already in
+flight joins that job instead of starting a second one. Workers
+(`manage.py run_jobs`) claim jobs with a compare-and-swap update, run the
+handler registered for the job's kind and record progress and the result on
+the row, which GET /api/jobs/{id}/ reports.
+
+Handlers are called as handler(job, progress) and return a JSON-able result;
+progress(percent, note) also renews the job's lease.
+
+Settings:
+    JOB_LEASE_SECONDS  a running job not touched for this long is assumed to
+                       belong to a dead worker and is requeued
+    JOB_MAX_ATTEMPTS   failed or abandoned jobs are retried until this many attempts
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    "patient_summary": "notes.summaries.run_patient_summary_job",
+}
+
+
+def summary_dedup_key(patient_id: int) -> str:
+    return f"patient_summary:{patient_id}"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _max_attempts() -> int:
+    return getattr(settings, "JOB_MAX_ATTEMPTS", 3)
+
+
+def enqueue(kind: str, dedup_key: str, patient=None, requested_by_id: Optional[int] = None,
+            payload: Optional[dict] = None) -> Tuple[BackgroundJob, bool]:
+    """Returns (job, created); created is False when an active job with the same dedup_key was joined."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"unknown job kind {kind!r}")
+    active = BackgroundJob.objects.filter(dedup_key=dedup_key, status__in=BackgroundJob.ACTIVE_STATUSES)
+    for _ in range(3):
+        job = active.first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = BackgroundJob.objects.create(
+                    kind=kind, dedup_key=dedup_key, patient=patient,
+                    requested_by_id=requested_by_id, payload=payload or {},
+                )
+            return job, True
+        except IntegrityError:
+            # a concurrent request inserted it first; join that one
+            continue
+    raise RuntimeError(f"could not enqueue job {dedup_key!r}")
+
+
+def requeue_stale() -> int:
+    """Hand jobs of workers that stopped renewing their lease back to the queue (or fail them)."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "JOB_LEASE_SECONDS", 300))
+    stale = BackgroundJob.objects.filter(status="running", updated_at__lt=cutoff)
+    now = timezone.now()
+    failed = stale.filter(attempts__gte=_max_attempts()).update(
+        status="failed", error="worker lease expired", locked_by="", updated_at=now, finished_at=now,
+    )
+    return failed + stale.update(status="queued", locked_by="", updated_at=now)
+
+
+def claim_next(worker_id: str) -> Optional[BackgroundJob]:
+    requeue_stale()
+    queued = BackgroundJob.objects.filter(status="queued")
+    while True:
+        job_id = queued.order_by("id").values_list("id", flat=True).first()
+        if job_id is None:
+            return None
+        # compare-and-swap: only one worker moves the row out of "queued"
+        claimed = queued.filter(id=job_id).update(
+            status="running", locked_by=worker_id, attempts=F("attempts") + 1, updated_at=timezone.now(),
+        )
+        if claimed:
+            return BackgroundJob.objects.select_related("patient", "requested_by").get(id=job_id)
+
+
+def run_job(job: BackgroundJob) -> BackgroundJob:
+    # every write is conditional on still holding the job, so a worker whose lease
+    # expired cannot overwrite the outcome of the worker that took over
+    mine = BackgroundJob.objects.filter(id=job.id, status="running", locked_by=job.locked_by)
+
+    def progress(percent: int, note: str = "") -> None:
+        mine.update(progress=max(0, min(int(percent), 100)), progress_note=note[:128], updated_at=timezone.now())
+
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        result = handler(job, progress)
+    except Exception as exc:
+        logger.exception("job %s (%s) failed, attempt %s", job.id, job.kind, job.attempts)
+        now = timezone.now()
+        if job.kind in JOB_HANDLERS and job.attempts < _max_attempts():
+            mine.update(status="queued", error=repr(exc), locked_by="", updated_at=now)
+        else:
+            mine.update(status="failed", error=repr(exc), locked_by="", updated_at=now, finished_at=now)
+    else:
+        now = timezone.now()
+        mine.update(
+            status="succeeded", progress=100, progress_note="", result=result, error="",
+            updated_at=now, finished_at=now,
+        )
+    job.refresh_from_db()
+    return job
+
+
+def work(worker_id: Optional[str] = None, once: bool = False, poll_interval: float = 1.0,
+         stop: Optional[threading.Event] = None) -> int:
+    """
+    Worker loop: claim and run jobs until stop is set. With once=True, return as
+    soon as the queue is empty. Returns the number of jobs run.
+    """
+    worker_id = worker_id or default_worker_id()
+    stop = stop or threading.Event()
+    done = 0
+    while not stop.is_set():
+        job = claim_next(worker_id)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        done += 1
+    return done
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.audit_archive import archive_audit_log, archive_dir, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = "Move AuditLog rows older than AUDIT_RETENTION_DAYS into compressed archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, help="override AUDIT_RETENTION_DAYS")
+
+    def handle(self, *args, **opts):
+        days = opts["older_than_days"]
+        cutoff = timezone.now() - timedelta(days=days) if days is not None else retention_cutoff()
+        if cutoff is None:
+            self.stdout.write("AUDIT_RETENTION_DAYS is None: nothing to archive")
+            return
+        stats = archive_audit_log(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            f"archived {stats['rows']} audit rows older than {cutoff:%Y-%m-%d %H:%M} into "
+            f"{stats['segments']} segments in {archive_dir()}; pruned {stats['pruned']} expired segments"
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from notes.audit import get_spool
+
+
+class Command(BaseCommand):
+    help = "Insert every spooled audit event (including segments left behind by crashed processes)."
+
+    def handle(self, *args, **opts):
+        spool = get_spool(start_flusher=False)
+        flushed = spool.drain()
+        self.stdout.write(self.style.SUCCESS(f"flushed {flushed} audit events from {spool.directory}"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.batch import RunInProgress, execute_run, start_run
+
+
+class Command(BaseCommand):
+    help = "Run rule-based highlight generation for every patient in a clinic (incremental, resumable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("clinic_id")
+        parser.add_argument("--workers", type=int, default=0, help="matcher processes (0 = match inline)")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="entries fetched/matched per chunk")
+        parser.add_argument("--batch-size", type=int, default=500, help="highlights per bulk_create")
+        parser.add_argument("--resume", action="store_true", help="continue the clinic's last unfinished run")
+
+    def handle(self, *args, **opts):
+        try:
+            run = start_run(opts["clinic_id"], resume=opts["resume"])
+        except RunInProgress as exc:
+            raise CommandError(str(exc))
+        if run.last_patient_id:
+            self.stdout.write(f"resuming run {run.id} after patient {run.last_patient_id}")
+
+        def progress(r):
+            self.stdout.write(
+                f"patient {r.last_patient_id}: {r.patients_done} patients, "
+                f"{r.entries_scanned} entries, {r.highlights_created} highlights, "
+                f"{r.entries_per_second:.0f} entries/s"
+            )
+
+        run = execute_run(
+            run,
+            workers=opts["workers"],
+            chunk_size=opts["chunk_size"],
+            batch_size=opts["batch_size"],
+            progress=progress if opts["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"run {run.id} {run.status}: {run.patients_done} patients, {run.entries_scanned} entries, "
+            f"{run.highlights_created} highlights in {run.elapsed_seconds:.2f}s "
+            f"({run.entries_per_second:.0f} entries/s)"
+        ))
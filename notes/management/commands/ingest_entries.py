@@ -0,0 +1,36 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.ingest import ingest_lines
+
+
+class Command(BaseCommand):
+    help = "Bulk-ingest entries from an NDJSON file (.gz ok, '-' for stdin); re-running a file is idempotent."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--clinic", default=None, help="reject rows for patients outside this clinic")
+        parser.add_argument("--chunk-size", type=int, default=500, help="lines validated/inserted per bulk_create")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        try:
+            if path == "-":
+                fh = sys.stdin.buffer
+            elif path.endswith(".gz"):
+                fh = gzip.open(path, "rb")
+            else:
+                fh = open(path, "rb")
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with fh:
+            report = ingest_lines(fh, clinic_id=opts["clinic"], chunk_size=opts["chunk_size"])
+
+        for err in report.errors:
+            self.stderr.write(f"line {err['line']}: {err['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.received} lines: {report.created} created, {report.duplicates} duplicates, {report.failed} failed"
+        ))
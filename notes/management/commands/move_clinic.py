@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.sharding import move_clinic, shard_for_clinic
+
+
+class Command(BaseCommand):
+    help = "Move a clinic's entries, versions, highlights, comments and audit rows to another shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("clinic_id")
+        parser.add_argument("target", help="database alias listed in SHARD_DATABASES")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--settle", type=float, default=None,
+            help="seconds to wait after refusing the clinic's writes (default SHARD_MAP_CACHE_SECONDS)",
+        )
+
+    def handle(self, *args, **opts):
+        source = shard_for_clinic(opts["clinic_id"])
+        try:
+            counts = move_clinic(
+                opts["clinic_id"], opts["target"], batch_size=opts["batch_size"], settle=opts["settle"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not counts:
+            self.stdout.write(f"{opts['clinic_id']} is already on {opts['target']}")
+            return
+        moved = ", ".join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"moved {opts['clinic_id']} from {source} to {opts['target']}: {moved}"))
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from notes.job_worker import process_main
+from notes.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (patient summaries, ...) with a pool of worker threads or processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="number of concurrent workers")
+        parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+        parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between polls of an empty queue")
+
+    def handle(self, *args, **opts):
+        if opts["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        names = [f"{prefix}:{opts['mode'][0]}{i}" for i in range(opts["workers"])]
+
+        if opts["mode"] == "process":
+            # spawn: children never inherit the parent's database connection
+            ctx = multiprocessing.get_context("spawn")
+            workers = [
+                ctx.Process(target=process_main, args=(name, opts["once"], opts["poll_interval"]), daemon=True)
+                for name in names
+            ]
+            for p in workers:
+                p.start()
+            try:
+                for p in workers:
+                    p.join()
+            except KeyboardInterrupt:
+                for p in workers:
+                    p.join()
+            self.stdout.write(self.style.SUCCESS(f"{len(workers)} worker processes stopped"))
+            return
+
+        stop = threading.Event()
+        counts = {}
+
+        def run(name):
+            try:
+                counts[name] = work(name, once=opts["once"], poll_interval=opts["poll_interval"], stop=stop)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(name,), name=name) for name in names]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                t.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for t in threads:
+                t.join()
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} jobs run by {len(threads)} worker threads"))
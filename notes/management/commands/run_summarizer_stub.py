@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from notes.summarizer_stub import StubSummarizerServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local stub summarization service for SUMMARIZER_BACKEND = notes.summarizers.HTTPSummarizer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--delay", type=float, default=0.0, help="seconds to sleep per request")
+        parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with (e.g. 503)")
+
+    def handle(self, *args, **opts):
+        stub = StubSummarizerServer(
+            opts["host"], opts["port"], delay=opts["delay"], status=opts["status"], verbose=opts["verbosity"] > 1,
+        )
+        self.stdout.write(f"stub summarizer listening on {stub.url}")
+        try:
+            stub.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.httpd.server_close()
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.replicas import replica_alias, replicate
+
+
+class Command(BaseCommand):
+    help = "Copy the primary database onto the replica every --lag seconds (local stand-in for replication)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lag", type=float, default=2.0, help="seconds between copies")
+        parser.add_argument("--once", action="store_true", help="copy once and exit")
+
+    def handle(self, *args, **opts):
+        target = replica_alias()
+        if target is None:
+            raise CommandError("no replica configured; set NIGHTINGALE_REPLICA_DB to a second SQLite file")
+        if opts["once"]:
+            replicate(target=target)
+            self.stdout.write(self.style.SUCCESS(f"copied the primary onto {target}"))
+            return
+        self.stdout.write(f"copying the primary onto {target} every {opts['lag']}s")
+        try:
+            while True:
+                replicate(target=target)
+                time.sleep(opts["lag"])
+        except KeyboardInterrupt:
+            pass
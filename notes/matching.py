@@ -0,0 +1,137 @@
+import json
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+from django.conf import settings
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    term: str
+    reason: str
+
+
+def _fold(text: str) -> str:
+    # case-insensitive matching must keep offsets aligned with the original text
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower()[:1] for c in text)
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a (term, reason) dictionary.
+    One left-to-right pass per text finds every occurrence of every term,
+    so matching cost is linear in text length regardless of dictionary size.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str]], whole_words: bool = True):
+        self.whole_words = whole_words
+        self.rules: List[Tuple[str, str]] = []
+        self._goto: List[dict] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for term, reason in rules:
+            term = _fold(term.strip())
+            if term:
+                self._add(term, len(self.rules))
+                self.rules.append((term, reason))
+        self._link()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _add(self, term: str, rule_idx: int) -> None:
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(rule_idx)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                # inherit matches that end at the fallback state (suffix terms)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str) -> Iterator[Match]:
+        folded = _fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for rule_idx in out[node]:
+                term, reason = self.rules[rule_idx]
+                start, end = i + 1 - len(term), i + 1
+                if self.whole_words and not _at_word_boundary(folded, start, end):
+                    continue
+                yield Match(start, end, term, reason)
+
+
+def _at_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def load_rules(path: str) -> List[Tuple[str, str]]:
+    # JSON: {"term": "reason", ...} or [["term", "reason"], ...]
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    if isinstance(data, dict):
+        return list(data.items())
+    return [(term, reason) for term, reason in data]
+
+
+@lru_cache(maxsize=4)
+def _build_matcher(path, inline_rules) -> KeywordMatcher:
+    rules = list(inline_rules)
+    if path:
+        rules.extend(load_rules(path))
+    return KeywordMatcher(rules)
+
+
+def get_highlight_matcher(default_rules=()) -> KeywordMatcher:
+    """
+    Matcher for settings.HIGHLIGHT_RULES (inline pairs) plus HIGHLIGHT_RULES_FILE
+    (JSON dictionary, may hold thousands of terms); falls back to default_rules.
+    Compiled once per configuration and reused across requests.
+    """
+    inline = tuple(tuple(r) for r in getattr(settings, "HIGHLIGHT_RULES", None) or ())
+    path = getattr(settings, "HIGHLIGHT_RULES_FILE", None)
+    if not inline and not path:
+        inline = tuple(tuple(r) for r in default_rules)
+    return _build_matcher(str(path) if path else None, inline)
+
+
+# process-pool workers (batch generation): each worker compiles the automaton once
+_worker_matcher = None
+
+
+def init_worker_matcher(rules, whole_words: bool = True) -> None:
+    global _worker_matcher
+    _worker_matcher = KeywordMatcher(rules, whole_words=whole_words)
+
+
+def match_rows(rows):
+    """[(entry_id, content), ...] -> [[Match, ...], ...] aligned with rows."""
+    return [list(_worker_matcher.find_all(content)) for _, content in rows]
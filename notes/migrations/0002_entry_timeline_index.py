@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(fields=["patient", "created_at", "id"], name="entry_patient_created_id"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def renumber_duplicate_versions(apps, schema_editor):
+    # racing edits could save two snapshots with the same version; renumber those
+    # entries' histories 1..n in save order so the unique constraint can be added
+    VersionSnapshot = apps.get_model("notes", "VersionSnapshot")
+    entry_ids = (
+        VersionSnapshot.objects.values("entry_id", "version")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("entry_id", flat=True)
+        .distinct()
+    )
+    for entry_id in list(entry_ids):
+        snapshots = VersionSnapshot.objects.filter(entry_id=entry_id).order_by("version", "created_at", "id")
+        for number, snap in enumerate(snapshots.only("id", "version"), start=1):
+            if snap.version != number:
+                snap.version = number
+                snap.save(update_fields=["version"])
+
+
+def backfill_current_version(apps, schema_editor):
+    Entry = apps.get_model("notes", "Entry")
+    VersionSnapshot = apps.get_model("notes", "VersionSnapshot")
+    latest = (
+        VersionSnapshot.objects.filter(entry=OuterRef("pk"))
+        .order_by("-version")
+        .values("version")[:1]
+    )
+    Entry.objects.update(current_version=Coalesce(Subquery(latest), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0002_entry_timeline_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="current_version",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(renumber_duplicate_versions, migrations.RunPython.noop),
+        migrations.RunPython(backfill_current_version, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="versionsnapshot",
+            constraint=models.UniqueConstraint(fields=("entry", "version"), name="uniq_entry_version"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0003_entry_current_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="generation",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0004_patient_generation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HighlightWatermark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("last_updated_at", models.DateTimeField(blank=True, null=True)),
+                ("last_entry_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("patient", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="highlight_watermark", to="notes.patient")),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notes", "0005_highlight_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HighlightBatchRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("clinic_id", models.CharField(max_length=64)),
+                ("status", models.CharField(choices=[("running", "running"), ("completed", "completed"), ("failed", "failed")], default="running", max_length=16)),
+                ("last_patient_id", models.BigIntegerField(default=0)),
+                ("patients_done", models.IntegerField(default=0)),
+                ("entries_scanned", models.BigIntegerField(default=0)),
+                ("highlights_created", models.BigIntegerField(default=0)),
+                ("elapsed_seconds", models.FloatField(default=0)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("started_by", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
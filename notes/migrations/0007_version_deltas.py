@@ -0,0 +1,121 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:11
+
+import json
+import re
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import migrations, models
+
+# frozen copy of the delta format in notes/versioning.py at the time of this
+# migration, so later changes there cannot alter what it writes or reads
+_TOKEN_RE = re.compile(r"\s+|\S+")
+
+
+def make_delta(prev, new):
+    a, b = _TOKEN_RE.findall(prev), _TOKEN_RE.findall(new)
+    offsets = [0]
+    for tok in a:
+        offsets.append(offsets[-1] + len(tok))
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def apply_delta(prev, ops):
+    return "".join(op if isinstance(op, str) else prev[op[0]:op[1]] for op in ops)
+
+
+def encode_snapshot(version, prev_content, new_content):
+    interval = max(1, int(getattr(settings, "VERSION_KEYFRAME_INTERVAL", 10)))
+    if prev_content is None or version == 1 or (version - 1) % interval == 0:
+        return {"is_keyframe": True, "content": new_content, "delta": None}
+    ops = make_delta(prev_content, new_content)
+    if len(json.dumps(ops)) >= len(new_content):
+        return {"is_keyframe": True, "content": new_content, "delta": None}
+    return {"is_keyframe": False, "content": "", "delta": ops}
+
+
+def rebuild_sequence(rows):
+    text = None
+    for version, is_keyframe, content, delta in rows:
+        if is_keyframe:
+            text = content
+        elif text is None:
+            raise ValueError("delta without keyframe")
+        else:
+            text = apply_delta(text, delta)
+        yield version, text
+
+
+def _by_entry(VersionSnapshot):
+    entry_ids = VersionSnapshot.objects.order_by("entry_id").values_list("entry_id", flat=True).distinct()
+    for entry_id in list(entry_ids):
+        yield list(VersionSnapshot.objects.filter(entry_id=entry_id).order_by("version"))
+
+
+def _rewrite(VersionSnapshot, convert):
+    updates = []
+    for chain in _by_entry(VersionSnapshot):
+        updates.extend(convert(chain))
+        if len(updates) >= 500:
+            VersionSnapshot.objects.bulk_update(updates, ["is_keyframe", "content", "delta"])
+            updates = []
+    VersionSnapshot.objects.bulk_update(updates, ["is_keyframe", "content", "delta"])
+
+
+def _chain_to_deltas(chain):
+    prev = None
+    for snap in chain:
+        full = snap.content
+        fields = encode_snapshot(snap.version, prev, full)
+        if not fields["is_keyframe"]:
+            snap.is_keyframe, snap.content, snap.delta = False, "", fields["delta"]
+            yield snap
+        prev = full
+
+
+def _chain_to_full_content(chain):
+    rows = [(s.version, s.is_keyframe, s.content, s.delta) for s in chain]
+    for snap, (_, text) in zip(chain, list(rebuild_sequence(rows))):
+        if not snap.is_keyframe:
+            snap.is_keyframe, snap.content, snap.delta = True, text, None
+            yield snap
+
+
+def to_deltas(apps, schema_editor):
+    _rewrite(apps.get_model("notes", "VersionSnapshot"), _chain_to_deltas)
+
+
+def to_full_content(apps, schema_editor):
+    _rewrite(apps.get_model("notes", "VersionSnapshot"), _chain_to_full_content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0006_highlight_batch_run"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="versionsnapshot",
+            name="delta",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="versionsnapshot",
+            name="is_keyframe",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name="versionsnapshot",
+            name="content",
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(to_deltas, to_full_content),
+    ]
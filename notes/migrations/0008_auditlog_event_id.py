@@ -0,0 +1,24 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0007_version_deltas"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="auditlog",
+            name="event_id",
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="auditlog",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
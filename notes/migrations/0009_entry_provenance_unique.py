@@ -0,0 +1,39 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def disambiguate_duplicate_pointers(apps, schema_editor):
+    # rows created before the constraint may share a pointer; keep the oldest as-is, suffix the rest
+    Entry = apps.get_model("notes", "Entry")
+    dupes = (
+        Entry.objects.values("patient_id", "provenance_pointer")
+        .annotate(n=models.Count("id"), keep=models.Min("id"))
+        .filter(n__gt=1)
+    )
+    for d in dupes:
+        rows = Entry.objects.filter(patient_id=d["patient_id"], provenance_pointer=d["provenance_pointer"])
+        for e in rows.exclude(id=d["keep"]).only("id", "provenance_pointer"):
+            e.provenance_pointer = f"{e.provenance_pointer[:240]}#dup-{e.id}"
+            e.save(update_fields=["provenance_pointer"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0008_auditlog_event_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="entry",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(disambiguate_duplicate_pointers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="entry",
+            constraint=models.UniqueConstraint(fields=("patient", "provenance_pointer"), name="uniq_entry_provenance"),
+        ),
+    ]
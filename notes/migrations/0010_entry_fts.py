@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# frozen copy of the index definition in notes/search.py at the time of this migration
+FTS_TABLE = "notes_entry_fts"
+TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END""",
+}
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"content, content='notes_entry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in TRIGGERS.values():
+            cur.execute(sql)
+        cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cur:
+        for name in TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0009_entry_provenance_unique"),
+    ]
+
+    operations = [
+        # SQLite FTS5 index + sync triggers over notes_entry.content (no-op on other backends)
+        migrations.RunPython(create_index, drop_index),
+    ]
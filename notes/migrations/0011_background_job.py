@@ -0,0 +1,44 @@
+# Generated by Django 4.2.28 on 2026-10-18 05:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notes", "0010_entry_fts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackgroundJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(max_length=64)),
+                ("dedup_key", models.CharField(max_length=128)),
+                ("payload", models.JSONField(blank=True, default=dict)),
+                ("status", models.CharField(choices=[("queued", "queued"), ("running", "running"), ("succeeded", "succeeded"), ("failed", "failed")], default="queued", max_length=16)),
+                ("progress", models.PositiveSmallIntegerField(default=0)),
+                ("progress_note", models.CharField(blank=True, default="", max_length=128)),
+                ("result", models.JSONField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("locked_by", models.CharField(blank=True, default="", max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("patient", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="notes.patient")),
+                ("requested_by", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "id"], name="job_status_id")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="backgroundjob",
+            constraint=models.UniqueConstraint(condition=models.Q(("status__in", ["queued", "running"])), fields=("dedup_key",), name="uniq_active_job"),
+        ),
+    ]
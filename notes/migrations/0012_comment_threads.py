@@ -0,0 +1,38 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notes", "0011_background_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="commentthread",
+            name="resolved_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="commentthread",
+            name="resolved_by",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["thread", "created_at", "id"], name="comment_thread_created_id"),
+        ),
+        migrations.AddIndex(
+            model_name="commentthread",
+            index=models.Index(fields=["entry", "created_at", "id"], name="thread_entry_created_id"),
+        ),
+        migrations.AddIndex(
+            model_name="commentthread",
+            index=models.Index(fields=["entry", "is_resolved"], name="thread_entry_resolved"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0012_comment_threads"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClinicShard",
+            fields=[
+                ("clinic_id", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("alias", models.CharField(max_length=64)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ShardSequence",
+            fields=[
+                ("name", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("next_id", models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0013_clinic_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="highlight",
+            name="stale",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0014_highlight_stale"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="clinicshard",
+            name="moving",
+            field=models.BooleanField(default=False),
+        ),
+    ]
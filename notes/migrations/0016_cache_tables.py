@@ -0,0 +1,18 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # the DatabaseCache tables named in CACHES ("shared": admission control); existing ones are left alone
+    call_command("createcachetable", database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0015_clinicshard_moving"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
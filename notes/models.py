@@ -1,11 +1,36 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+
+class ShardedQuerySet(models.QuerySet):
+    # clinic-sharded rows (notes/sharding.py): ids come from the directory, and new
+    # rows go to their patient's shard unless the queryset is pinned with .using()
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .sharding import assign_ids, route_rows
+        objs = list(objs)
+        assign_ids(self.model, objs)
+        groups = route_rows(self.model, objs) if self._db is None else {self._db: objs}
+        for alias, rows in groups.items():
+            super(ShardedQuerySet, self.using(alias)).bulk_create(rows, *args, **kwargs)
+        return objs
 
 
 class Patient(models.Model):
     clinic_id = models.CharField(max_length=64)
     display_name = models.CharField(max_length=128)  # synthetic only
 
+    # bumped on every write to this patient's entries/highlights (see notes/caching.py)
+    generation = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
         return f"{self.display_name} ({self.clinic_id})"
 
@@ -32,14 +57,29 @@ class Entry(models.Model):
     author_role = models.CharField(max_length=16, choices=ROLE_CHOICES)
     type = models.CharField(max_length=64, choices=TYPE_CHOICES)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default, not auto_now_add: ingested feed rows keep their source timestamp (notes/ingest.py)
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # must support provenance tracing
+    # must support provenance tracing; unique per patient so re-sent feed rows are deduplicated
     provenance_pointer = models.CharField(max_length=256)
 
     content = models.TextField()
 
+    # denormalized latest VersionSnapshot.version; bumped with compare-and-swap in editing.py
+    current_version = models.IntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the timeline: (created_at, id) within a patient
+            models.Index(fields=["patient", "created_at", "id"], name="entry_patient_created_id"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "provenance_pointer"], name="uniq_entry_provenance"),
+        ]
+
     def __str__(self):
         return f"{self.patient_id} {self.type} {self.created_at}"
 
@@ -48,6 +88,19 @@ class CommentThread(models.Model):
     entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name="threads")
     is_resolved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolved_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+    )
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pages of an entry's threads; timeline open-thread counts
+            models.Index(fields=["entry", "created_at", "id"], name="thread_entry_created_id"),
+            models.Index(fields=["entry", "is_resolved"], name="thread_entry_resolved"),
+        ]
 
 
 class Comment(models.Model):
@@ -57,6 +110,11 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["thread", "created_at", "id"], name="comment_thread_created_id")]
+
 
 class Highlight(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="highlights")
@@ -72,19 +130,129 @@ class Highlight(models.Model):
     span_end = models.IntegerField(default=0)
 
     status = models.CharField(max_length=16, default="suggested")  # suggested/accepted/rejected
+    # reviewed, but the matched term is no longer in the edited entry; span/text describe the old content
+    stale = models.BooleanField(default=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+
+class HighlightWatermark(models.Model):
+    # last (updated_at, id) of a non-AI entry scanned by rule-based highlight generation
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name="highlight_watermark")
+    last_updated_at = models.DateTimeField(null=True, blank=True)
+    last_entry_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+
+class HighlightBatchRun(models.Model):
+    # clinic-wide rule-based highlight generation; last_patient_id is the resume checkpoint
+    STATUS_CHOICES = [
+        ("running", "running"),
+        ("completed", "completed"),
+        ("failed", "failed"),
+    ]
+
+    clinic_id = models.CharField(max_length=64)
+    started_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="running")
+
+    last_patient_id = models.BigIntegerField(default=0)
+    patients_done = models.IntegerField(default=0)
+    entries_scanned = models.BigIntegerField(default=0)
+    highlights_created = models.BigIntegerField(default=0)
+    elapsed_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def entries_per_second(self) -> float:
+        return self.entries_scanned / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+class BackgroundJob(models.Model):
+    # database-backed job queue (notes/jobs.py); one active job per dedup_key
+    STATUS_CHOICES = [
+        ("queued", "queued"),
+        ("running", "running"),
+        ("succeeded", "succeeded"),
+        ("failed", "failed"),
+    ]
+    ACTIVE_STATUSES = ("queued", "running")
+
+    kind = models.CharField(max_length=64)
+    dedup_key = models.CharField(max_length=128)
+    patient = models.ForeignKey(Patient, null=True, blank=True, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    payload = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_note = models.CharField(max_length=128, blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # concurrent requests for the same work join the job in flight
+            models.UniqueConstraint(
+                fields=["dedup_key"], condition=models.Q(status__in=["queued", "running"]), name="uniq_active_job",
+            ),
+        ]
+        indexes = [models.Index(fields=["status", "id"], name="job_status_id")]
 
 
 class VersionSnapshot(models.Model):
     entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name="versions")
     version = models.IntegerField()
-    content = models.TextField()
+    # keyframes hold the full text in `content`; other versions hold a `delta`
+    # against the previous version (see notes/versioning.py)
+    is_keyframe = models.BooleanField(default=True)
+    content = models.TextField(blank=True)
+    delta = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["entry", "version"], name="uniq_entry_version"),
+        ]
+
 
 class AuditLog(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
     action = models.CharField(max_length=64)
     meta = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # event time, not insert time: spooled events are inserted later (notes/audit.py)
+    created_at = models.DateTimeField(default=timezone.now)
+    # idempotency key for spool replay
+    event_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+
+class ClinicShard(models.Model):
+    # directory: which database alias holds a clinic's rows (notes/sharding.py); absent = default
+    clinic_id = models.CharField(max_length=64, primary_key=True)
+    alias = models.CharField(max_length=64)
+    moving = models.BooleanField(default=False)  # move_clinic in progress: the clinic's writes are refused
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ShardSequence(models.Model):
+    # directory: next id of a sharded table, so ids stay unique across shards
+    name = models.CharField(max_length=64, primary_key=True)
+    next_id = models.BigIntegerField()
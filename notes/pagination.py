@@ -0,0 +1,55 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_TIMELINE_LIMIT = 50
+MAX_TIMELINE_LIMIT = 500
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    # opaque to clients: base64("<created_at iso>|<id>")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_raw, pk_raw = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_raw), int(pk_raw)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+
+
+def parse_limit(raw, default: int = DEFAULT_TIMELINE_LIMIT, maximum: int = MAX_TIMELINE_LIMIT) -> int:
+    if raw in (None, ""):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def _model_key(row):
+    return row.created_at, row.id
+
+
+def keyset_page(qs, cursor, limit: int, key=_model_key):
+    """
+    Newest-first keyset page over (created_at, id).
+    Served by the Entry(patient, created_at, id) index, so cost does not
+    grow with how deep into the history the cursor points.
+    key(row) -> (created_at, id), for querysets of tuples (values_list).
+    """
+    qs = qs.order_by("-created_at", "-id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(qs[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*key(rows[-1]))
+    return rows, next_cursor
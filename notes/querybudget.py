@@ -0,0 +1,83 @@
+"""
+Per-view query budgets.
+
+A view declares `query_budget = <max queries per request>`. assert_query_budget()
+is the test helper; QueryBudgetMiddleware enforces the declared budget on live
+requests and logs (QUERY_BUDGET_ACTION="log", default) or raises ("raise").
+Queries on every configured database (clinic shards, the read replica) count
+toward the budget. Transaction control statements (savepoints etc.) are not
+counted, so the same budget holds inside and outside test transactions.
+"""
+import logging
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK", "BEGIN", "COMMIT")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(TRANSACTION_CONTROL):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self, budget: int, label: str = "") -> str:
+        lines = [f"{label or 'block'} ran {len(self)} queries, budget is {budget}:"]
+        lines += [f"  {i}. {sql}" for i, sql in enumerate(self.queries, 1)]
+        return "\n".join(lines)
+
+
+@contextmanager
+def record_queries(using: Optional[str] = None):
+    """Records queries on the `using` alias, or on every configured database."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for alias in [using] if using else list(connections):
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+@contextmanager
+def assert_query_budget(budget: int, using: Optional[str] = None, label: str = ""):
+    with record_queries(using) as recorder:
+        yield recorder
+    if len(recorder) > budget:
+        raise QueryBudgetExceeded(recorder.report(budget, label))
+
+
+def view_query_budget(view_func):
+    return getattr(getattr(view_func, "view_class", view_func), "query_budget", None)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        budget = getattr(request, "_query_budget", None)
+        if budget is not None and len(recorder) > budget:
+            message = recorder.report(budget, f"{request.method} {request.path}")
+            if getattr(settings, "QUERY_BUDGET_ACTION", "log") == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = view_query_budget(view_func)
@@ -1,5 +1,8 @@
 from .models import Entry, Highlight, Patient
 
+# patient can only view patient-facing summaries (we restrict to ai_patient_session_summary for MVP)
+PATIENT_VISIBLE_TYPES = {"ai_patient_session_summary"}
+
 
 def filter_patient_queryset(user, patient: Patient):
     # clinic scope
@@ -7,18 +10,16 @@ def filter_patient_queryset(user, patient: Patient):
         if user.clinic_id and user.clinic_id != patient.clinic_id:
             raise PermissionError("Cross-clinic access denied")
 
-    # patient can only view patient-facing summaries (we restrict to ai_patient_session_summary for MVP)
     if user.role == "patient":
         if user.patient_id != patient.id:
             raise PermissionError("Patient can only access self")
-        allowed_types = {"ai_patient_session_summary"}
         return (
-            Entry.objects.filter(patient=patient, type__in=allowed_types)
-            .order_by("-created_at")
+            Entry.objects.filter(patient=patient, type__in=PATIENT_VISIBLE_TYPES)
+            .order_by("-created_at", "-id")
         )
 
     # staff/clinician/admin: view all entries for now (later we tighten by type)
-    return Entry.objects.filter(patient=patient).order_by("-created_at")
+    return Entry.objects.filter(patient=patient).order_by("-created_at", "-id")
 
 
 def filter_highlights_queryset(user, patient: Patient):
@@ -27,3 +28,37 @@ def filter_highlights_queryset(user, patient: Patient):
     if user.role == "patient":
         return qs.filter(status="accepted")
     return qs
+
+
+def check_entry_access(user, entry: Entry):
+    # same rules as filter_patient_queryset, for a single entry
+    filter_patient_queryset(user, entry.patient)
+    if user.role == "patient" and entry.type not in PATIENT_VISIBLE_TYPES:
+        raise PermissionError("Entry not visible to patient")
+
+
+def entry_search_scope(user, patient: Patient = None, clinic_id: str = None) -> dict:
+    """
+    Row filters for cross-entry search (notes/search.py), equivalent to running
+    filter_patient_queryset for every patient in range. Raises PermissionError.
+    """
+    scope = {}
+    if user.role == "patient":
+        if patient is None:
+            if user.patient_id is None:
+                raise PermissionError("Patient account is not linked to a patient")
+            patient = Patient.objects.get(pk=user.patient_id)
+        scope["types"] = PATIENT_VISIBLE_TYPES
+
+    if patient is not None:
+        filter_patient_queryset(user, patient)
+        scope["patient_id"] = patient.id
+        return scope
+
+    if user.role != "admin" and user.clinic_id:
+        if clinic_id and clinic_id != user.clinic_id:
+            raise PermissionError("Cross-clinic access denied")
+        clinic_id = user.clinic_id
+    if clinic_id:
+        scope["clinic_id"] = clinic_id
+    return scope
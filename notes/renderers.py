@@ -0,0 +1,72 @@
+import logging
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the stock encoder still works without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+_warned_no_orjson = False
+
+
+def _not_native(obj):
+    # hand anything orjson would format differently back to the DRF encoder
+    raise TypeError(type(obj).__name__)
+
+
+def _orjson_float_safe(data) -> bool:
+    """
+    False if data holds a float orjson formats differently from json.dumps:
+    NaN/inf (null vs ValueError), or one repr() writes in exponent form
+    (1e-05 vs 0.00001, 1e+16 vs 1e16).
+    """
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, float):
+            if not (obj == 0 or 1e-4 <= abs(obj) < 1e16):  # NaN fails every comparison
+                return False
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return True
+
+
+def _warn_no_orjson():
+    global _warned_no_orjson
+    if not _warned_no_orjson:
+        _warned_no_orjson = True
+        logger.warning("orjson is not installed; FastJSONRenderer falls back to the stock JSON encoder")
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer producing the same bytes for compact, non-indented output.
+    Uses orjson when installed; anything it cannot encode natively (lazy strings,
+    Decimals, ...) or formats differently (non-finite floats, floats repr() writes
+    in exponent form), indented output, or a non-default JSON config falls back
+    to the stock renderer.
+    Enable via REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None:
+            _warn_no_orjson()
+            return super().render(data, accepted_media_type, renderer_context)
+        if (
+            not (self.compact and self.strict and not self.ensure_ascii)
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+            or not _orjson_float_safe(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_not_native, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # same JS-safe escaping as JSONRenderer
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
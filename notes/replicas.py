@@ -0,0 +1,121 @@
+"""
+Read replica routing with read-your-writes stickiness.
+
+Views that declare `replica_reads = True` (care note, entry versions, the care
+note page, comment threads) send their GET reads to settings.REPLICA_DATABASE; everything else, and
+every write, uses the primary. Reads inside a transaction on the primary stay
+there, so a write path never acts on replica data.
+
+A replica lags behind the primary, so after a user edits an entry, reverts it
+or generates/reviews highlights, stick_to_primary() pins that user to the
+primary for REPLICA_STICKY_SECONDS: their own reads see their own writes, while
+other users may see the previous state until the replica catches up. The pin
+lives in the default cache, which must be shared between server processes.
+
+Locally the replica is a second SQLite file kept in sync by copying the whole
+primary (replicate()); `python manage.py simulate_replication --lag 2` does so
+every 2 seconds, i.e. with up to 2 seconds of replication lag.
+
+Settings:
+    REPLICA_DATABASE        alias of the replica in DATABASES (None: routing off)
+    REPLICA_STICKY_SECONDS  how long a writer reads from the primary (default 10)
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_request = ContextVar("replica_routing_request", default=None)
+
+
+def current_request():
+    """The request being served on this thread/task (set by ReplicaRoutingMiddleware), or None."""
+    return _request.get()
+
+
+def replica_alias() -> Optional[str]:
+    return getattr(settings, "REPLICA_DATABASE", None)
+
+
+def _pin_key(user_id) -> str:
+    return f"primary-pin:{user_id}"
+
+
+def stick_to_primary(user) -> None:
+    """Route user's reads to the primary for the next REPLICA_STICKY_SECONDS."""
+    user_id = getattr(user, "pk", None)
+    if user_id is None or replica_alias() is None:
+        return
+    cache.set(_pin_key(user_id), True, getattr(settings, "REPLICA_STICKY_SECONDS", 10))
+
+
+def is_pinned(user) -> bool:
+    return cache.get(_pin_key(user.pk)) is not None
+
+
+def view_reads_from_replica(view_func) -> bool:
+    return getattr(getattr(view_func, "view_class", view_func), "replica_reads", False)
+
+
+def replica_reads(view_func):
+    """Decorator for function views: same as replica_reads = True on a class view."""
+    view_func.replica_reads = True
+    return view_func
+
+
+def _primary_pinned(request) -> bool:
+    if "_primary_pinned" not in request.__dict__:
+        # reads made while resolving the user (session, token user lookup) go to the primary
+        request._primary_pinned = True
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            del request._primary_pinned
+            return True
+        request._primary_pinned = is_pinned(user)
+    return request._primary_pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        request = _request.get()
+        if alias is None or request is None or not getattr(request, "_replica_reads", False):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or _primary_pinned(request):
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # a POST to the same view reads what it is about to change: primary
+        request._replica_reads = request.method in ("GET", "HEAD") and view_reads_from_replica(view_func)
+
+
+def replicate(source: str = DEFAULT_DB_ALIAS, target: Optional[str] = None) -> None:
+    """Copy the whole primary SQLite database onto the replica file."""
+    target = target or replica_alias()
+    src, dst = connections[source], connections[target]
+    src.ensure_connection()
+    dst.ensure_connection()
+    src.connection.backup(dst.connection)
+
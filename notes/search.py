@@ -0,0 +1,166 @@
+"""
+Full-text search over Entry.content with SQLite FTS5.
+
+notes_entry_fts is an external-content FTS5 index over notes_entry, kept in sync
+by triggers, so every write path (save, bulk_create, the compare-and-swap
+.update() used by edits/reverts, deletes) updates it. Queries go through the FTS
+index and then join only the matching entries, so cost follows the number of
+hits, not the size of the table.
+
+With clinic sharding every shard has its own index; search_sharded() queries
+the shards a scope can reach and merges their hits by score.
+"""
+import html
+import re
+from itertools import chain
+from typing import List
+
+from django.db import connection, connections, router
+
+from .fast_serializers import compile_row_mapper
+from .models import Entry
+from .sharding import scatter, shard_aliases, shard_for_clinic, shard_for_patient
+
+FTS_TABLE = "notes_entry_fts"
+TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON notes_entry BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END""",
+}
+
+# private-use markers survive html.escape, then become <mark> tags
+MARK_OPEN, MARK_CLOSE = "\ue000", "\ue001"
+SNIPPET_TOKENS = 16
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+RESULT_FIELDS = [
+    ("entry_id", "id", None),
+    ("patient_id", "patient_id", None),
+    ("type", "type", None),
+    ("author_role", "author_role", None),
+    ("created_at", "created_at", "datetime"),
+    ("provenance_pointer", "provenance_pointer", None),
+]
+
+
+def ensure_fts_index(conn=connection) -> bool:
+    """
+    Create the FTS table/triggers if missing (SQLite only). A table rebuild by a
+    later migration drops the triggers, so missing triggers trigger a full reindex.
+    Returns True if the index was (re)built.
+    """
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cur:
+        cur.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                    [f"{FTS_TABLE}%"])
+        present = {name for (name,) in cur.fetchall()}
+        if FTS_TABLE in present and set(TRIGGERS) <= present:
+            return False
+        cur.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"content, content='notes_entry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in TRIGGERS.values():
+            cur.execute(sql)
+        cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def drop_fts_index(conn=connection) -> None:
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cur:
+        for name in TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def to_match_query(text: str) -> str:
+    # user input -> implicit AND of quoted terms; "warf*" keeps prefix search, FTS syntax is never passed through
+    terms = []
+    for word, star in re.findall(r"(\w+)(\*?)", text):
+        terms.append(f'"{word}"{star}')
+    return " ".join(terms)
+
+
+def _render_snippet(raw: str) -> str:
+    return html.escape(raw).replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+
+def build_search_sql(match: str, scope: dict, limit: int, offset: int = 0):
+    where, params = [f"{FTS_TABLE} MATCH %s"], [match]
+    if scope.get("patient_id") is not None:
+        where.append("e.patient_id = %s")
+        params.append(scope["patient_id"])
+    if scope.get("clinic_id") is not None:
+        where.append("p.clinic_id = %s")
+        params.append(scope["clinic_id"])
+    if scope.get("types") is not None:
+        types = sorted(scope["types"])
+        where.append(f"e.type IN ({', '.join(['%s'] * len(types))})")
+        params.extend(types)
+
+    sql = (
+        f"SELECT e.id, snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS}), bm25({FTS_TABLE}) AS score "
+        f"FROM {FTS_TABLE} JOIN notes_entry e ON e.id = {FTS_TABLE}.rowid "
+        f"JOIN notes_patient p ON p.id = e.patient_id "
+        f"WHERE {' AND '.join(where)} ORDER BY score, e.id LIMIT %s OFFSET %s"
+    )
+    return sql, [MARK_OPEN, MARK_CLOSE, *params, limit, offset]
+
+
+def search_entries(query: str, scope: dict, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> List[dict]:
+    """
+    scope (see rbac.entry_search_scope): optional patient_id, clinic_id, types.
+    Best matches first (bm25); snippets are HTML-escaped with <mark> around hits.
+    """
+    match = to_match_query(query)
+    if not match:
+        return []
+
+    sql, params = build_search_sql(match, scope, limit, offset)
+    with connections[router.db_for_read(Entry)].cursor() as cur:
+        cur.execute(sql, params)
+        hits = cur.fetchall()
+    if not hits:
+        return []
+
+    to_dict = compile_row_mapper(RESULT_FIELDS)
+    rows = Entry.objects.filter(id__in=[h[0] for h in hits]).values_list(*[col for _, col, _ in RESULT_FIELDS])
+    by_id = {row[0]: to_dict(row) for row in rows}
+    return [
+        {**by_id[entry_id], "snippet": _render_snippet(snippet), "score": round(-score, 4)}
+        for entry_id, snippet, score in hits
+        if entry_id in by_id
+    ]
+
+
+def scope_shards(scope: dict) -> List[str]:
+    if scope.get("patient_id") is not None:
+        return [shard_for_patient(scope["patient_id"])]
+    if scope.get("clinic_id") is not None:
+        return [shard_for_clinic(scope["clinic_id"])]
+    return shard_aliases()
+
+
+def search_sharded(query: str, scope: dict, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> List[dict]:
+    """search_entries() on every shard the scope reaches; one query pair per shard."""
+    aliases = scope_shards(scope)
+    if len(aliases) == 1:
+        return scatter(lambda: search_entries(query, scope, limit, offset), aliases)[aliases[0]]
+    # any shard may hold the whole page: take offset + limit from each, then merge
+    per_shard = scatter(lambda: search_entries(query, scope, offset + limit), aliases)
+    merged = sorted(chain.from_iterable(per_shard.values()), key=lambda r: (-r["score"], r["entry_id"]))
+    return merged[offset:offset + limit]
@@ -12,12 +12,13 @@ class EntrySerializer(serializers.ModelSerializer):
 
 
 class HighlightSerializer(serializers.ModelSerializer):
-    entry_id = serializers.IntegerField(source="entry.id", read_only=True)
+    # the FK column, not entry.id: no Entry load per highlight
+    entry_id = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Highlight
         fields = [
-            "id", "text", "risk_reason", "status",   # <- 必须有 status
+            "id", "text", "risk_reason", "status", "stale",   # <- 必须有 status
             "entry_id", "span_start", "span_end", "created_at"
         ]
 
@@ -29,7 +30,58 @@ class CareNoteSerializer(serializers.Serializer):
 
 from .models import VersionSnapshot
 
+class VersionSnapshotMetaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VersionSnapshot
+        fields = ["version", "created_at", "changed_by"]
+
+
 class VersionSnapshotSerializer(serializers.ModelSerializer):
+    # rebuilt from keyframe + deltas by the view (see notes/versioning.py)
+    content = serializers.CharField(source="full_content", read_only=True)
+
     class Meta:
         model = VersionSnapshot
         fields = ["version", "content", "created_at", "changed_by"]
+
+from .models import HighlightBatchRun
+
+class HighlightBatchRunSerializer(serializers.ModelSerializer):
+    entries_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = HighlightBatchRun
+        fields = [
+            "id", "clinic_id", "status", "last_patient_id", "patients_done",
+            "entries_scanned", "highlights_created", "elapsed_seconds", "entries_per_second",
+            "error", "created_at", "finished_at",
+        ]
+
+from .models import BackgroundJob
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BackgroundJob
+        fields = [
+            "id", "kind", "patient_id", "status", "progress", "progress_note", "result",
+            "error", "attempts", "created_at", "updated_at", "finished_at",
+        ]
+
+from .models import Comment, CommentThread
+
+class CommentSerializer(serializers.ModelSerializer):
+    thread_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ["id", "thread_id", "author", "author_role", "content", "created_at"]
+
+
+class CommentThreadSerializer(serializers.ModelSerializer):
+    entry_id = serializers.IntegerField(read_only=True)
+    # annotated by the listing query (or set on creation)
+    comment_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CommentThread
+        fields = ["id", "entry_id", "is_resolved", "resolved_at", "resolved_by", "created_at", "comment_count"]
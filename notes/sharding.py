@@ -0,0 +1,493 @@
+"""
+Clinic sharding.
+
+Off unless settings.CLINIC_SHARDING. The default database stays the directory
+(users, patients, jobs, batch runs and the clinic -> shard map, ClinicShard);
+a clinic's clinical rows (SHARDED_MODELS) live in the database alias its
+ClinicShard row names, or in default if it has none.
+`python manage.py move_clinic <clinic_id> <alias>` moves a clinic between shards.
+
+Which shard a query on a sharded model uses (ClinicShardRouter):
+    0. for a row being saved or its related lookups: the row's own shard, or
+       its patient's (or parent entry/thread's) for a new row
+    1. an explicit use_shard() / use_clinic() / use_patient() block
+       (background work, scatter-gather, rebalancing)
+    2. during a request: the shard of the URL's patient_id, else the user's clinic;
+       an admin addressing an entry/thread/highlight by id is located by asking
+       every shard
+    3. default
+A non-admin only ever reaches their own clinic's shard. Admin reads without a
+patient or clinic in scope go through scatter(), one query per shard.
+
+While a clinic is being moved its ClinicShard row is flagged `moving`: writes
+for it (the saved row's patient's clinic, else the clinic in scope as above)
+raise ClinicMoving, which the API answers with 503 + Retry-After. The shard map
+is cached per process, but a clinic the cached map shows as moving is looked up
+in the directory on every use, so the switch to its new shard is seen at once.
+
+Rows keep their ids when a clinic moves, so ids must be unique across shards:
+with sharding on, sharded rows take ids from the directory's ShardSequence,
+reserved SHARD_ID_BLOCK at a time. Patients are mirrored into their clinic's
+shard so joins on patient work there. Shards other than default reference users
+and patients held elsewhere, so SQLite foreign key enforcement is off on them.
+
+Settings:
+    CLINIC_SHARDING          route sharded models by clinic (default False)
+    SHARD_DATABASES          aliases that may hold clinics (default ["default"])
+    SHARD_ID_BLOCK           ids reserved per directory round trip (default 100)
+    SHARD_MAP_CACHE_SECONDS  how long the clinic -> shard map is cached (default 60);
+                             move_clinic waits this long after fencing a clinic
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, router, transaction
+from django.db.models import Max
+from rest_framework.exceptions import APIException
+
+from .models import ClinicShard, Patient, ShardSequence
+from .replicas import current_request
+from .sqlite import write_transaction
+
+SHARDED_MODELS = {
+    "notes.entry", "notes.versionsnapshot", "notes.highlight", "notes.highlightwatermark",
+    "notes.commentthread", "notes.comment", "notes.auditlog",
+}
+# URL kwargs an admin request may address a sharded row by, without naming its patient:
+# kwarg -> (model, lookup of the row's patient id)
+LOCATE_BY_KWARG = {
+    "entry_id": ("notes.Entry", "patient_id"),
+    "thread_id": ("notes.CommentThread", "entry__patient_id"),
+    "highlight_id": ("notes.Highlight", "patient_id"),
+}
+MAP_CACHE_KEY = "clinic-shard-map"
+DELETE_CHUNK = 500
+MOVING_RETRY_AFTER = 5
+
+# (alias, clinic_id) of the innermost use_shard() block
+_active = ContextVar("clinic_shard", default=None)
+
+
+class ClinicMoving(APIException):
+    status_code = 503
+    default_code = "clinic_moving"
+
+    def __init__(self, clinic_id: str):
+        super().__init__(f"Clinic {clinic_id} is being moved to another shard; retry shortly")
+        self.clinic_id = clinic_id
+        self.wait = MOVING_RETRY_AFTER  # DRF's exception handler sends it as Retry-After
+
+
+def sharding_enabled() -> bool:
+    return getattr(settings, "CLINIC_SHARDING", False)
+
+
+def shard_aliases() -> List[str]:
+    if not sharding_enabled():
+        return [DEFAULT_DB_ALIAS]
+    return list(getattr(settings, "SHARD_DATABASES", [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded(model) -> bool:
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+# --- directory lookups -------------------------------------------------------
+
+def _directory() -> Tuple[Dict[str, str], frozenset]:
+    # ({clinic_id: alias}, clinic ids being moved), cached per process
+    entry = cache.get(MAP_CACHE_KEY)
+    if entry is None:
+        rows = list(ClinicShard.objects.using(DEFAULT_DB_ALIAS).values_list("clinic_id", "alias", "moving"))
+        entry = ({c: alias for c, alias, _ in rows}, frozenset(c for c, _, moving in rows if moving))
+        cache.set(MAP_CACHE_KEY, entry, getattr(settings, "SHARD_MAP_CACHE_SECONDS", 60))
+    return entry
+
+
+def shard_map() -> Dict[str, str]:
+    return _directory()[0]
+
+
+def _clinic_entry(clinic_id: Optional[str]) -> Tuple[str, bool]:
+    """(alias, moving) for clinic_id; read from the directory itself while the clinic moves."""
+    mapping, moving = _directory()
+    if clinic_id not in moving:
+        return mapping.get(clinic_id, DEFAULT_DB_ALIAS), False
+    row = ClinicShard.objects.using(DEFAULT_DB_ALIAS).filter(clinic_id=clinic_id).values_list("alias", "moving").first()
+    alias, still_moving = row or (DEFAULT_DB_ALIAS, False)
+    if not still_moving:
+        cache.delete(MAP_CACHE_KEY)  # the move is over; pick up the new map
+    return alias, still_moving
+
+
+def set_clinic_shard(clinic_id: str, alias: str, moving: bool = False) -> None:
+    ClinicShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        clinic_id=clinic_id, defaults={"alias": alias, "moving": moving},
+    )
+    cache.delete(MAP_CACHE_KEY)
+
+
+def shard_for_clinic(clinic_id: Optional[str]) -> str:
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return _clinic_entry(clinic_id)[0]
+
+
+def check_writable(clinic_id: Optional[str]) -> None:
+    """Raise ClinicMoving if clinic_id is being moved between shards."""
+    if sharding_enabled() and clinic_id is not None and _clinic_entry(clinic_id)[1]:
+        raise ClinicMoving(clinic_id)
+
+
+def patient_clinic(patient_id: int) -> Optional[str]:
+    # a patient never changes clinic, so this is cached for good
+    key = f"patient-clinic:{patient_id}"
+    clinic_id = cache.get(key)
+    if clinic_id is None:
+        clinic_id = (
+            Patient.objects.using(DEFAULT_DB_ALIAS).filter(pk=patient_id).values_list("clinic_id", flat=True).first()
+        )
+        if clinic_id is not None:
+            cache.set(key, clinic_id, None)
+    return clinic_id
+
+
+def shard_for_patient(patient) -> str:
+    """patient: a Patient or its id."""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    if isinstance(patient, Patient):
+        return shard_for_clinic(patient.clinic_id)
+    return shard_for_clinic(patient_clinic(patient))
+
+
+def shard_for_write(patient_id: int) -> str:
+    """shard_for_patient() for writes that bypass the router (.using()); raises ClinicMoving."""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    clinic_id = patient_clinic(patient_id)
+    check_writable(clinic_id)
+    return shard_for_clinic(clinic_id)
+
+
+def locate(model, pk, patient_lookup: str = "patient_id") -> Tuple[str, Optional[int]]:
+    """The shard holding model row pk and the row's patient id ((default, None) if no shard does)."""
+    for alias in shard_aliases():
+        patient_id = model._base_manager.using(alias).filter(pk=pk).values_list(patient_lookup, flat=True).first()
+        if patient_id is not None:
+            return alias, patient_id
+    return DEFAULT_DB_ALIAS, None
+
+
+# --- the active shard ---------------------------------------------------------
+
+@contextmanager
+def use_shard(alias: str, clinic_id: Optional[str] = None):
+    token = _active.set((alias, clinic_id))
+    try:
+        yield alias
+    finally:
+        _active.reset(token)
+
+
+def use_clinic(clinic_id: str):
+    return use_shard(shard_for_clinic(clinic_id), clinic_id)
+
+
+def use_patient(patient):
+    clinic_id = patient.clinic_id if isinstance(patient, Patient) else patient_clinic(patient)
+    return use_clinic(clinic_id)
+
+
+def _request_scope(request) -> Tuple[Optional[str], Optional[str]]:
+    """(alias, clinic_id) a request works in; (None, None) before authentication."""
+    if "_clinic_scope" in request.__dict__:
+        return request._clinic_scope
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None, None  # still authenticating: users live in the directory
+    kwargs = request.resolver_match.kwargs if request.resolver_match else {}
+    if "patient_id" in kwargs:
+        clinic_id = patient_clinic(kwargs["patient_id"])
+        alias = shard_for_clinic(clinic_id)
+    elif user.role != "admin":
+        clinic_id = user.clinic_id
+        alias = shard_for_clinic(clinic_id)
+    else:
+        alias, clinic_id = DEFAULT_DB_ALIAS, None
+        for kwarg, (label, patient_lookup) in LOCATE_BY_KWARG.items():
+            if kwarg in kwargs:
+                alias, patient_id = locate(apps.get_model(label), kwargs[kwarg], patient_lookup)
+                clinic_id = patient_clinic(patient_id) if patient_id is not None else None
+                break
+    request._clinic_scope = (alias, clinic_id)
+    return request._clinic_scope
+
+
+def _scope() -> Tuple[Optional[str], Optional[str]]:
+    active = _active.get()
+    if active is not None:
+        return active
+    request = current_request()
+    return _request_scope(request) if request is not None else (None, None)
+
+
+def current_shard() -> str:
+    """Alias that sharded reads/writes go to right now."""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return _scope()[0] or DEFAULT_DB_ALIAS
+
+
+def scatter(func: Callable, aliases: Optional[List[str]] = None) -> dict:
+    """func() once per shard, inside use_shard(alias) -> {alias: result}."""
+    results = {}
+    for alias in aliases or shard_aliases():
+        with use_shard(alias):
+            results[alias] = func()
+    return results
+
+
+def _instance_shard(instance) -> Optional[str]:
+    if not instance._state.adding:
+        return instance._state.db  # related lookups stay with the row they start from
+    # a new row goes where its patient's clinic lives, whatever shard is active
+    # (assigning a patient already set _state.db from the directory side)
+    patient_id = getattr(instance, "patient_id", None)
+    if patient_id is not None:
+        return shard_for_patient(patient_id)
+    for parent in ("entry", "thread"):
+        field = getattr(type(instance), parent, None)
+        if field is not None and field.field.is_cached(instance):
+            return getattr(instance, parent)._state.db
+    return None
+
+
+def _write_clinic(instance) -> Optional[str]:
+    # the clinic a write belongs to: its row's patient's, else the one in scope
+    patient_id = getattr(instance, "patient_id", None)
+    if patient_id is not None:
+        return patient_clinic(patient_id)
+    return _scope()[1]
+
+
+class ClinicShardRouter:
+    def _db(self, model, hints):
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        instance = hints.get("instance")
+        alias = _instance_shard(instance) if instance is not None and is_sharded(type(instance)) else None
+        alias = alias or current_shard()
+        # default: let the next router (read replica) decide
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        if sharding_enabled() and is_sharded(model):
+            check_writable(_write_clinic(hints.get("instance")))
+        return self._db(model, hints)
+
+
+def relax_shard_constraints(sender, connection, **kwargs) -> None:
+    # connection_created (apps.py): a shard's rows reference users/patients in the directory
+    if connection.vendor != "sqlite" or connection.alias == DEFAULT_DB_ALIAS:
+        return
+    if connection.alias not in getattr(settings, "SHARD_DATABASES", ()):
+        return
+    with connection.cursor() as cur:
+        cur.execute("PRAGMA foreign_keys = OFF")
+    # the schema editor turns checks back on after migrating; keep them off
+    connection.enable_constraint_checking = lambda: None
+
+
+def mirror_patient(patient: Patient) -> None:
+    alias = shard_for_clinic(patient.clinic_id)
+    if alias != DEFAULT_DB_ALIAS:
+        Patient.objects.using(alias).update_or_create(
+            pk=patient.pk, defaults={"clinic_id": patient.clinic_id, "display_name": patient.display_name},
+        )
+
+
+# --- ids ------------------------------------------------------------------------
+
+_blocks: Dict[str, tuple] = {}
+_blocks_pid = None
+_blocks_lock = threading.Lock()
+
+
+def _reserve(model, n: int) -> int:
+    """First of n fresh ids for model's table, from the directory."""
+    name = model._meta.label_lower
+    table = connections[DEFAULT_DB_ALIAS].ops.quote_name(ShardSequence._meta.db_table)
+    with connections[DEFAULT_DB_ALIAS].cursor() as cur:
+        cur.execute(f"UPDATE {table} SET next_id = next_id + %s WHERE name = %s RETURNING next_id", [n, name])
+        row = cur.fetchone()
+    if row:
+        return row[0] - n
+    # first use: start above every id already in any shard
+    start = 1 + max((model._base_manager.using(a).aggregate(m=Max("pk"))["m"] or 0) for a in shard_aliases())
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            ShardSequence.objects.using(DEFAULT_DB_ALIAS).create(name=name, next_id=start + n)
+    except IntegrityError:
+        return _reserve(model, n)  # another process created it first
+    return start
+
+
+def _take_ids(model, n: int) -> List[int]:
+    global _blocks_pid
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        # a rollback hands the reservation back to the sequence, so never keep a block
+        start = _reserve(model, n)
+        return list(range(start, start + n))
+    block = getattr(settings, "SHARD_ID_BLOCK", 100)
+    name = model._meta.label_lower
+    with _blocks_lock:
+        if _blocks_pid != os.getpid():  # forked: the parent's blocks are not ours
+            _blocks.clear()
+            _blocks_pid = os.getpid()
+        ids = []
+        nxt, end = _blocks.get(name, (0, 0))
+        while len(ids) < n:
+            if nxt >= end:
+                size = max(block, n - len(ids))
+                nxt = _reserve(model, size)
+                end = nxt + size
+            take = min(end - nxt, n - len(ids))
+            ids.extend(range(nxt, nxt + take))
+            nxt += take
+        _blocks[name] = (nxt, end)
+        return ids
+
+
+def assign_ids(model, objs) -> None:
+    """Give new sharded rows directory ids (no-op with sharding off)."""
+    if not sharding_enabled() or not is_sharded(model):
+        return
+    fresh = [obj for obj in objs if obj.pk is None]
+    if fresh:
+        for obj, pk in zip(fresh, _take_ids(model, len(fresh))):
+            obj.pk = pk
+
+
+def route_rows(model, objs) -> Dict[Optional[str], list]:
+    """New rows grouped by the shard each belongs to ({None: objs} with sharding off)."""
+    if not sharding_enabled():
+        return {None: objs}
+    groups = {}
+    for obj in objs:
+        groups.setdefault(router.db_for_write(model, instance=obj), []).append(obj)
+    return groups
+
+
+# --- rebalancing ------------------------------------------------------------
+
+def _clinic_rows(patient_ids: List[int]):
+    # parents first; (model, filter on the clinic's patients)
+    from .models import AuditLog, Comment, CommentThread, Entry, Highlight, HighlightWatermark, VersionSnapshot
+    return [
+        (Entry, {"patient_id__in": patient_ids}),
+        (VersionSnapshot, {"entry__patient_id__in": patient_ids}),
+        (Highlight, {"patient_id__in": patient_ids}),
+        (HighlightWatermark, {"patient_id__in": patient_ids}),
+        (CommentThread, {"entry__patient_id__in": patient_ids}),
+        (Comment, {"thread__entry__patient_id__in": patient_ids}),
+        (AuditLog, {"patient_id__in": patient_ids}),
+    ]
+
+
+def _copy_rows(model, qs, target: str, batch_size: int) -> int:
+    # raw INSERTs: bulk_create would overwrite auto_now/auto_now_add timestamps
+    conn = connections[target]
+    fields = model._meta.concrete_fields
+    columns = ", ".join(conn.ops.quote_name(f.column) for f in fields)
+    sql = (
+        f"INSERT INTO {conn.ops.quote_name(model._meta.db_table)} ({columns}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    rows = qs.order_by("pk").values_list(*[f.attname for f in fields]).iterator(chunk_size=batch_size)
+    copied = 0
+    with conn.cursor() as cur:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return copied
+            cur.executemany(sql, [[f.get_db_prep_save(v, conn) for f, v in zip(fields, row)] for row in chunk])
+            copied += len(chunk)
+
+
+def _delete_pks(model, alias: str, pks: List[int]) -> None:
+    # plain DELETEs: no signals or cascade collection for rows that are moving, not going away
+    conn = connections[alias]
+    table = conn.ops.quote_name(model._meta.db_table)
+    column = conn.ops.quote_name(model._meta.pk.column)
+    with conn.cursor() as cur:
+        for i in range(0, len(pks), DELETE_CHUNK):
+            chunk = pks[i:i + DELETE_CHUNK]
+            cur.execute(f"DELETE FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def _delete_clinic_rows(alias: str, patient_ids: List[int]) -> None:
+    for model, filters in reversed(_clinic_rows(patient_ids)):
+        _delete_pks(model, alias, list(model._base_manager.using(alias).filter(**filters).values_list("pk", flat=True)))
+    if alias != DEFAULT_DB_ALIAS:
+        _delete_pks(Patient, alias, patient_ids)
+
+
+def move_clinic(clinic_id: str, target: str, batch_size: int = 1000, settle: Optional[float] = None) -> Dict[str, int]:
+    """
+    Move a clinic's rows to `target`. The clinic is first flagged moving, which
+    makes its writes raise ClinicMoving, and the move waits `settle` seconds
+    (default SHARD_MAP_CACHE_SECONDS) for every process's cached shard map to
+    see the flag. It then copies the rows, switches the directory to `target`
+    (lifting the flag) and deletes the rows from the old shard. A move that
+    fails before the switch lifts the flag; rerunning it starts over cleanly.
+    Returns copied row counts per model.
+    """
+    if not sharding_enabled():
+        raise ValueError("CLINIC_SHARDING is off")
+    if target not in shard_aliases():
+        raise ValueError(f"{target!r} is not in SHARD_DATABASES")
+    source = shard_for_clinic(clinic_id)
+    if source == target:
+        return {}
+    patients = list(Patient.objects.using(DEFAULT_DB_ALIAS).filter(clinic_id=clinic_id).order_by("pk"))
+    patient_ids = [p.pk for p in patients]
+    counts = {}
+    switched = False
+
+    @write_transaction(using=source)
+    def move():
+        nonlocal switched
+        with transaction.atomic(using=target):
+            _delete_clinic_rows(target, patient_ids)  # leftovers of an interrupted move
+            if target != DEFAULT_DB_ALIAS:
+                Patient.objects.using(target).bulk_create(
+                    [Patient(pk=p.pk, clinic_id=p.clinic_id, display_name=p.display_name) for p in patients],
+                )
+            for model, filters in _clinic_rows(patient_ids):
+                qs = model._base_manager.using(source).filter(**filters)
+                counts[model._meta.model_name] = _copy_rows(model, qs, target, batch_size)
+        set_clinic_shard(clinic_id, target)
+        switched = True
+        _delete_clinic_rows(source, patient_ids)
+
+    set_clinic_shard(clinic_id, source, moving=True)
+    try:
+        time.sleep(getattr(settings, "SHARD_MAP_CACHE_SECONDS", 60) if settle is None else settle)
+        move()
+    except BaseException:
+        if not switched:
+            set_clinic_shard(clinic_id, source)
+        raise
+    return counts
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_generation
+from .events import publish_event
+from .models import AuditLog, Comment, CommentThread, Entry, Highlight, HighlightWatermark, Patient, VersionSnapshot
+from .sharding import assign_ids, mirror_patient, sharding_enabled
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+@receiver(post_save, sender=Highlight)
+@receiver(post_delete, sender=Highlight)
+def bump_patient_generation(sender, instance, **kwargs):
+    bump_generation(instance.patient_id)
+
+
+@receiver(post_save, sender=Entry)
+def announce_new_entry(sender, instance, created, **kwargs):
+    if created:
+        kind = "summary.generated" if instance.type.startswith("ai_") else "entry.created"
+        publish_event(instance.patient_id, kind, entry_id=instance.id, entry_type=instance.type)
+
+
+@receiver(pre_save, sender=Entry)
+@receiver(pre_save, sender=VersionSnapshot)
+@receiver(pre_save, sender=Highlight)
+@receiver(pre_save, sender=HighlightWatermark)
+@receiver(pre_save, sender=CommentThread)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=AuditLog)
+def assign_shard_id(sender, instance, raw=False, **kwargs):
+    # ids of sharded rows must be unique across shards; bulk_create: ShardedQuerySet
+    if not raw:
+        assign_ids(sender, [instance])
+
+
+@receiver(post_save, sender=Patient)
+def mirror_patient_to_shard(sender, instance, raw=False, **kwargs):
+    if sharding_enabled() and not raw and kwargs.get("using") == "default":
+        mirror_patient(instance)
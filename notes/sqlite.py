@@ -0,0 +1,92 @@
+"""
+SQLite connection profile and write transactions.
+
+apply_pragmas() runs for every new SQLite connection (connection_created, wired
+in apps.py) with settings.SQLITE_PRAGMAS. In WAL mode readers keep reading the
+last committed state while a writer works, and busy_timeout makes a connection
+wait for a lock instead of failing at once.
+
+@write_transaction is transaction.atomic for blocks that write: the outermost
+transaction starts with BEGIN IMMEDIATE, which takes the write lock up front.
+A deferred BEGIN that reads first and writes later cannot wait for the lock
+(SQLite answers "database is locked" immediately rather than risk a deadlock).
+If the lock is still held elsewhere after busy_timeout, the whole block is
+retried with bounded, jittered exponential backoff.
+
+Settings:
+    SQLITE_PRAGMAS         {pragma: value}, applied in order
+    SQLITE_WRITE_RETRIES   extra attempts after a locked BEGIN IMMEDIATE (default 5)
+    SQLITE_WRITE_BACKOFF   first backoff in seconds, doubled per retry up to 1s (default 0.05)
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+MAX_BACKOFF = 1.0
+
+
+def apply_pragmas(sender, connection, **kwargs) -> None:
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None) or {}
+    with connection.cursor() as cur:
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name} = {value}")
+
+
+def pragma(name: str, using: str = DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cur:
+        cur.execute(f"PRAGMA {name}")
+        return cur.fetchone()[0]
+
+
+def is_locked(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and "locked" in str(exc)
+
+
+@contextmanager
+def _begin_immediate(conn):
+    # Django 4.2 opens SQLite transactions with a plain BEGIN and has no
+    # OPTIONS["transaction_mode"] (added in 5.1): swap the statement for this block
+    conn._start_transaction_under_autocommit = lambda: conn.cursor().execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    finally:
+        del conn._start_transaction_under_autocommit
+
+
+def write_transaction(func=None, *, using: str = None):
+    """
+    Decorator: run func in an atomic block that starts as BEGIN IMMEDIATE, retried while locked.
+    using=None: the clinic shard active when func is called (sharding.current_shard()).
+    """
+    if func is None:
+        return lambda f: write_transaction(f, using=using)
+
+    @wraps(func)
+    def inner(*args, **kwargs):
+        from .sharding import current_shard
+        alias = using or current_shard()
+        conn = connections[alias]
+        if conn.vendor != "sqlite" or conn.in_atomic_block:
+            # nested: the outer block already chose how the transaction started
+            with transaction.atomic(using=alias):
+                return func(*args, **kwargs)
+
+        retries = getattr(settings, "SQLITE_WRITE_RETRIES", 5)
+        delay = getattr(settings, "SQLITE_WRITE_BACKOFF", 0.05)
+        for attempt in range(retries + 1):
+            try:
+                with _begin_immediate(conn), transaction.atomic(using=alias):
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_locked(exc) or attempt == retries:
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, MAX_BACKOFF)
+
+    return inner
@@ -0,0 +1,99 @@
+"""
+Patient session summaries.
+
+The summary is built by the configured summarizer backend (notes/summarizers.py)
+from the patient's most recent entries. Its provenance pointer is a hash of
+exactly those inputs (entry ids + updated_at) and the backend, so regenerating
+for an unchanged timeline finds the existing summary and returns it without
+calling the backend or writing anything.
+"""
+import hashlib
+from typing import List, Optional, Tuple
+
+from django.db import transaction
+
+from .audit import record_audit
+from .models import Entry, Patient
+from .sharding import current_shard, use_patient
+from .summarizers import get_summarizer
+
+SUMMARY_TYPE = "ai_patient_session_summary"
+RECENT_ENTRIES = 5
+
+
+def _noop_progress(pct: int, note: str = "") -> None:
+    pass
+
+
+def summary_inputs(patient: Patient) -> List[Entry]:
+    """The entries a summary is built from, oldest first."""
+    recent = list(
+        Entry.objects.filter(patient=patient)
+        .exclude(type=SUMMARY_TYPE)
+        .only("id", "type", "content", "created_at", "updated_at")
+        .order_by("-created_at", "-id")[:RECENT_ENTRIES]
+    )
+    recent.reverse()
+    return recent
+
+
+def summary_pointer(entries: List[Entry], backend) -> str:
+    digest = hashlib.sha256(backend.memo_key.encode())
+    for e in entries:
+        digest.update(f"|{e.id}:{e.updated_at.isoformat()}".encode())
+    return f"session:{digest.hexdigest()[:32]}"
+
+
+def _summary_for(patient: Patient, pointer: str) -> Optional[Entry]:
+    return Entry.objects.filter(patient=patient, type=SUMMARY_TYPE, provenance_pointer=pointer).first()
+
+
+def memoized_summary(patient: Patient) -> Optional[Entry]:
+    """The current summary if it was built from the patient's current inputs by the configured backend."""
+    return _summary_for(patient, summary_pointer(summary_inputs(patient), get_summarizer()))
+
+
+def generate_patient_summary(patient: Patient, actor, progress=_noop_progress) -> Tuple[Entry, bool]:
+    """
+    Replace the patient's session summary with one built from the latest entries.
+    Returns (entry, cached); cached means the current summary already covered them.
+    """
+    backend = get_summarizer()
+    progress(10, "collecting entries")
+    recent = summary_inputs(patient)
+    pointer = summary_pointer(recent, backend)
+    existing = _summary_for(patient, pointer)
+    if existing is not None:
+        return existing, True
+
+    progress(40, "generating summary")
+    summary = backend.summarize([
+        {"id": e.id, "type": e.type, "content": e.content, "created_at": e.created_at.isoformat()}
+        for e in recent
+    ])
+
+    progress(90, "saving")
+    with transaction.atomic(using=current_shard()):
+        Entry.objects.filter(patient=patient, type=SUMMARY_TYPE).delete()
+        e = Entry.objects.create(
+            patient=patient,
+            author=None,
+            author_role="system",
+            type=SUMMARY_TYPE,
+            provenance_pointer=pointer,
+            content=summary,
+        )
+        record_audit(
+            patient_id=patient.id,
+            actor=actor,
+            action="generate_patient_summary_mock",
+            meta={"entry_id": e.id, "backend": backend.memo_key},
+        )
+    return e, False
+
+
+def run_patient_summary_job(job, progress) -> dict:
+    # BackgroundJob handler (notes/jobs.py)
+    with use_patient(job.patient):
+        e, cached = generate_patient_summary(job.patient, job.requested_by, progress)
+    return {"entry_id": e.id, "provenance_pointer": e.provenance_pointer, "cached": cached}
@@ -0,0 +1,85 @@
+"""
+Local stand-in for a summarization service, speaking HTTPSummarizer's protocol.
+
+    python manage.py run_summarizer_stub --port 8765 --delay 0.5
+
+Also used by the tests: start() runs it on a free port in a background thread;
+delay/status can be changed on the fly and the counters show how it was called.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .summarizers import MockSummarizer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection reuse is observable
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with stub.lock:
+            stub.requests += 1
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+        try:
+            if stub.delay:
+                time.sleep(stub.delay)
+            if stub.status != 200:
+                self._reply(stub.status, {"detail": "stub failure"})
+                return
+            try:
+                entries = json.loads(body)["entries"]
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, {"detail": "expected {\"entries\": [...]}"})
+                return
+            self._reply(200, {"summary": MockSummarizer().summarize(entries).replace("Mock AI", "Stub AI")})
+        finally:
+            with stub.lock:
+                stub.in_flight -= 1
+
+    def _reply(self, status: int, data: dict) -> None:
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.stub.verbose:
+            super().log_message(format, *args)
+
+
+class StubSummarizerServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, status: int = 200,
+                 verbose: bool = False):
+        self.delay = delay
+        self.status = status
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = self.connections = self.in_flight = self.max_in_flight = 0
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/summarize"
+
+    def start(self) -> "StubSummarizerServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
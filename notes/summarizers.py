@@ -0,0 +1,213 @@
+"""
+Summarizer backends for patient summaries (notes/summaries.py).
+
+A backend turns a patient's recent entries into summary text:
+    backend.summarize(entries) -> str
+entries are dicts {"id", "type", "content", "created_at"}, oldest first.
+backend.memo_key identifies what it would produce, so memoized summaries of one
+backend are never served for another.
+
+Settings:
+    SUMMARIZER_BACKEND  dotted path, default "notes.summarizers.MockSummarizer"
+    SUMMARIZER_OPTIONS  keyword arguments for the backend, e.g. for HTTPSummarizer
+                        {"url": "http://127.0.0.1:8765/summarize", "timeout": 10.0,
+                         "max_concurrency": 4, "failure_threshold": 5, "reset_timeout": 30.0}
+"""
+import http.client
+import json
+import queue
+import threading
+import time
+from typing import List
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class SummarizerError(Exception):
+    pass
+
+
+class SummarizerUnavailable(SummarizerError):
+    """Rejected without calling the service: circuit open or concurrency limit reached."""
+
+
+class MockSummarizer:
+    memo_key = "mock"
+
+    def __init__(self, **options):
+        pass
+
+    def summarize(self, entries: List[dict]) -> str:
+        bullets = [f"- ({e['type']}) {e['content'][:80]}" for e in entries]
+        return (
+            "Patient Summary (Mock AI)\n"
+            "What happened:\n" + "\n".join(bullets) + "\n\n"
+            "Next steps:\n- Monitor symptoms\n- Follow clinician advice\n"
+        )
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; while open, calls
+    are rejected until reset_timeout has passed, then one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_timeout else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return
+            raise SummarizerUnavailable("summarizer circuit is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures, self.opened_at, self._trial = 0, None, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at, self._trial = self.clock(), False
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, reused across calls and threads."""
+
+    def __init__(self, url: str, size: int, timeout: float):
+        parts = urlsplit(url)
+        conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.new = lambda: conn_class(parts.hostname, parts.port, timeout=timeout)
+        self._idle = queue.LifoQueue(size)
+
+    def acquire(self):
+        """-> (connection, reused)"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.new(), False
+
+    def release(self, conn) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HTTPSummarizer:
+    """
+    POST {"entries": [...]} as JSON to url, expects {"summary": "..."}.
+    At most max_concurrency calls are in flight per process; callers wait up to
+    acquire_timeout for a slot, then get SummarizerUnavailable. timeout applies to
+    connecting and to each socket read. Network errors, timeouts and 5xx responses
+    count towards the circuit breaker.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, max_concurrency: int = 4, acquire_timeout: float = 5.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, headers=None):
+        self.url = url
+        self.path = urlsplit(url).path or "/"
+        self.memo_key = f"http:{url}"
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.acquire_timeout = acquire_timeout
+        self.pool = ConnectionPool(url, size=max_concurrency, timeout=timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def summarize(self, entries: List[dict]) -> str:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise SummarizerUnavailable("summarizer concurrency limit reached")
+        try:
+            self.breaker.before_call()
+            try:
+                status, body = self._post(json.dumps({"entries": entries}).encode())
+            except Exception as exc:
+                self.breaker.record_failure()
+                raise SummarizerError(f"summarizer request failed: {exc!r}") from exc
+        finally:
+            self._slots.release()
+
+        if status >= 500:
+            self.breaker.record_failure()
+            raise SummarizerError(f"summarizer returned {status}")
+        # a 4xx is our request's fault, not the service's health
+        self.breaker.record_success()
+        if status != 200:
+            raise SummarizerError(f"summarizer returned {status}")
+        try:
+            return json.loads(body)["summary"]
+        except (ValueError, KeyError, TypeError):
+            raise SummarizerError("summarizer returned an invalid body")
+
+    def _post(self, payload: bytes):
+        conn, reused = self.pool.acquire()
+        try:
+            conn.request("POST", self.path, body=payload, headers=self.headers)
+            resp = conn.getresponse()
+        except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine):
+            conn.close()
+            if not reused:
+                raise
+            # the server closed an idle keep-alive connection; retry once on a fresh one
+            conn = self.pool.new()
+            try:
+                conn.request("POST", self.path, body=payload, headers=self.headers)
+                resp = conn.getresponse()
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        try:
+            body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.release(conn)
+        return resp.status, body
+
+
+_lock = threading.Lock()
+_backends = {}
+
+
+def get_summarizer():
+    """The configured backend; one shared instance (pool, breaker) per configuration."""
+    path = getattr(settings, "SUMMARIZER_BACKEND", "notes.summarizers.MockSummarizer")
+    options = getattr(settings, "SUMMARIZER_OPTIONS", None) or {}
+    key = (path, json.dumps(options, sort_keys=True, default=str))
+    with _lock:
+        if key not in _backends:
+            _backends[key] = import_string(path)(**options)
+        return _backends[key]
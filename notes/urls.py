@@ -1,12 +1,26 @@
 from django.urls import path
-from .views import CareNoteView, EntryEditView, EntryVersionsView, EntryRevertView, GenerateHighlightsView, HighlightStatusView, GenerateMockPatientSummaryView
+from .views import CareNoteView, EntryEditView, EntryVersionsView, EntryDiffView, EntryRevertView, GenerateHighlightsView, HighlightStatusView, GenerateMockPatientSummaryView, JobStatusView, ClinicHighlightBatchView, HighlightBatchRunView, PatientExportView, EntryIngestView, AuditLogView, AdmissionMetricsView, SearchView, care_note_events, EntryThreadsView, ThreadCommentsView, ThreadResolveView
 
 urlpatterns = [
+    path("search/", SearchView.as_view(), name="search"),
     path("patients/<int:patient_id>/care-note/", CareNoteView.as_view(), name="care_note"),
     path("patients/<int:patient_id>/highlights/generate/", GenerateHighlightsView.as_view(), name="gen_highlights"),
     path("entries/<int:entry_id>/edit/", EntryEditView.as_view(), name="entry_edit"),
     path("entries/<int:entry_id>/versions/", EntryVersionsView.as_view(), name="entry_versions"),
+    path("entries/<int:entry_id>/diff/<int:a>/<int:b>/", EntryDiffView.as_view(), name="entry_diff"),
     path("entries/<int:entry_id>/revert/<int:version>/", EntryRevertView.as_view(), name="entry_revert"),
+    path("entries/<int:entry_id>/threads/", EntryThreadsView.as_view(), name="entry_threads"),
+    path("threads/<int:thread_id>/comments/", ThreadCommentsView.as_view(), name="thread_comments"),
+    path("threads/<int:thread_id>/resolve/", ThreadResolveView.as_view(resolved=True), name="thread_resolve"),
+    path("threads/<int:thread_id>/unresolve/", ThreadResolveView.as_view(resolved=False), name="thread_unresolve"),
     path("highlights/<int:highlight_id>/status/", HighlightStatusView.as_view(), name="highlight_status"),
+    path("patients/<int:patient_id>/events/", care_note_events, name="care_note_events"),
+    path("patients/<int:patient_id>/export/", PatientExportView.as_view(), name="patient_export"),
     path("patients/<int:patient_id>/ai/patient-summary-mock/", GenerateMockPatientSummaryView.as_view(), name="mock_patient_summary"),
+    path("jobs/<int:job_id>/", JobStatusView.as_view(), name="job_status"),
+    path("admin/clinics/<str:clinic_id>/highlights/generate/", ClinicHighlightBatchView.as_view(), name="clinic_highlight_batch"),
+    path("admin/entries/ingest/", EntryIngestView.as_view(), name="entry_ingest"),
+    path("admin/audit/", AuditLogView.as_view(), name="audit_log"),
+    path("admin/admission/", AdmissionMetricsView.as_view(), name="admission_metrics"),
+    path("admin/highlight-runs/<int:run_id>/", HighlightBatchRunView.as_view(), name="highlight_batch_run"),
 ]
@@ -0,0 +1,144 @@
+import json
+import re
+from difflib import SequenceMatcher
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from django.conf import settings
+
+# a delta is a list of ops applied to the previous version's text:
+#   [start, end] -> copy prev[start:end]
+#   "text"       -> insert literal text
+DeltaOp = Union[List[int], str]
+
+_TOKEN_RE = re.compile(r"\s+|\S+")
+
+
+def keyframe_interval() -> int:
+    return max(1, int(getattr(settings, "VERSION_KEYFRAME_INTERVAL", 10)))
+
+
+def make_delta(prev: str, new: str) -> List[DeltaOp]:
+    # word-level diff; copies are stored as character ranges so rebuilding is plain slicing
+    a, b = _TOKEN_RE.findall(prev), _TOKEN_RE.findall(new)
+    offsets = [0]
+    for tok in a:
+        offsets.append(offsets[-1] + len(tok))
+
+    ops: List[DeltaOp] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def apply_delta(prev: str, ops: Iterable[DeltaOp]) -> str:
+    return "".join(op if isinstance(op, str) else prev[op[0]:op[1]] for op in ops)
+
+
+def encode_snapshot(version: int, prev_content, new_content: str, interval: int = None) -> dict:
+    """
+    VersionSnapshot storage fields for `version`: a full keyframe every `interval`
+    versions (and whenever the delta would not be smaller), otherwise a delta
+    against the previous version's content.
+    """
+    interval = interval or keyframe_interval()
+    if prev_content is None or version == 1 or (version - 1) % interval == 0:
+        return {"is_keyframe": True, "content": new_content, "delta": None}
+    ops = make_delta(prev_content, new_content)
+    if len(json.dumps(ops)) >= len(new_content):
+        return {"is_keyframe": True, "content": new_content, "delta": None}
+    return {"is_keyframe": False, "content": "", "delta": ops}
+
+
+def rebuild_sequence(rows: Iterable[Tuple[int, bool, str, list]]) -> Iterator[Tuple[int, str]]:
+    """(version, is_keyframe, content, delta) rows in version order -> (version, full content)."""
+    text = None
+    for version, is_keyframe, content, delta in rows:
+        if is_keyframe:
+            text = content
+        elif text is None:
+            raise ValueError("delta without keyframe")
+        else:
+            text = apply_delta(text, delta)
+        yield version, text
+
+
+def _rebuild_chain(entry, version: int) -> List[Tuple[int, str]]:
+    """(version, full content) from the nearest keyframe at or below version up to it; [] if there is none."""
+    keyframe = (
+        entry.versions.filter(version__lte=version, is_keyframe=True)
+        .order_by("-version")
+        .values_list("version", flat=True)
+        .first()
+    )
+    if keyframe is None:
+        return []
+    rows = (
+        entry.versions.filter(version__gte=keyframe, version__lte=version)
+        .order_by("version")
+        .values_list("version", "is_keyframe", "content", "delta")
+    )
+    return list(rebuild_sequence(rows))
+
+
+def rebuild_version(entry, version: int) -> str:
+    """Full content of one version: nearest keyframe at or below it plus the deltas in between."""
+    chain = _rebuild_chain(entry, version)
+    if not chain or chain[-1][0] != version:
+        raise ValueError("version_not_found")
+    return chain[-1][1]
+
+
+def rebuild_versions(entry, versions: Iterable[int]) -> dict:
+    """
+    version -> full content for just these versions (missing ones left out), each
+    from its nearest keyframe; one chain serves versions that share a keyframe.
+    """
+    wanted = set(versions)
+    contents = {}
+    for version in sorted(wanted, reverse=True):
+        if version not in contents:
+            contents.update((v, text) for v, text in _rebuild_chain(entry, version) if v in wanted)
+    return contents
+
+
+def rebuild_range(entry, lo: int, hi: int) -> dict:
+    """version -> full content for versions lo..hi, starting from the keyframe at or below lo."""
+    keyframe = (
+        entry.versions.filter(version__lte=lo, is_keyframe=True)
+        .order_by("-version")
+        .values_list("version", flat=True)
+        .first()
+    )
+    if keyframe is None:
+        return {}
+    rows = (
+        entry.versions.filter(version__gte=keyframe, version__lte=hi)
+        .order_by("version")
+        .values_list("version", "is_keyframe", "content", "delta")
+    )
+    return {v: text for v, text in rebuild_sequence(rows) if v >= lo}
+
+
+def diff_texts(a: str, b: str, mode: str = "line") -> List[dict]:
+    """
+    [{"op": "equal"|"delete"|"insert", "text": ...}, ...] turning a into b.
+    mode: "line" (keeps line endings) or "word".
+    """
+    if mode == "line":
+        ta, tb = a.splitlines(keepends=True), b.splitlines(keepends=True)
+    else:
+        ta, tb = _TOKEN_RE.findall(a), _TOKEN_RE.findall(b)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, ta, tb, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append({"op": "equal", "text": "".join(ta[i1:i2])})
+            continue
+        if i2 > i1:
+            ops.append({"op": "delete", "text": "".join(ta[i1:i2])})
+        if j2 > j1:
+            ops.append({"op": "insert", "text": "".join(tb[j1:j2])})
+    return ops
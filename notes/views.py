@@ -4,15 +4,28 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 
 from .models import Patient
-from .serializers import EntrySerializer, HighlightSerializer
+from .serializers import HighlightSerializer
+from .fast_serializers import (
+    ENTRY_COLUMNS, ENTRY_FIELDS, TIMELINE_COLUMNS, TIMELINE_FIELDS, entry_row_key, serialize_entry_rows,
+    serialize_highlights,
+)
 from .rbac import filter_patient_queryset, filter_highlights_queryset
+from .pagination import keyset_page, parse_limit
+from .caching import care_note_etag, etag_matches, get_cached_care_note, role_view, set_cached_care_note
+from .comments import with_comment_counts
 
 
 class CareNoteView(APIView):
     """
-    GET /api/patients/{patient_id}/care-note/
-    returns: glance(highlights) + timeline(entries)
+    GET /api/patients/{patient_id}/care-note/?limit=<n>&cursor=<opaque>
+    returns: glance(highlights) + timeline(entries), newest first.
+    glance is only included on the first page (no cursor);
+    pass next_cursor back to fetch older entries.
+    non-patient timeline entries carry open_threads and comment_count.
     """
+    # patient, timeline page, glance highlights; 1 on a 304 / cache hit
+    query_budget = 3
+    replica_reads = True
     def get(self, request, patient_id: int):
         patient = get_object_or_404(Patient, id=patient_id)
 
@@ -22,22 +35,70 @@ class CareNoteView(APIView):
         except PermissionError as e:
             return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
 
-        timeline = EntrySerializer(entries_qs, many=True).data
-        highlights = HighlightSerializer(hl_qs, many=True).data
-
-        glance = {
-            "patient_display_name": patient.display_name,
-            "highlights": highlights,
+        cursor = request.query_params.get("cursor")
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # strong ETag from the patient's write generation: unchanged care notes cost no ORM work
+        view = role_view(request.user)
+        params = f"{limit}|{cursor or ''}"
+        headers = {"ETag": care_note_etag(patient, view, params), "Cache-Control": "private, no-cache"}
+        if etag_matches(request, headers["ETag"]):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        payload = get_cached_care_note(patient, view, params)
+        if payload is not None:
+            return Response(payload, headers=headers)
+
+        # comment counts are subqueries of the timeline query, not a query per entry
+        if view == "patient":
+            fields, rows_qs = ENTRY_FIELDS, entries_qs.values_list(*ENTRY_COLUMNS)
+        else:
+            fields, rows_qs = TIMELINE_FIELDS, with_comment_counts(entries_qs).values_list(*TIMELINE_COLUMNS)
+        try:
+            rows, next_cursor = keyset_page(rows_qs, cursor, limit, key=entry_row_key)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = {
+            "patient_id": patient.id,
+            "timeline": serialize_entry_rows(rows, fields),
+            "next_cursor": next_cursor,
         }
-        return Response({"patient_id": patient.id, "glance": glance, "timeline": timeline})
+        if not cursor:
+            payload["glance"] = {
+                "patient_display_name": patient.display_name,
+                "highlights": serialize_highlights(hl_qs),
+            }
+        set_cached_care_note(patient, view, params, payload)
+        return Response(payload, headers=headers)
 
 from rest_framework.permissions import IsAuthenticated
 from .models import Entry
 from .permissions import CanEditEntry
-from .editing import get_latest_version, snapshot_and_update_entry, revert_entry_to_version
-from .serializers import VersionSnapshotSerializer
+from .editing import VersionConflict, snapshot_and_update_entry, revert_entry_to_version
+from .serializers import VersionSnapshotMetaSerializer, VersionSnapshotSerializer
+from .versioning import diff_texts, rebuild_range, rebuild_versions
+from .rbac import check_entry_access
+
+
+def parse_if_match(request):
+    expected = request.headers.get("If-Match")
+    if expected is None:
+        return None
+    return int(expected.strip().strip('"'))
+
+
+def version_conflict_response(exc: VersionConflict):
+    return Response(
+        {"detail": "Version conflict", "current_version": exc.current_version},
+        status=status.HTTP_409_CONFLICT
+    )
 
 class EntryEditView(APIView):
+    query_budget = 5
     permission_classes = [IsAuthenticated, CanEditEntry]
 
     def post(self, request, entry_id: int):
@@ -51,31 +112,107 @@ class EntryEditView(APIView):
             return Response({"detail": "content required"}, status=status.HTTP_400_BAD_REQUEST)
 
         # optimistic concurrency: If-Match: <version>
-        expected = request.headers.get("If-Match")
-        current = get_latest_version(entry)
-        if expected is not None:
-            try:
-                expected_v = int(expected)
-            except ValueError:
-                return Response({"detail": "Invalid If-Match"}, status=status.HTTP_400_BAD_REQUEST)
-            if expected_v != current:
-                return Response(
-                    {"detail": "Version conflict", "current_version": current},
-                    status=status.HTTP_409_CONFLICT
-                )
-
-        new_ver = snapshot_and_update_entry(entry, new_content, request.user)
+        try:
+            expected_v = parse_if_match(request)
+        except ValueError:
+            return Response({"detail": "Invalid If-Match"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            new_ver = snapshot_and_update_entry(entry, new_content, request.user, expected_version=expected_v)
+        except VersionConflict as e:
+            return version_conflict_response(e)
         return Response({"entry_id": entry.id, "new_version": new_ver})
 
 class EntryVersionsView(APIView):
+    """
+    GET /api/entries/{entry_id}/versions/?limit=<n>&cursor=<version>&include=content
+    newest first; metadata only unless include=content.
+    pass next_cursor back to fetch older versions.
+    """
+    # entry, page; include=content adds the keyframe lookup and the rebuilt range
+    query_budget = 4
+    replica_reads = True
     permission_classes = [IsAuthenticated]
 
     def get(self, request, entry_id: int):
-        entry = get_object_or_404(Entry, id=entry_id)
-        qs = entry.versions.order_by("-version")
-        return Response({"entry_id": entry.id, "versions": VersionSnapshotSerializer(qs, many=True).data})
+        entry = get_object_or_404(Entry.objects.select_related("patient"), id=entry_id)
+        try:
+            check_entry_access(request.user, entry)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+            cursor = request.query_params.get("cursor")
+            before = int(cursor) if cursor else None
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        with_content = request.query_params.get("include") == "content"
+
+        # entry is a "known related object" of entry.versions: deferring it costs a query per row
+        qs = entry.versions.order_by("-version").only("id", "entry", "version", "created_at", "changed_by")
+        if before is not None:
+            qs = qs.filter(version__lt=before)
+        snaps = list(qs[: limit + 1])
+        next_cursor = None
+        if len(snaps) > limit:
+            snaps = snaps[:limit]
+            next_cursor = str(snaps[-1].version)
+
+        serializer_class = VersionSnapshotMetaSerializer
+        if with_content and snaps:
+            contents = rebuild_range(entry, snaps[-1].version, snaps[0].version)
+            for snap in snaps:
+                snap.full_content = contents[snap.version]
+            serializer_class = VersionSnapshotSerializer
+
+        return Response({
+            "entry_id": entry.id,
+            "current_version": entry.current_version,
+            "versions": serializer_class(snaps, many=True).data,
+            "next_cursor": next_cursor,
+        })
+
+
+class EntryDiffView(APIView):
+    """
+    GET /api/entries/{entry_id}/diff/{a}/{b}/?mode=line|word
+    server-side diff of version a -> version b.
+    """
+    # entry, then keyframe + deltas for each version (once if they share a keyframe)
+    query_budget = 5
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, entry_id: int, a: int, b: int):
+        entry = get_object_or_404(Entry.objects.select_related("patient"), id=entry_id)
+        try:
+            check_entry_access(request.user, entry)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        mode = request.query_params.get("mode", "line")
+        if mode not in {"line", "word"}:
+            return Response({"detail": "mode must be line/word"}, status=status.HTTP_400_BAD_REQUEST)
+
+        contents = rebuild_versions(entry, (a, b))
+        if a not in contents or b not in contents:
+            return Response({"detail": "version not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        ops = diff_texts(contents[a], contents[b], mode)
+        return Response({
+            "entry_id": entry.id,
+            "from_version": a,
+            "to_version": b,
+            "mode": mode,
+            "ops": ops,
+            "stats": {
+                "inserted": sum(len(o["text"]) for o in ops if o["op"] == "insert"),
+                "deleted": sum(len(o["text"]) for o in ops if o["op"] == "delete"),
+            },
+        })
 
 class EntryRevertView(APIView):
+    query_budget = 7
     permission_classes = [IsAuthenticated, CanEditEntry]
 
     def post(self, request, entry_id: int, version: int):
@@ -83,7 +220,14 @@ class EntryRevertView(APIView):
         self.check_object_permissions(request, entry)
 
         try:
-            new_ver = revert_entry_to_version(entry, version, request.user)
+            expected_v = parse_if_match(request)
+        except ValueError:
+            return Response({"detail": "Invalid If-Match"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            new_ver = revert_entry_to_version(entry, version, request.user, expected_version=expected_v)
+        except VersionConflict as e:
+            return version_conflict_response(e)
         except ValueError:
             return Response({"detail": "version not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -93,8 +237,22 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Highlight
 from .serializers import HighlightSerializer
 from .highlights import generate_rule_based_highlights
+from .replicas import stick_to_primary
+from .admission import ADMISSION_QUERIES, AdmissionRejected, admit
+
+
+def too_many_requests(exc: AdmissionRejected):
+    return Response(
+        {"detail": str(exc), "reason": exc.reason},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 class GenerateHighlightsView(APIView):
+    # full mode over one 500-entry chunk whose highlights fit one bulk INSERT (SQLite: 999 parameters,
+    # 99 highlight rows); each further chunk or INSERT batch adds queries. + ADMISSION_QUERIES when
+    # admission state is in the database cache
+    query_budget = 12 + ADMISSION_QUERIES
     permission_classes = [IsAuthenticated]
 
     def post(self, request, patient_id: int):
@@ -107,22 +265,35 @@ class GenerateHighlightsView(APIView):
         if request.user.role != "admin" and request.user.clinic_id and request.user.clinic_id != patient.clinic_id:
             return Response({"detail": "Cross-clinic access denied"}, status=status.HTTP_403_FORBIDDEN)
 
-        # for MVP: regenerate by clearing old suggested highlights
-        Highlight.objects.filter(patient=patient).delete()
+        # incremental by default: only entries changed since the last run are rescanned,
+        # review decisions survive; ?mode=full clears and rebuilds everything
+        mode = request.query_params.get("mode", "incremental")
+        if mode not in {"incremental", "full"}:
+            return Response({"detail": "mode must be incremental/full"}, status=status.HTTP_400_BAD_REQUEST)
 
-        hs = generate_rule_based_highlights(patient, request.user)
-        return Response({"created": len(hs), "highlights": HighlightSerializer(hs, many=True).data})
+        # per-clinic token bucket + in-flight limit (notes/admission.py)
+        try:
+            admission = admit(patient.clinic_id)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        with admission:
+            hs = generate_rule_based_highlights(patient, request.user, incremental=(mode == "incremental"))
+        stick_to_primary(request.user)
+        return Response({"created": len(hs), "mode": mode, "highlights": HighlightSerializer(hs, many=True).data})
 
-from .models import Highlight, AuditLog
+from .models import Highlight
+from .audit import record_audit
+from .events import publish_event
 
 class HighlightStatusView(APIView):
+    query_budget = 4
     permission_classes = [IsAuthenticated]
 
     def post(self, request, highlight_id: int):
         if request.user.role == "patient":
             return Response({"detail": "patient cannot change highlight status"}, status=status.HTTP_403_FORBIDDEN)
 
-        h = get_object_or_404(Highlight, id=highlight_id)
+        h = get_object_or_404(Highlight.objects.select_related("patient"), id=highlight_id)
         patient = h.patient
 
         if request.user.role != "admin" and request.user.clinic_id and request.user.clinic_id != patient.clinic_id:
@@ -138,19 +309,37 @@ class HighlightStatusView(APIView):
         old = h.status
         h.status = new_status
         h.save(update_fields=["status"])
+        stick_to_primary(request.user)
 
-        AuditLog.objects.create(
-            patient=patient,
+        record_audit(
+            patient_id=patient.id,
             actor=request.user,
             action="set_highlight_status",
             meta={"highlight_id": h.id, "from": old, "to": new_status},
         )
+        publish_event(patient.id, "highlight.status", highlight_id=h.id, entry_id=h.entry_id, **{"from": old, "to": new_status})
 
         return Response({"highlight_id": h.id, "status": h.status})
-import uuid
-from .models import Entry
+from django.urls import reverse
+from .jobs import enqueue, summary_dedup_key
+from .models import BackgroundJob
+from .serializers import BackgroundJobSerializer
+from .summaries import memoized_summary
 
 class GenerateMockPatientSummaryView(APIView):
+    """
+    POST /api/patients/{patient_id}/ai/patient-summary-mock/
+    returns 200 + the current summary if it was built from the patient's current
+    entries (notes/summaries.py); otherwise queues generation (run by
+    `manage.py run_jobs`) and returns 202 + job id. While a job for the patient is
+    queued or running, further requests join it. Poll the Location
+    (GET /api/jobs/{id}/) for progress. Admission-controlled per clinic like
+    highlight generation: 429 + Retry-After when the clinic is over its limits.
+    The in-flight slot covers this request only (memo check + enqueue); the job
+    itself runs later, bounded by the run_jobs workers.
+    """
+    # patient, summary inputs, memoized summary, active-job lookup, insert (+ admission)
+    query_budget = 5 + ADMISSION_QUERIES
     permission_classes = [IsAuthenticated]
 
     def post(self, request, patient_id: int):
@@ -161,33 +350,494 @@ class GenerateMockPatientSummaryView(APIView):
         if request.user.role != "admin" and request.user.clinic_id and request.user.clinic_id != patient.clinic_id:
             return Response({"detail": "Cross-clinic access denied"}, status=status.HTTP_403_FORBIDDEN)
 
-        # 使用最近几条记录拼一个“像 AI 的”摘要
-        Entry.objects.filter(patient=patient, type="ai_patient_session_summary").delete()
-        recent = Entry.objects.filter(patient=patient).exclude(type="ai_patient_session_summary").order_by("-created_at")[:5]
+        try:
+            admission = admit(patient.clinic_id)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        with admission:
+            summary = memoized_summary(patient)
+            if summary is not None:
+                return Response({"entry_id": summary.id, "provenance_pointer": summary.provenance_pointer, "cached": True})
+
+            job, created = enqueue(
+                "patient_summary", summary_dedup_key(patient.id), patient=patient,
+                requested_by_id=getattr(request.user, "pk", None),
+            )
+        return Response(
+            {"job_id": job.id, "status": job.status, "joined": not created},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("job_status", args=[job.id])},
+        )
 
-        bullets = []
-        for e in reversed(list(recent)):
-            bullets.append(f"- ({e.type}) {e.content[:80]}")
 
-        summary = (
-            "Patient Summary (Mock AI)\n"
-            "What happened:\n" + "\n".join(bullets) + "\n\n"
-            "Next steps:\n- Monitor symptoms\n- Follow clinician advice\n"
-        )
+class JobStatusView(APIView):
+    # job + its patient
+    query_budget = 1
+    permission_classes = [IsAuthenticated]
 
-        prov = f"session:{uuid.uuid4().hex}"
-        e = Entry.objects.create(
-            patient=patient,
-            author=None,
-            author_role="system",
-            type="ai_patient_session_summary",
-            provenance_pointer=prov,
-            content=summary,
-        )
-        AuditLog.objects.create(
-            patient=patient,
+    def get(self, request, job_id: int):
+        if request.user.role == "patient":
+            return Response({"detail": "patient cannot view jobs"}, status=status.HTTP_403_FORBIDDEN)
+        job = get_object_or_404(BackgroundJob.objects.select_related("patient"), id=job_id)
+        if (
+            request.user.role != "admin"
+            and request.user.clinic_id
+            and job.patient is not None
+            and request.user.clinic_id != job.patient.clinic_id
+        ):
+            return Response({"detail": "Cross-clinic access denied"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(BackgroundJobSerializer(job).data)
+
+import logging
+import threading
+from django.db import connection
+from .batch import RunInProgress, execute_run, start_run
+from .models import HighlightBatchRun
+from .serializers import HighlightBatchRunSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _run_batch_in_background(run_id: int, **opts):
+    try:
+        execute_run(HighlightBatchRun.objects.get(id=run_id), **opts)
+    except Exception:
+        # also recorded on the run row (status "failed", error)
+        logger.exception("highlight batch run %s failed", run_id)
+    finally:
+        connection.close()
+
+
+class ClinicHighlightBatchView(APIView):
+    """
+    POST /api/admin/clinics/{clinic_id}/highlights/generate/
+    body: {"workers": 0, "chunk_size": 1000, "resume": false, "wait": false}
+    Same runner as `manage.py generate_clinic_highlights`; returns 202 + run id
+    unless wait=true.
+    """
+    # no fixed budget: wait=true commits once per patient (constant per patient, see tests)
+    query_budget = None
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, clinic_id: str):
+        if request.user.role != "admin":
+            return Response({"detail": "Only admin can run clinic-wide generation"}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            opts = {
+                "workers": int(request.data.get("workers", 0)),
+                "chunk_size": int(request.data.get("chunk_size", 1000)),
+            }
+        except (TypeError, ValueError):
+            return Response({"detail": "workers/chunk_size must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if opts["workers"] < 0 or opts["chunk_size"] < 1:
+            return Response({"detail": "workers/chunk_size out of range"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            run = start_run(clinic_id, request.user, resume=bool(request.data.get("resume", False)))
+        except RunInProgress as exc:
+            return Response(
+                {"detail": str(exc), "run_id": exc.run.id},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if request.data.get("wait"):
+            try:
+                execute_run(run, **opts)
+            except Exception:
+                # the run row says "failed"; the response carries it
+                logger.exception("highlight batch run %s failed", run.id)
+            run.refresh_from_db()
+            return Response(HighlightBatchRunSerializer(run).data)
+
+        threading.Thread(target=_run_batch_in_background, args=(run.id,), kwargs=opts, daemon=True).start()
+        return Response(HighlightBatchRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+
+class HighlightBatchRunView(APIView):
+    query_budget = 1
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, run_id: int):
+        if request.user.role != "admin":
+            return Response({"detail": "Only admin can view batch runs"}, status=status.HTTP_403_FORBIDDEN)
+        run = get_object_or_404(HighlightBatchRun, id=run_id)
+        return Response(HighlightBatchRunSerializer(run).data)
+
+
+from .admission import admission_metrics
+
+
+class AdmissionMetricsView(APIView):
+    """GET /api/admin/admission/   per-clinic admission decisions for generation endpoints (admin only)."""
+    # the clinics, then every clinic's counters in one cache read
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != "admin":
+            return Response({"detail": "Only admin can view admission metrics"}, status=status.HTTP_403_FORBIDDEN)
+        return Response({"clinics": admission_metrics()})
+
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from .export import buffered, export_lines, gzipped, pulled
+
+
+class PatientExportView(APIView):
+    """
+    GET /api/patients/{patient_id}/export/?compress=gzip
+    streams the patient's record as NDJSON (see notes/export.py), same RBAC as the care note.
+    """
+    # patient + audit row; the streamed body adds one query per section, whatever its size
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, patient_id: int):
+        patient = get_object_or_404(Patient, id=patient_id)
+        compress = request.query_params.get("compress") or None
+        if compress not in {None, "gzip"}:
+            return Response({"detail": "compress must be gzip"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            lines = export_lines(request.user, patient)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        record_audit(patient_id=patient.id, actor=request.user, action="export_patient", meta={"compress": compress})
+
+        body = buffered(lines)
+        content_type = "application/x-ndjson; charset=utf-8"
+        filename = f"patient-{patient.id}.ndjson"
+        if compress:
+            body = gzipped(body)
+            content_type = "application/gzip"
+            filename += ".gz"
+        if isinstance(request._request, ASGIRequest):
+            body = pulled(body)
+        resp = StreamingHttpResponse(body, content_type=content_type)
+        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return resp
+
+from .ingest import ingest_lines
+
+
+class EntryIngestView(APIView):
+    """
+    POST /api/admin/entries/ingest/?clinic_id=<id>   (admin only)
+    body: NDJSON, one entry per line (see notes/ingest.py); read as a stream.
+    returns per-batch counts and per-line errors; safe to retry.
+    """
+    # per 500-line chunk: patients, authors, existing pointers, insert, and per patient a bump + audit row
+    query_budget = None
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role != "admin":
+            return Response({"detail": "Only admin can ingest entries"}, status=status.HTTP_403_FORBIDDEN)
+        stream = request.stream
+        if stream is None:
+            return Response({"detail": "empty body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = ingest_lines(
+            iter(stream.readline, b""),
             actor=request.user,
-            action="generate_patient_summary_mock",
-            meta={"entry_id": e.id},
+            clinic_id=request.query_params.get("clinic_id") or None,
         )
-        return Response({"entry_id": e.id, "provenance_pointer": prov})
+        return Response(report.as_dict())
+
+import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .audit_archive import query_audit
+from .fast_serializers import compile_row_mapper
+
+AUDIT_EVENT_FIELDS = [
+    ("id", "id", None),
+    ("event_id", "event_id", "str"),
+    ("patient_id", "patient_id", None),
+    ("actor", "actor_id", None),
+    ("action", "action", None),
+    ("meta", "meta", None),
+    ("created_at", "created_at", "datetime"),
+    ("archived", "archived", None),
+]
+
+
+def _parse_when(raw):
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        raise ValueError(f"invalid datetime: {raw}")
+    return value if timezone.is_aware(value) else timezone.make_aware(value, datetime.timezone.utc)
+
+
+class AuditLogView(APIView):
+    """
+    GET /api/admin/audit/?patient_id=<id>&action=<a>&actor_id=<id>&since=<iso>&until=<iso>&limit=<n>&cursor=<c>
+    admin only; newest first across the AuditLog table and archived segments (notes/audit_archive.py).
+    """
+    # one page from the table (+ the patient's clinic, for its shard); segments are files
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != "admin":
+            return Response({"detail": "Only admin can read the audit log"}, status=status.HTTP_403_FORBIDDEN)
+        params = request.query_params
+        try:
+            rows, next_cursor = query_audit(
+                patient_id=int(params["patient_id"]) if params.get("patient_id") else None,
+                action=params.get("action") or None,
+                actor_id=int(params["actor_id"]) if params.get("actor_id") else None,
+                since=_parse_when(params.get("since")),
+                until=_parse_when(params.get("until")),
+                cursor=params.get("cursor") or None,
+                limit=parse_limit(params.get("limit")),
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        to_dict = compile_row_mapper(AUDIT_EVENT_FIELDS)
+        columns = [col for _, col, _ in AUDIT_EVENT_FIELDS]
+        return Response({
+            "results": [to_dict(tuple(row[c] for c in columns)) for row in rows],
+            "next_cursor": next_cursor,
+        })
+
+from .rbac import entry_search_scope
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, search_sharded
+
+
+class SearchView(APIView):
+    """
+    GET /api/search/?q=<terms>&patient_id=<id>&clinic_id=<id>&limit=<n>&offset=<n>
+    full-text search over entries (FTS5), best match first, with highlighted snippets.
+    without patient_id: every patient in the caller's clinic (admin: all, or ?clinic_id).
+    an admin search across all clinics queries every clinic shard.
+    """
+    # patient, FTS match, result rows
+    query_budget = 3
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            return Response({"detail": "q required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = parse_limit(request.query_params.get("limit"), DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+            offset = int(request.query_params.get("offset") or 0)
+            patient_id = request.query_params.get("patient_id")
+            patient = get_object_or_404(Patient, id=int(patient_id)) if patient_id else None
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0:
+            return Response({"detail": "offset must be >= 0"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            scope = entry_search_scope(request.user, patient, request.query_params.get("clinic_id") or None)
+        except (PermissionError, Patient.DoesNotExist) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        results = search_sharded(q, scope, limit=limit, offset=offset)
+        return Response({
+            "q": q,
+            "results": results,
+            "next_offset": offset + limit if len(results) == limit else None,
+        })
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from accounts.authentication import PrincipalJWTAuthentication
+from .events import EventStream
+
+
+async def care_note_events(request, patient_id: int):
+    """
+    GET /api/patients/{patient_id}/events/   (Authorization: Bearer <access>)
+    text/event-stream of care note changes, filtered for the viewer's role.
+    ASGI only: an open stream holds no worker thread, just a queue in the broker.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "event stream requires an ASGI server"}, status=501)
+
+    try:
+        auth = await sync_to_async(PrincipalJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail.get("detail", e.detail))}, status=401)
+    if auth is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    user = auth[0]
+
+    patient = await Patient.objects.filter(id=patient_id).afirst()
+    if patient is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    try:
+        filter_patient_queryset(user, patient)
+    except PermissionError as e:
+        return JsonResponse({"detail": str(e)}, status=403)
+
+    validated_token = auth[1]
+
+    def authorized() -> bool:
+        # same checks as the initial authentication: expiry, and revocation via auth_version
+        try:
+            validated_token.check_exp()
+            PrincipalJWTAuthentication().get_user(validated_token)
+        except (TokenError, AuthenticationFailed):
+            return False
+        return True
+
+    stream = EventStream(
+        patient.id,
+        role_view(user),
+        heartbeat=getattr(settings, "CARE_NOTE_EVENTS_HEARTBEAT", 15.0),
+        max_age=getattr(settings, "CARE_NOTE_EVENTS_MAX_AGE", 300.0),
+        authorized=authorized,
+    )
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # no proxy buffering
+    return response
+
+from django.db.models import Count
+from .comments import add_comment, check_can_comment, open_thread, set_thread_resolved
+from .models import CommentThread
+from .serializers import CommentSerializer, CommentThreadSerializer
+
+THREAD_STATUS_FILTERS = {"all": {}, "open": {"is_resolved": False}, "resolved": {"is_resolved": True}}
+
+
+def _comment_content(request):
+    content = request.data.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("content is required")
+    return content
+
+
+def _get_thread(request, thread_id: int) -> CommentThread:
+    thread = get_object_or_404(CommentThread.objects.select_related("entry__patient"), id=thread_id)
+    check_can_comment(request.user)
+    check_entry_access(request.user, thread.entry)
+    return thread
+
+
+class EntryThreadsView(APIView):
+    """
+    GET  /api/entries/{entry_id}/threads/?status=open|resolved|all&limit=<n>&cursor=<opaque>
+         newest first, each with its comment_count; pass next_cursor back for older threads.
+    POST /api/entries/{entry_id}/threads/  {"content": "..."}  opens a thread with its first comment.
+    Not available to patients.
+    """
+    # entry, thread page (comment counts via GROUP BY); POST: entry + thread, comment, generation, audit
+    query_budget = 5
+    replica_reads = True
+    permission_classes = [IsAuthenticated]
+
+    def _entry(self, request, entry_id: int) -> Entry:
+        entry = get_object_or_404(Entry.objects.select_related("patient"), id=entry_id)
+        check_can_comment(request.user)
+        check_entry_access(request.user, entry)
+        return entry
+
+    def get(self, request, entry_id: int):
+        try:
+            entry = self._entry(request, entry_id)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        filters = THREAD_STATUS_FILTERS.get(request.query_params.get("status", "all"))
+        if filters is None:
+            return Response({"detail": "status must be open/resolved/all"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+            threads, next_cursor = keyset_page(
+                CommentThread.objects.filter(entry=entry, **filters).annotate(comment_count=Count("comments")),
+                request.query_params.get("cursor"), limit,
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "entry_id": entry.id,
+            "threads": CommentThreadSerializer(threads, many=True).data,
+            "next_cursor": next_cursor,
+        })
+
+    def post(self, request, entry_id: int):
+        try:
+            entry = self._entry(request, entry_id)
+            content = _comment_content(request)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        thread = open_thread(entry, content, request.user)
+        return Response(CommentThreadSerializer(thread).data, status=status.HTTP_201_CREATED)
+
+
+class ThreadCommentsView(APIView):
+    """
+    GET  /api/threads/{thread_id}/comments/?limit=<n>&cursor=<opaque>   newest first
+    POST /api/threads/{thread_id}/comments/  {"content": "..."}
+    """
+    # thread (+entry, patient), comment page; POST: thread + comment, generation, audit
+    query_budget = 4
+    replica_reads = True
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, thread_id: int):
+        try:
+            thread = _get_thread(request, thread_id)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+            comments, next_cursor = keyset_page(thread.comments.all(), request.query_params.get("cursor"), limit)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "thread_id": thread.id,
+            "entry_id": thread.entry_id,
+            "is_resolved": thread.is_resolved,
+            "comments": CommentSerializer(comments, many=True).data,
+            "next_cursor": next_cursor,
+        })
+
+    def post(self, request, thread_id: int):
+        try:
+            thread = _get_thread(request, thread_id)
+            content = _comment_content(request)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        comment = add_comment(thread, content, request.user)
+        return Response(CommentSerializer(comment).data, status=status.HTTP_201_CREATED)
+
+
+class ThreadResolveView(APIView):
+    """
+    POST /api/threads/{thread_id}/resolve/  and  /api/threads/{thread_id}/unresolve/
+    idempotent: "changed" is false if the thread already was in that state.
+    """
+    # thread (+entry, patient), conditional update, generation, audit
+    query_budget = 4
+    permission_classes = [IsAuthenticated]
+    resolved = True
+
+    def post(self, request, thread_id: int):
+        try:
+            thread = _get_thread(request, thread_id)
+        except PermissionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        changed = set_thread_resolved(thread, self.resolved, request.user)
+        return Response({"thread_id": thread.id, "is_resolved": thread.is_resolved, "changed": changed})
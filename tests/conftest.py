@@ -3,6 +3,41 @@ from rest_framework.test import APIClient
 from accounts.models import User
 from notes.models import Patient, Entry
 
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(tmp_path_factory, django_db_modify_db_settings_parallel_suffix):
+    # a file-backed test database: in-memory SQLite has no WAL and different locking
+    from django.conf import settings
+    from django.db import connections
+    db_dir = tmp_path_factory.mktemp("db")
+    settings.DATABASES["default"]["TEST"]["NAME"] = str(db_dir / "test.sqlite3")
+    # second file for the replica routing tests; only set up for tests that ask for databases=[..., "replica"]
+    settings.DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": str(db_dir / "replica.sqlite3"),
+        "TEST": {"NAME": str(db_dir / "test_replica.sqlite3")},
+    }
+    # and a clinic shard, for tests that ask for databases=[..., "shard1"]
+    settings.DATABASES["shard1"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": str(db_dir / "shard1.sqlite3"),
+        "TEST": {"NAME": str(db_dir / "test_shard1.sqlite3")},
+    }
+    settings.SHARD_DATABASES = ["default", "shard1"]
+    connections.settings = connections.configure_settings(settings.DATABASES)
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # ids are reused between rolled-back tests, so generation-keyed entries could collide
+    from django.core.cache import cache
+    cache.clear()
+    yield
+    cache.clear()
+
+@pytest.fixture(autouse=True)
+def sync_audit(settings):
+    # test transactions never commit, so on_commit spooling would drop every audit row
+    settings.AUDIT_WRITER = "sync"
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from accounts.tokens import PrincipalRefreshToken
+from notes import admission
+from notes.admission import AdmissionRejected, admission_metrics, admit
+from notes.models import Patient
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def generate(client, patient):
+    return client.post(f"/api/patients/{patient.id}/highlights/generate/")
+
+@pytest.fixture
+def limits(settings):
+    settings.ADMISSION_RATE = 0.01  # no refill within a test
+    settings.ADMISSION_BURST = 2
+    settings.ADMISSION_CONCURRENCY = 4
+    settings.ADMISSION_MAX_WAIT = 0.2
+    return settings
+
+@pytest.mark.django_db
+def test_clinic_over_its_bucket_gets_429_with_retry_after(api_client, users, patient, entries, limits):
+    other = Patient.objects.create(clinic_id="clinicB", display_name="Synthetic Patient B")
+    auth(api_client, users["admin"])
+    assert [generate(api_client, patient).status_code for _ in range(2)] == [200, 200]
+
+    resp = generate(api_client, patient)
+    assert resp.status_code == 429
+    assert resp.json()["reason"] == "rate" and int(resp["Retry-After"]) >= 1
+    resp = api_client.post(f"/api/patients/{patient.id}/ai/patient-summary-mock/")
+    assert resp.status_code == 429
+    # buckets are per clinic
+    assert generate(api_client, other).status_code == 200
+
+    metrics = admission_metrics()
+    assert metrics["clinicA"]["admitted"] == 2 and metrics["clinicA"]["rejected_rate"] == 2
+    assert metrics["clinicB"]["admitted"] == 1 and metrics["clinicA"]["in_flight"] == 0
+
+@pytest.mark.django_db
+def test_request_waits_for_the_next_token_within_max_wait(api_client, users, patient, entries, limits):
+    limits.ADMISSION_RATE = 20.0  # next token in 50ms
+    limits.ADMISSION_BURST = 1
+    limits.ADMISSION_MAX_WAIT = 1.0
+    auth(api_client, users["clin"])
+    assert generate(api_client, patient).status_code == 200
+    assert generate(api_client, patient).status_code == 200
+
+    metrics = admission_metrics()["clinicA"]
+    assert metrics["admitted"] == 2 and metrics["queued"] == 1 and metrics["wait_ms"] >= 1
+
+@pytest.mark.django_db
+def test_in_flight_limit_rejects_then_frees_its_slot(api_client, users, patient, entries, limits):
+    limits.ADMISSION_CONCURRENCY = 1
+    limits.ADMISSION_BURST = 5
+    auth(api_client, users["clin"])
+    with admit("clinicA"):  # another worker generating for the clinic
+        resp = generate(api_client, patient)
+        assert resp.status_code == 429 and resp.json()["reason"] == "concurrency"
+        assert admission_metrics()["clinicA"]["in_flight"] == 1
+    assert generate(api_client, patient).status_code == 200
+    assert admission_metrics()["clinicA"]["rejected_concurrency"] == 1
+
+@pytest.mark.django_db
+def test_metrics_endpoint_is_admin_only(api_client, users, patient, entries, limits, settings):
+    settings.ADMISSION_CONTROL = False
+    auth(api_client, users["clin"])
+    assert [generate(api_client, patient).status_code for _ in range(3)] == [200, 200, 200]
+    assert api_client.get("/api/admin/admission/").status_code == 403
+
+    auth(api_client, users["admin"])
+    resp = api_client.get("/api/admin/admission/")
+    assert resp.status_code == 200 and resp.json() == {"clinics": {}}
+
+@pytest.mark.django_db
+def test_leaked_slot_expires_and_late_release_does_not_undercount(api_client, users, patient, entries, limits,
+                                                                   monkeypatch):
+    limits.ADMISSION_CONCURRENCY = 1
+    limits.ADMISSION_BURST = 5
+    limits.ADMISSION_SLOT_TTL = 60
+    leaked = admit("clinicA")  # its worker died: never released
+    auth(api_client, users["clin"])
+    assert generate(api_client, patient).status_code == 429
+
+    now = admission.time.time()
+    monkeypatch.setattr(admission.time, "time", lambda: now + 61)
+    with admit("clinicA"):
+        leaked.__exit__(None, None, None)  # the dead worker's release arrives late
+        assert admission_metrics()["clinicA"]["in_flight"] == 1
+        assert generate(api_client, patient).status_code == 429
+    assert admission_metrics()["clinicA"]["in_flight"] == 0
+
+@pytest.mark.django_db
+def test_concurrency_rejection_hands_its_token_back(api_client, users, patient, entries, limits):
+    limits.ADMISSION_BURST = 3
+    limits.ADMISSION_CONCURRENCY = 1
+    auth(api_client, users["clin"])
+    with admit("clinicA"):
+        assert [generate(api_client, patient).status_code for _ in range(2)] == [429, 429]
+    # 3 tokens, 1 spent by the held request: the rejected ones ran nothing and cost nothing
+    assert [generate(api_client, patient).status_code for _ in range(3)] == [200, 200, 429]
+    assert generate(api_client, patient).json()["reason"] == "rate"
+
+@pytest.mark.django_db
+def test_waiting_for_a_stuck_lock_is_bounded_by_max_wait(patient, limits):
+    cache = admission._cache()
+    cache.add("admission:lock:clinicA", 1, 60)  # a holder that stopped responding
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        admit("clinicA")
+    assert time.monotonic() - started < limits.ADMISSION_MAX_WAIT + 0.5
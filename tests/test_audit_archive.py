@@ -0,0 +1,136 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.core.management import call_command
+
+from accounts.tokens import PrincipalRefreshToken
+from notes import audit_archive
+from notes.audit_archive import archive_audit_log, iter_archived, query_audit
+from notes.models import AuditLog, Patient
+
+NOW = datetime.now(timezone.utc)
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def log(patient, action, days_ago, hour=12, actor=None):
+    at = (NOW - timedelta(days=days_ago)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return AuditLog.objects.create(patient=patient, actor=actor, action=action, meta={"d": days_ago}, created_at=at)
+
+@pytest.fixture
+def archive(settings, tmp_path):
+    settings.AUDIT_ARCHIVE_DIR = tmp_path / "archive"
+    settings.AUDIT_RETENTION_DAYS = 30
+    return settings.AUDIT_ARCHIVE_DIR
+
+@pytest.fixture
+def history(db, users, patient):
+    other = Patient.objects.create(clinic_id="clinicA", display_name="Synthetic Patient C")
+    return {
+        "old": [log(patient, "edit_entry", 60, 9, users["clin"]), log(patient, "revert_entry", 60, 15),
+                log(other, "edit_entry", 45), log(patient, "export_patient", 40)],
+        "hot": [log(patient, "edit_entry", 5), log(other, "export_patient", 1)],
+        "other": other,
+    }
+
+@pytest.mark.django_db
+def test_archiver_moves_old_rows_into_daily_segments(archive, history):
+    stats = archive_audit_log()
+    assert stats == {"rows": 4, "segments": 3, "pruned": 0}
+    assert set(AuditLog.objects.values_list("id", flat=True)) == {r.id for r in history["hot"]}
+
+    indexes = sorted(archive.glob("*/*.idx.json"))
+    assert len(indexes) == 3 and len(list(archive.glob("*/*.jsonl.gz"))) == 3
+    first = json.loads(indexes[0].read_text())
+    old = history["old"]
+    assert first["rows"] == 2 and first["actions"] == {"edit_entry": 1, "revert_entry": 1}
+    assert first["patients"] == {str(old[0].patient_id): 2}
+    with gzip.open(indexes[0].parent / first["segment"], "rt") as fh:
+        rows = [json.loads(line) for line in fh]
+    assert [r["id"] for r in rows] == [old[0].id, old[1].id]
+    assert rows[0]["actor_id"] == old[0].actor_id and rows[0]["meta"] == {"d": 60}
+
+    assert archive_audit_log() == {"rows": 0, "segments": 0, "pruned": 0}
+
+@pytest.mark.django_db
+def test_query_reads_table_and_archive_newest_first(archive, history, patient):
+    archive_audit_log()
+    rows, cursor = query_audit(patient_id=patient.id, limit=2)
+    assert [(r["action"], r["archived"]) for r in rows] == [("edit_entry", False), ("export_patient", True)]
+    rows, cursor = query_audit(patient_id=patient.id, limit=2, cursor=cursor)
+    assert [r["action"] for r in rows] == ["revert_entry", "edit_entry"] and cursor is None
+    assert rows[0]["created_at"] > rows[1]["created_at"]
+
+    rows, _ = query_audit(action="edit_entry")
+    assert [r["id"] for r in rows] == [history["hot"][0].id, history["old"][2].id, history["old"][0].id]
+    rows, _ = query_audit(since=NOW - timedelta(days=50), until=NOW - timedelta(days=2))
+    assert [r["id"] for r in rows] == [history["hot"][0].id, history["old"][3].id, history["old"][2].id]
+
+@pytest.mark.django_db
+def test_query_opens_only_segments_the_index_allows(archive, history, monkeypatch):
+    archive_audit_log()
+    opened = []
+    read = audit_archive.read_segment
+    monkeypatch.setattr(audit_archive, "read_segment", lambda path: opened.append(path.name) or read(path))
+
+    rows, _ = query_audit(patient_id=history["other"].id)
+    assert [r["action"] for r in rows] == ["export_patient", "edit_entry"]
+    assert len(opened) == 1
+    opened.clear()
+    assert query_audit(action="no_such_action") == ([], None) and opened == []
+
+    # a later page skips segments that lie wholly after its cursor
+    rows, cursor = query_audit(patient_id=history["old"][0].patient_id, limit=3)
+    assert rows[-1]["id"] == history["old"][1].id
+    opened.clear()
+    rows, _ = query_audit(patient_id=history["old"][0].patient_id, limit=3, cursor=cursor)
+    assert [r["id"] for r in rows] == [history["old"][0].id] and len(opened) == 1
+
+@pytest.mark.django_db
+def test_crash_before_delete_is_repaired_by_a_rerun(api_client, archive, users, history, patient, monkeypatch):
+    monkeypatch.setattr(audit_archive, "_delete_rows", lambda alias, ids: (_ for _ in ()).throw(OSError("crash")))
+    with pytest.raises(OSError):
+        archive_audit_log()
+    # segment written, rows still in the table: nothing shows twice
+    rows, _ = query_audit(patient_id=patient.id)
+    assert len(rows) == 4 == len({r["id"] for r in rows})
+
+    auth(api_client, users["admin"])
+    resp = api_client.get(f"/api/patients/{patient.id}/export/")
+    audit = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+    ids = [l["id"] for l in audit if l["kind"] == "audit"]
+    assert len(ids) == len(set(ids)) == 5  # 4 events + the export's own
+
+    monkeypatch.undo()
+    archive_audit_log()
+    assert len(list(archive.glob("*/*.jsonl.gz"))) == 3
+    assert [r["id"] for r in iter_archived(patient.id)] == [r.id for r in history["old"] if r.patient_id == patient.id]
+
+@pytest.mark.django_db
+def test_expired_segments_are_pruned(archive, history, settings):
+    settings.AUDIT_ARCHIVE_RETENTION_DAYS = 50
+    stats = archive_audit_log()
+    assert stats["segments"] == 3 and stats["pruned"] == 1
+    assert len(list(archive.glob("*/*.idx.json"))) == 2 == len(list(archive.glob("*/*.jsonl.gz")))
+
+@pytest.mark.django_db
+def test_admin_api_and_patient_export_include_archived_events(api_client, archive, users, patient, history):
+    call_command("archive_audit_log")
+    auth(api_client, users["clin"])
+    assert api_client.get("/api/admin/audit/").status_code == 403
+
+    auth(api_client, users["admin"])
+    resp = api_client.get("/api/admin/audit/", {"patient_id": patient.id, "since": "2000-01-01T00:00:00"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [e["archived"] for e in body["results"]] == [False, True, True, True]
+    assert body["results"][-1]["actor"] == users["clin"].id and body["next_cursor"] is None
+    assert api_client.get("/api/admin/audit/", {"since": "yesterday"}).status_code == 400
+
+    resp = api_client.get(f"/api/patients/{patient.id}/export/")
+    audit = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+    audit = [l for l in audit if l["kind"] == "audit"]
+    # archived first (oldest), then the table, which now also holds this export's own event
+    assert [a["action"] for a in audit] == ["edit_entry", "revert_entry", "export_patient", "edit_entry", "export_patient"]
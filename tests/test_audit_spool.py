@@ -0,0 +1,125 @@
+import json
+import uuid
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes import audit
+from notes.audit import get_spool
+from notes.models import AuditLog
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+@pytest.fixture
+def spool_settings(settings, tmp_path):
+    settings.AUDIT_WRITER = "spool"
+    settings.AUDIT_SPOOL_DIR = tmp_path / "spool"
+    settings.AUDIT_SPOOL_FSYNC = False
+    settings.AUDIT_FLUSH_THREAD = False
+    return settings
+
+@pytest.mark.django_db
+def test_audit_is_spooled_on_commit_and_flushed_in_bulk(api_client, users, patient, entries, spool_settings, django_capture_on_commit_callbacks):
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.post(f"/api/entries/{note.id}/edit/", {"content": "spooled edit"}, format="json")
+    assert resp.status_code == 200
+    assert not AuditLog.objects.filter(action="edit_entry").exists()
+    assert list(spool_settings.AUDIT_SPOOL_DIR.glob("active-*.jsonl"))
+
+    assert get_spool().drain() == 1
+    audit = AuditLog.objects.get(action="edit_entry")
+    assert audit.meta == {"entry_id": note.id, "new_version": 1}
+    assert audit.actor_id == users["staff"].id
+    assert not list(spool_settings.AUDIT_SPOOL_DIR.iterdir())
+
+@pytest.mark.django_db
+def test_rolled_back_transaction_spools_nothing(api_client, users, patient, entries, spool_settings, django_capture_on_commit_callbacks):
+    auth(api_client, users["staff"])
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        api_client.post(f"/api/entries/{entries['staff_note'].id}/edit/", {"content": "x"}, format="json")
+    # callbacks are only run on commit; none ran here (audit spool write + care note push event)
+    assert len(callbacks) == 2
+    assert not spool_settings.AUDIT_SPOOL_DIR.exists() or not list(spool_settings.AUDIT_SPOOL_DIR.iterdir())
+
+@pytest.mark.django_db
+def test_segments_from_crashed_process_are_recovered_once(patient, users, spool_settings):
+    spool_dir = spool_settings.AUDIT_SPOOL_DIR
+    spool_dir.mkdir(parents=True)
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "patient_id": patient.id,
+        "actor_id": users["staff"].id,
+        "action": "edit_entry",
+        "meta": {"entry_id": 1},
+        "created_at": "2026-01-02T03:04:05+00:00",
+    }
+    # pid 2**22+1 is above pid_max defaults, i.e. a dead writer; a line lacks fields, the last is torn
+    (spool_dir / f"active-{2**22 + 1}-1.jsonl").write_text(json.dumps(event) + "\n{}\n" + '{"event_id": "abc')
+    # same event already flushed before the crash
+    (spool_dir / f"ready-1-{2**22 + 1}.jsonl").write_text(json.dumps(event) + "\n")
+
+    call_command("flush_audit_spool")
+    audit = AuditLog.objects.get()
+    assert audit.created_at.isoformat() == "2026-01-02T03:04:05+00:00"
+    assert not list(spool_dir.iterdir())
+
+@pytest.mark.django_db
+def test_backlog_over_budget_flushes_inline(patient, users, spool_settings, django_capture_on_commit_callbacks):
+    from notes.audit import record_audit
+    spool_settings.AUDIT_SPOOL_MAX_BACKLOG = 1
+    with django_capture_on_commit_callbacks(execute=True):
+        record_audit(patient_id=patient.id, actor=users["staff"], action="edit_entry", meta={})
+    assert AuditLog.objects.filter(action="edit_entry").count() == 1
+    assert get_spool().backlog_bytes == 0
+
+@pytest.mark.django_db
+def test_failed_flush_leaves_segments_for_the_next_one(patient, users, spool_settings, monkeypatch, django_capture_on_commit_callbacks):
+    from notes.audit import record_audit
+    with django_capture_on_commit_callbacks(execute=True):
+        record_audit(patient_id=patient.id, actor=users["staff"], action="edit_entry", meta={})
+    spool = get_spool()
+    spool.rotate()
+    with django_capture_on_commit_callbacks(execute=True):
+        record_audit(patient_id=patient.id, actor=users["staff"], action="revert_entry", meta={})
+    backlog = spool.backlog_bytes
+
+    def down(*args, **kwargs):
+        raise OperationalError("database is locked")
+    monkeypatch.setattr(AuditLog.objects.get_queryset().__class__, "bulk_create", down)
+    with pytest.raises(OperationalError):
+        spool.drain()
+    # nothing stuck as flushing-<own pid>, nothing lost
+    assert sorted(p.name.split("-")[0] for p in spool_settings.AUDIT_SPOOL_DIR.iterdir()) == ["ready", "ready"]
+    assert spool.backlog_bytes == backlog
+
+    monkeypatch.undo()
+    assert spool.drain() == 2
+    assert set(AuditLog.objects.values_list("action", flat=True)) == {"edit_entry", "revert_entry"}
+    assert spool.backlog_bytes == 0 and not list(spool_settings.AUDIT_SPOOL_DIR.iterdir())
+
+@pytest.mark.django_db
+def test_spool_failures_after_commit_do_not_fail_the_request(api_client, users, patient, entries, spool_settings,
+                                                             django_capture_on_commit_callbacks, monkeypatch, caplog):
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    append = audit.AuditSpool.append
+    monkeypatch.setattr(audit.AuditSpool, "append", lambda self, events: (_ for _ in ()).throw(OSError("disk full")))
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.post(f"/api/entries/{note.id}/edit/", {"content": "committed anyway"}, format="json")
+    assert resp.status_code == 200
+    assert any("could not spool audit event" in r.message and '"edit_entry"' in r.message for r in caplog.records)
+
+    # over the backlog limit the writer flushes inline; a failing flush leaves the events spooled
+    monkeypatch.setattr(audit.AuditSpool, "append", append)
+    spool_settings.AUDIT_SPOOL_MAX_BACKLOG = 0
+    monkeypatch.setattr(audit.AuditSpool, "_flush_segment", lambda self, path: (_ for _ in ()).throw(OperationalError("locked")))
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.post(f"/api/entries/{note.id}/edit/", {"content": "and again"}, format="json")
+    assert resp.status_code == 200
+    monkeypatch.undo()
+    assert get_spool().drain() == 1
+    assert AuditLog.objects.filter(action="edit_entry").count() == 1
@@ -0,0 +1,63 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks import compare
+from benchmarks.datagen import SCALES, Scale, SentencePool, generate, plan_patient
+from notes import views
+from notes.highlights import RISK_KEYWORDS
+from notes.matching import KeywordMatcher
+from notes.models import Entry, Highlight, HighlightWatermark
+from notes.versioning import rebuild_version
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+def test_plan_is_deterministic_and_matches_are_exact():
+    scale = SCALES["tiny"]
+    plans = []
+    for _ in range(2):
+        pool = SentencePool(random.Random(scale.seed))
+        plans.append(list(plan_patient(scale, pool, random.Random(scale.seed), START)))
+    assert plans[0] == plans[1] and len(plans[0]) == scale.entries_per_patient
+
+    # precomputed per-sentence matches, shifted into place, equal a real scan of the note
+    matcher = KeywordMatcher(RISK_KEYWORDS)
+    for p in plans[0]:
+        assert list(pool.find_all(p.sentences)) == list(matcher.find_all(pool.text(p.sentences)))
+
+@pytest.mark.django_db
+def test_generated_dataset_is_consistent():
+    scale = SCALES["tiny"]
+    counts = generate(scale)
+    assert counts["entries"] == Entry.objects.count() == scale.entries
+    assert counts["highlights"] == Highlight.objects.count() > 0
+    assert HighlightWatermark.objects.count() == counts["patients"]
+
+    edited = Entry.objects.filter(current_version__gt=0)
+    for e in edited:
+        assert rebuild_version(e, e.current_version) == e.content
+    for h in Highlight.objects.select_related("entry")[:20]:
+        assert h.text.startswith(h.entry.content[h.span_start:h.span_end])
+
+@pytest.mark.django_db
+def test_suite_reports_latencies_within_query_budgets():
+    from benchmarks.suite import run_suite
+    generate(Scale(clinics=1, patients_per_clinic=2, entries_per_patient=40, versioned_fraction=0.3))
+    results = run_suite(samples=3)
+    assert set(results) >= {"care_note_cold", "care_note_warm", "entry_edit", "entry_revert",
+                            "highlights_incremental", "highlights_full", "version_listing"}
+    for r in results.values():
+        assert r["n"] > 0 and 0 < r["p50_ms"] <= r["p99_ms"] <= r["max_ms"]
+    # cold runs include the auth-version lookup the cache normally answers
+    assert results["care_note_cold"]["max_queries"] <= views.CareNoteView.query_budget + 1
+    assert results["version_listing_content"]["max_queries"] <= views.EntryVersionsView.query_budget
+    assert results["entry_revert"]["max_queries"] <= views.EntryRevertView.query_budget
+
+def test_compare_flags_regressions():
+    base = {"a": {"p50_ms": 10, "p99_ms": 20, "ops_per_s": 100, "max_queries": 3}}
+    same = compare.compare(base, {"a": {"p50_ms": 11, "p99_ms": 22, "ops_per_s": 95, "max_queries": 3}})
+    assert not any(row[-1] for row in same)
+
+    worse = compare.compare(base, {"a": {"p50_ms": 10, "p99_ms": 30, "ops_per_s": 70, "max_queries": 4}})
+    assert {row[1] for row in worse if row[-1]} == {"p99_ms", "ops_per_s", "max_queries"}
@@ -0,0 +1,64 @@
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import Highlight
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+@pytest.mark.django_db
+def test_matching_if_none_match_returns_304(api_client, users, patient, entries):
+    auth(api_client, users["staff"])
+    url = f"/api/patients/{patient.id}/care-note/"
+
+    first = api_client.get(url)
+    assert first.status_code == 200
+    etag = first["ETag"]
+
+    again = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert again.status_code == 304
+    assert again["ETag"] == etag
+
+@pytest.mark.django_db
+def test_etag_changes_on_entry_and_highlight_writes(api_client, users, patient, entries):
+    auth(api_client, users["staff"])
+    url = f"/api/patients/{patient.id}/care-note/"
+    etag0 = api_client.get(url)["ETag"]
+
+    api_client.post(f"/api/entries/{entries['staff_note'].id}/edit/", {"content": "changed"}, format="json")
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag0)
+    assert resp.status_code == 200
+    assert resp.json()["timeline"][-1]["content"] == "changed"
+    etag1 = resp["ETag"]
+    assert etag1 != etag0
+
+    Highlight.objects.create(
+        patient=patient, created_by=users["staff"], text="hl", risk_reason="r",
+        entry=entries["staff_note"], span_start=0, span_end=2,
+    )
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag1)
+    assert resp.status_code == 200
+    assert [h["text"] for h in resp.json()["glance"]["highlights"]] == ["hl"]
+
+@pytest.mark.django_db
+def test_etag_differs_between_role_views(api_client, users, patient, entries):
+    url = f"/api/patients/{patient.id}/care-note/"
+    auth(api_client, users["staff"])
+    staff_etag = api_client.get(url)["ETag"]
+
+    auth(api_client, users["pat"])
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=staff_etag)
+    assert resp.status_code == 200
+    assert {e["type"] for e in resp.json()["timeline"]} == {"ai_patient_session_summary"}
+
+@pytest.mark.django_db
+def test_cached_payload_skips_timeline_queries(api_client, users, patient, entries, django_assert_max_num_queries, settings):
+    settings.CARE_NOTE_CACHE_ENABLED = True
+    auth(api_client, users["staff"])
+    url = f"/api/patients/{patient.id}/care-note/"
+    warm = api_client.get(url).json()
+
+    # auth user + patient lookup only
+    with django_assert_max_num_queries(2):
+        resp = api_client.get(url)
+    assert resp.json() == warm
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient
+from accounts.tokens import PrincipalRefreshToken
+from notes.editing import snapshot_and_update_entry
+from notes.events import Broker, get_broker
+
+def bearer(user):
+    return {"Authorization": f"Bearer {PrincipalRefreshToken.for_user(user).access_token}"}
+
+def test_broker_filters_for_role_and_resyncs_slow_viewers():
+    async def scenario():
+        broker = Broker(queue_size=2)
+        staff = broker.subscribe(7, "staff")
+        patient = broker.subscribe(7, "patient")
+        other = broker.subscribe(8, "staff")
+
+        def publish():
+            broker.deliver(7, {"type": "entry.updated", "entry_type": "clinician_note", "version": 2})
+            broker.deliver(7, {"type": "summary.generated", "entry_type": "ai_patient_session_summary"})
+            broker.deliver(7, {"type": "highlight.status", "from": "suggested", "to": "accepted"})
+
+        t = threading.Thread(target=publish)
+        t.start()
+        t.join()
+        await asyncio.sleep(0)
+
+        got = [(await patient.get(1))["type"] for _ in range(2)]
+        assert got == ["summary.generated", "highlight.status"]
+        # staff got 3 events into a queue of 2: backlog replaced by a resync marker
+        assert (await staff.get(1))["type"] == "resync"
+        assert other.queue.empty()
+
+        for sub in (staff, patient, other):
+            sub.close()
+        assert broker.viewer_count() == 0
+
+    asyncio.run(scenario())
+
+@pytest.mark.django_db
+def test_sse_stream_pushes_edits_to_viewers(users, patient, entries, django_capture_on_commit_callbacks):
+    note = entries["clin_note"]
+
+    def edit():
+        # runs on the test thread (thread-sensitive), where the test transaction lives
+        with django_capture_on_commit_callbacks(execute=True):
+            snapshot_and_update_entry(note, "new text", users["clin"])
+
+    async def scenario():
+        client = AsyncClient()
+        resp = await client.get(f"/api/patients/{patient.id}/events/", headers=bearer(users["staff"]))
+        assert resp.status_code == 200
+        assert resp["Content-Type"] == "text/event-stream"
+        stream = resp.streaming_content.__aiter__()
+        assert (await stream.__anext__()).startswith(b"retry:")
+        assert get_broker().viewer_count(patient.id) == 1
+
+        await sync_to_async(edit)()
+        frame = (await asyncio.wait_for(stream.__anext__(), 2)).decode()
+        assert "event: entry.updated\n" in frame
+        assert f'"entry_id":{note.id}' in frame and '"version":1' in frame
+
+        # what the ASGI handler does once the stream has ended; Django 4.2 does not notice a
+        # client leaving mid-stream, which is why streams end by themselves (see below)
+        await sync_to_async(resp.close)()
+        assert get_broker().viewer_count(patient.id) == 0
+
+    async_to_sync(scenario)()
+
+@pytest.mark.django_db
+def test_sse_stream_ends_after_max_age(users, patient, settings):
+    settings.CARE_NOTE_EVENTS_HEARTBEAT = 0.05
+    settings.CARE_NOTE_EVENTS_MAX_AGE = 0.2
+
+    async def scenario():
+        resp = await AsyncClient().get(f"/api/patients/{patient.id}/events/", headers=bearer(users["staff"]))
+        frames = [frame async for frame in resp.streaming_content]
+        assert frames[0].startswith(b"retry:") and set(frames[1:]) == {b": keep-alive\n\n"}
+        assert get_broker().viewer_count(patient.id) == 0
+
+    async_to_sync(asyncio.wait_for)(scenario(), 2)
+
+@pytest.mark.django_db
+def test_sse_stream_ends_when_the_token_is_revoked(users, patient, settings):
+    settings.CARE_NOTE_EVENTS_HEARTBEAT = 0.05
+
+    async def scenario():
+        resp = await AsyncClient().get(f"/api/patients/{patient.id}/events/", headers=bearer(users["staff"]))
+        stream = resp.streaming_content.__aiter__()
+        assert (await stream.__anext__()).startswith(b"retry:")
+        assert await stream.__anext__() == b": keep-alive\n\n"
+
+        users["staff"].clinic_id = "clinicB"  # bumps auth_version
+        await sync_to_async(users["staff"].save)()
+        with pytest.raises(StopAsyncIteration):
+            while True:
+                assert await stream.__anext__() == b": keep-alive\n\n"
+        assert get_broker().viewer_count(patient.id) == 0
+
+    async_to_sync(asyncio.wait_for)(scenario(), 2)
+
+@pytest.mark.django_db
+def test_sse_requires_auth_and_clinic_scope(users, patient):
+    async def scenario():
+        client = AsyncClient()
+        assert (await client.get(f"/api/patients/{patient.id}/events/")).status_code == 401
+        users["staff"].clinic_id = "clinicB"
+        await sync_to_async(users["staff"].save)()
+        resp = await client.get(f"/api/patients/{patient.id}/events/", headers=bearer(users["staff"]))
+        assert resp.status_code == 403
+
+    async_to_sync(scenario)()
+
+@pytest.mark.django_db
+def test_sse_needs_asgi(client, users, patient):
+    resp = client.get(f"/api/patients/{patient.id}/events/", HTTP_AUTHORIZATION=bearer(users["staff"])["Authorization"])
+    assert resp.status_code == 501
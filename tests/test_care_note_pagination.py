@@ -0,0 +1,48 @@
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import Entry
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+@pytest.mark.django_db
+def test_timeline_pages_cover_all_entries_once(api_client, users, patient, entries):
+    for i in range(7):
+        Entry.objects.create(
+            patient=patient,
+            author=users["staff"],
+            author_role="staff",
+            type="staff_note",
+            provenance_pointer=f"manual:bulk:{i}",
+            content=f"bulk {i}",
+        )
+    auth(api_client, users["staff"])
+
+    resp = api_client.get(f"/api/patients/{patient.id}/care-note/?limit=4")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert "glance" in data
+    seen = [e["id"] for e in data["timeline"]]
+    assert len(seen) == 4
+
+    cursor = data["next_cursor"]
+    while cursor:
+        resp = api_client.get(f"/api/patients/{patient.id}/care-note/", {"limit": 4, "cursor": cursor})
+        assert resp.status_code == 200
+        page = resp.json()
+        # glance is only part of the first page
+        assert "glance" not in page
+        seen.extend(e["id"] for e in page["timeline"])
+        cursor = page["next_cursor"]
+
+    expected = list(Entry.objects.filter(patient=patient).order_by("-created_at", "-id").values_list("id", flat=True))
+    assert seen == expected
+
+@pytest.mark.django_db
+def test_invalid_cursor_returns_400(api_client, users, patient, entries):
+    auth(api_client, users["staff"])
+    resp = api_client.get(f"/api/patients/{patient.id}/care-note/", {"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+    resp = api_client.get(f"/api/patients/{patient.id}/care-note/", {"limit": "0"})
+    assert resp.status_code == 400
@@ -0,0 +1,166 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.batch import RunInProgress, execute_run, start_run
+from notes.editing import snapshot_and_update_entry
+from notes.models import AuditLog, Entry, Highlight, HighlightBatchRun, Patient
+from notes.sqlite import write_transaction
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+@pytest.fixture
+def clinic(db, users):
+    patients = []
+    for i, clinic_id in enumerate(["clinicA", "clinicA", "clinicA", "clinicB"]):
+        p = Patient.objects.create(clinic_id=clinic_id, display_name=f"Batch {i}")
+        for n in range(3):
+            Entry.objects.create(
+                patient=p,
+                author=users["staff"],
+                author_role="staff",
+                type="staff_note",
+                provenance_pointer=f"feed:{i}:{n}",
+                content=f"Note {n}: chest pain and bleeding" if n == 0 else f"Note {n}: routine",
+            )
+        patients.append(p)
+    return patients
+
+def rule_audits(patient):
+    return AuditLog.objects.filter(patient=patient, action="generate_highlights_rule")
+
+@pytest.mark.django_db
+def test_command_covers_clinic_with_one_audit_per_patient(clinic):
+    call_command("generate_clinic_highlights", "clinicA")
+
+    run = HighlightBatchRun.objects.get()
+    assert run.status == "completed"
+    assert run.patients_done == 3
+    assert run.entries_scanned == 9
+    assert run.highlights_created == 6
+    for p in clinic[:3]:
+        assert Highlight.objects.filter(patient=p).count() == 2
+        assert rule_audits(p).count() == 1
+    assert not Highlight.objects.filter(patient=clinic[3]).exists()
+
+    # rerun is incremental: nothing left to scan
+    call_command("generate_clinic_highlights", "clinicA")
+    assert HighlightBatchRun.objects.order_by("-id").first().entries_scanned == 0
+
+@pytest.mark.django_db
+def test_interrupted_run_resumes_from_checkpoint(clinic):
+    run = start_run("clinicA")
+
+    def crash(r):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        execute_run(run, progress=crash)
+    run.refresh_from_db()
+    assert run.status == "failed"
+    assert run.last_patient_id == clinic[0].id
+
+    resumed = start_run("clinicA", resume=True)
+    assert resumed.id == run.id
+    execute_run(resumed)
+    assert resumed.status == "completed"
+    assert resumed.patients_done == 3
+    assert rule_audits(clinic[0]).count() == 1
+
+@pytest.mark.django_db
+def test_resume_does_not_take_over_a_live_run(api_client, users, clinic, settings):
+    run = start_run("clinicA")  # another runner, still checkpointing
+    with pytest.raises(RunInProgress):
+        start_run("clinicA", resume=True)
+    auth(api_client, users["admin"])
+    resp = api_client.post("/api/admin/clinics/clinicA/highlights/generate/", {"resume": True}, format="json")
+    assert resp.status_code == 409 and resp.json()["run_id"] == run.id
+
+    # its runner died: once the lease has lapsed the run can be resumed
+    HighlightBatchRun.objects.filter(id=run.id).update(
+        updated_at=timezone.now() - timedelta(seconds=settings.HIGHLIGHT_RUN_LEASE_SECONDS + 1),
+    )
+    resumed = start_run("clinicA", resume=True)
+    assert resumed.id == run.id and resumed.status == "running"
+    with pytest.raises(RunInProgress):
+        start_run("clinicA", resume=True)
+
+@pytest.mark.django_db
+def test_new_run_is_refused_while_one_is_live(api_client, users, clinic, settings):
+    run = start_run("clinicA")  # another runner, still checkpointing
+    with pytest.raises(RunInProgress) as exc:
+        start_run("clinicA")
+    assert exc.value.run.id == run.id
+    auth(api_client, users["admin"])
+    resp = api_client.post("/api/admin/clinics/clinicA/highlights/generate/")
+    assert resp.status_code == 409 and resp.json()["run_id"] == run.id
+    assert HighlightBatchRun.objects.filter(clinic_id="clinicA").count() == 1
+    # other clinics are not held up
+    assert start_run("clinicB").id != run.id
+
+    # a run whose runner died (lease lapsed) does not block a fresh start
+    HighlightBatchRun.objects.filter(id=run.id).update(
+        updated_at=timezone.now() - timedelta(seconds=settings.HIGHLIGHT_RUN_LEASE_SECONDS + 1),
+    )
+    assert start_run("clinicA").id != run.id
+
+@pytest.mark.django_db
+def test_process_pool_matches_inline_results(clinic):
+    run = execute_run(start_run("clinicA"), workers=2, chunk_size=2)
+    assert run.highlights_created == 6
+    spans = set(Highlight.objects.values_list("entry_id", "span_start", "span_end"))
+    assert len(spans) == 6
+
+@pytest.mark.django_db
+def test_admin_api_runs_batch(api_client, users, clinic):
+    auth(api_client, users["staff"])
+    assert api_client.post("/api/admin/clinics/clinicA/highlights/generate/").status_code == 403
+
+    auth(api_client, users["admin"])
+    resp = api_client.post("/api/admin/clinics/clinicA/highlights/generate/", {"wait": True}, format="json")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "completed"
+    assert resp.json()["highlights_created"] == 6
+
+    resp = api_client.get(f"/api/admin/highlight-runs/{resp.json()['id']}/")
+    assert resp.json()["patients_done"] == 3
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_waits_for_an_open_edit_instead_of_failing(clinic):
+    other = Entry.objects.filter(patient=clinic[3]).first()
+    locked, release, errors, threads = threading.Event(), threading.Event(), [], []
+
+    def hold_write_lock():
+        # an edit elsewhere whose transaction stays open until released
+        try:
+            @write_transaction
+            def edit():
+                snapshot_and_update_entry(Entry.objects.get(id=other.id), "edited meanwhile", None)
+                locked.set()
+                release.wait(10)
+            edit()
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def edit_between_patients(run):
+        if not threads:
+            threads.append(threading.Thread(target=hold_write_lock, daemon=True))
+            threads[0].start()
+            assert locked.wait(5)
+            threading.Timer(0.3, release.set).start()
+
+    # the next patient reads its watermark while the edit is open; in a deferred transaction its
+    # snapshot is stale once the edit commits and the write fails, BEGIN IMMEDIATE waits up front
+    run = execute_run(start_run("clinicA"), progress=edit_between_patients)
+    threads[0].join(10)
+
+    assert errors == []
+    assert run.status == "completed" and run.highlights_created == 6
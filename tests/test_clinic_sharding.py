@@ -0,0 +1,177 @@
+import json
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from accounts.models import User
+from accounts.tokens import PrincipalRefreshToken
+from notes import sharding
+from notes.batch import execute_run, start_run
+from notes.ingest import ingest_lines
+from notes.audit import record_audit
+from notes.models import AuditLog, ClinicShard, Entry, Highlight, Patient, VersionSnapshot
+from notes.sharding import ClinicMoving, move_clinic, set_clinic_shard, shard_for_clinic, use_clinic
+
+pytestmark = pytest.mark.django_db(transaction=True, databases=["default", "shard1"])
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def note(patient, content, role="clinician"):
+    return Entry.objects.create(
+        patient=patient, author_role=role, type=f"{role}_note", provenance_pointer=f"manual:{content}", content=content,
+    )
+
+@pytest.fixture
+def sharded(settings):
+    settings.CLINIC_SHARDING = True
+    sharding._blocks.clear()  # ids reserved from a previous test's (flushed) sequence
+    set_clinic_shard("clinicB", "shard1")
+
+@pytest.fixture
+def clinic_b(sharded, users, entries):
+    patient = Patient.objects.create(clinic_id="clinicB", display_name="Synthetic Patient B")
+    clin = User.objects.create_user(username="clinB", password="pass1234", role="clinician", clinic_id="clinicB")
+    return {"patient": patient, "clin": clin, "note": note(patient, "clinicB chest pain baseline")}
+
+def test_clinic_rows_live_on_their_shard(clinic_b, patient, entries):
+    b_note = clinic_b["note"]
+    assert Entry.objects.using("shard1").filter(pk=b_note.pk).exists()
+    assert not Entry.objects.using("default").filter(pk=b_note.pk).exists()
+    assert Entry.objects.using("default").filter(patient=patient).count() == 3
+    # the patient stays in the directory, with a copy on its shard for joins
+    assert Patient.objects.using("shard1").get(pk=clinic_b["patient"].pk).clinic_id == "clinicB"
+    with use_clinic("clinicB"):
+        assert list(Entry.objects.values_list("pk", flat=True)) == [b_note.pk]
+
+def test_ids_are_unique_across_shards(clinic_b, patient):
+    more_b = Entry.objects.bulk_create([
+        Entry(patient=clinic_b["patient"], author_role="staff", type="staff_note", provenance_pointer=f"bulk:{i}")
+        for i in range(3)
+    ])
+    more_a = note(patient, "clinicA later")
+    ids_a = set(Entry.objects.using("default").values_list("pk", flat=True))
+    ids_b = set(Entry.objects.using("shard1").values_list("pk", flat=True))
+    assert not ids_a & ids_b
+    assert {e.pk for e in more_b} <= ids_b and more_a.pk in ids_a
+
+def test_clinic_user_reads_and_edits_on_its_shard(api_client, clinic_b):
+    b_note = clinic_b["note"]
+    auth(api_client, clinic_b["clin"])
+    resp = api_client.get(f"/api/patients/{clinic_b['patient'].id}/care-note/")
+    assert resp.status_code == 200
+    assert [e["content"] for e in resp.json()["timeline"]] == ["clinicB chest pain baseline"]
+
+    resp = api_client.post(f"/api/entries/{b_note.id}/edit/", {"content": "edited on shard1"}, format="json")
+    assert resp.status_code == 200
+    assert Entry.objects.using("shard1").get(pk=b_note.pk).content == "edited on shard1"
+    assert VersionSnapshot.objects.using("shard1").filter(entry_id=b_note.pk).count() == 1
+    assert AuditLog.objects.using("shard1").filter(action="edit_entry").count() == 1
+    assert not AuditLog.objects.using("default").filter(patient_id=clinic_b["patient"].id).exists()
+
+    resp = api_client.get(f"/api/patients/{clinic_b['patient'].id}/care-note/")
+    assert [e["content"] for e in resp.json()["timeline"]] == ["edited on shard1"]
+
+def test_other_clinics_cannot_reach_the_shard(api_client, users, clinic_b):
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/entries/{clinic_b['note'].id}/versions/").status_code == 404
+    assert api_client.get(f"/api/patients/{clinic_b['patient'].id}/care-note/").status_code == 403
+
+def test_admin_reads_locate_and_scatter(api_client, users, clinic_b):
+    auth(api_client, users["admin"])
+    resp = api_client.get(f"/api/entries/{clinic_b['note'].id}/versions/")
+    assert resp.status_code == 200 and resp.json()["current_version"] == 0
+
+    resp = api_client.get("/api/search/", {"q": "baseline"})
+    assert resp.status_code == 200
+    found = {r["entry_id"] for r in resp.json()["results"]}
+    assert clinic_b["note"].id in found and len(found) == 4  # 3 clinicA entries + clinicB's
+    resp = api_client.get("/api/search/", {"q": "baseline", "clinic_id": "clinicB"})
+    assert [r["entry_id"] for r in resp.json()["results"]] == [clinic_b["note"].id]
+
+def test_move_clinic_back_and_forth(api_client, clinic_b):
+    b_note = clinic_b["note"]
+    created_at = Entry.objects.using("shard1").get(pk=b_note.pk).created_at
+
+    counts = move_clinic("clinicB", "default", settle=0)
+    assert counts["entry"] == 1
+    assert shard_for_clinic("clinicB") == "default"
+    assert Entry.objects.using("default").get(pk=b_note.pk).created_at == created_at
+    assert not Entry.objects.using("shard1").exists()
+    assert not Patient.objects.using("shard1").exists()
+
+    auth(api_client, clinic_b["clin"])
+    resp = api_client.post(f"/api/entries/{b_note.id}/edit/", {"content": "edited after move"}, format="json")
+    assert resp.status_code == 200
+
+    call_command("move_clinic", "clinicB", "shard1", settle=0)
+    assert ClinicShard.objects.get(clinic_id="clinicB").alias == "shard1"
+    assert VersionSnapshot.objects.using("shard1").filter(entry_id=b_note.pk).count() == 1
+    assert not Entry.objects.using("default").filter(pk=b_note.pk).exists()
+    resp = api_client.get(f"/api/entries/{b_note.id}/versions/")
+    assert resp.status_code == 200 and resp.json()["current_version"] == 1
+
+def test_export_reads_the_patients_shard(api_client, users, clinic_b):
+    b_note = clinic_b["note"]
+    auth(api_client, clinic_b["clin"])
+    assert api_client.post(f"/api/entries/{b_note.id}/edit/", {"content": "edited on shard1"}, format="json").status_code == 200
+
+    auth(api_client, users["admin"])
+    resp = api_client.get(f"/api/patients/{clinic_b['patient'].id}/export/")
+    lines = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+    kinds = [l["kind"] for l in lines]
+    assert kinds.count("entry") == 1 and kinds.count("version") == 1
+    assert [l["action"] for l in lines if l["kind"] == "audit"] == ["edit_entry", "export_patient"]
+    assert next(l for l in lines if l["kind"] == "entry")["content"] == "edited on shard1"
+
+def test_moving_clinic_refuses_writes_until_the_switch(api_client, clinic_b, settings, monkeypatch):
+    b_note = clinic_b["note"]
+    auth(api_client, clinic_b["clin"])
+    during = {}
+
+    def settle(seconds):
+        # every process's map now shows the clinic as moving
+        assert seconds == settings.SHARD_MAP_CACHE_SECONDS
+        during["map"] = cache.get(sharding.MAP_CACHE_KEY) or sharding._directory()
+        resp = api_client.post(f"/api/entries/{b_note.id}/edit/", {"content": "mid-move"}, format="json")
+        during["status"], during["retry_after"] = resp.status_code, resp["Retry-After"]
+        with pytest.raises(ClinicMoving):
+            record_audit(clinic_b["patient"].id, None, "edit_entry")
+        assert shard_for_clinic("clinicA") == "default"  # other clinics are untouched
+
+    monkeypatch.setattr(sharding.time, "sleep", settle)
+    move_clinic("clinicB", "default")
+    assert during["status"] == 503 and int(during["retry_after"]) >= 1
+    assert Entry.objects.using("default").get(pk=b_note.pk).content == "clinicB chest pain baseline"
+
+    # a process still holding the fenced map reads the moving clinic's row itself
+    cache.set(sharding.MAP_CACHE_KEY, during["map"])
+    assert shard_for_clinic("clinicB") == "default"
+    assert cache.get(sharding.MAP_CACHE_KEY) is None
+    resp = api_client.post(f"/api/entries/{b_note.id}/edit/", {"content": "after move"}, format="json")
+    assert resp.status_code == 200
+
+def test_failed_move_lifts_the_fence(clinic_b, monkeypatch):
+    monkeypatch.setattr(sharding, "_copy_rows", lambda *a: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        move_clinic("clinicB", "default", settle=0)
+    assert ClinicShard.objects.values_list("alias", "moving").get(clinic_id="clinicB") == ("shard1", False)
+    note(clinic_b["patient"], "written after the failed move")
+    assert Entry.objects.using("shard1").filter(patient=clinic_b["patient"]).count() == 2
+
+def test_ingest_and_batch_write_to_the_clinic_shard(users, patient, clinic_b):
+    rows = [
+        {"patient_id": p.id, "type": "staff_note", "author_role": "staff",
+         "provenance_pointer": f"ehr:{p.clinic_id}", "content": "new allergy to penicillin"}
+        for p in (patient, clinic_b["patient"])
+    ]
+    report = ingest_lines([json.dumps(r) for r in rows], actor=users["admin"])
+    assert report.created == 2
+    assert Entry.objects.using("shard1").filter(provenance_pointer="ehr:clinicB").exists()
+    assert Entry.objects.using("default").filter(provenance_pointer="ehr:clinicA").exists()
+
+    run = execute_run(start_run("clinicB", actor=users["admin"]))
+    assert run.status == "completed" and run.patients_done == 1
+    assert Highlight.objects.using("shard1").filter(patient=clinic_b["patient"]).exists()
+    assert not Highlight.objects.using("default").exists()
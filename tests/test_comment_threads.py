@@ -0,0 +1,133 @@
+import pytest
+from accounts.models import User
+from accounts.tokens import PrincipalRefreshToken
+from notes import views
+from notes.models import AuditLog, Comment, CommentThread
+from notes.querybudget import assert_query_budget
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def within_budget(view_class):
+    return assert_query_budget(view_class.query_budget, label=view_class.__name__)
+
+def open_thread(client, entry, content="please double-check the dose"):
+    resp = client.post(f"/api/entries/{entry.id}/threads/", {"content": content}, format="json")
+    assert resp.status_code == 201, resp.content
+    return resp.json()
+
+def timeline_counts(client, patient):
+    resp = client.get(f"/api/patients/{patient.id}/care-note/")
+    return {e["id"]: (e["open_threads"], e["comment_count"]) for e in resp.json()["timeline"]}
+
+@pytest.mark.django_db
+def test_thread_lifecycle(api_client, users, patient, entries):
+    note = entries["clin_note"]
+    auth(api_client, users["staff"])
+    thread = open_thread(api_client, note)
+    assert (thread["entry_id"], thread["is_resolved"], thread["comment_count"]) == (note.id, False, 1)
+
+    auth(api_client, users["clin"])
+    resp = api_client.post(f"/api/threads/{thread['id']}/comments/", {"content": "checked, dose is right"}, format="json")
+    assert resp.status_code == 201 and resp.json()["author_role"] == "clinician"
+
+    resp = api_client.post(f"/api/threads/{thread['id']}/resolve/")
+    assert resp.json() == {"thread_id": thread["id"], "is_resolved": True, "changed": True}
+    assert api_client.post(f"/api/threads/{thread['id']}/resolve/").json()["changed"] is False
+    t = CommentThread.objects.get(id=thread["id"])
+    assert t.resolved_by_id == users["clin"].id and t.resolved_at is not None
+
+    resp = api_client.post(f"/api/threads/{thread['id']}/unresolve/")
+    assert resp.json()["is_resolved"] is False
+    t.refresh_from_db()
+    assert (t.resolved_by_id, t.resolved_at) == (None, None)
+
+    comments = api_client.get(f"/api/threads/{thread['id']}/comments/").json()["comments"]
+    assert [c["content"] for c in comments] == ["checked, dose is right", "please double-check the dose"]
+    assert list(AuditLog.objects.order_by("id").values_list("action", flat=True)) == [
+        "open_comment_thread", "add_comment", "resolve_comment_thread", "unresolve_comment_thread",
+    ]
+
+@pytest.mark.django_db
+def test_timeline_carries_counts_and_cache_is_invalidated(api_client, users, patient, entries):
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    assert timeline_counts(api_client, patient)[note.id] == (0, 0)  # now cached
+
+    first = open_thread(api_client, note)
+    second = open_thread(api_client, note)
+    api_client.post(f"/api/threads/{first['id']}/comments/", {"content": "+1"}, format="json")
+    api_client.post(f"/api/threads/{second['id']}/resolve/")
+
+    counts = timeline_counts(api_client, patient)
+    assert counts[note.id] == (1, 3)
+    assert counts[entries["staff_note"].id] == (0, 0)
+
+@pytest.mark.django_db
+def test_patients_get_no_threads_or_counts(api_client, users, patient, entries):
+    auth(api_client, users["clin"])
+    thread = open_thread(api_client, entries["ai_patient"])
+
+    auth(api_client, users["pat"])
+    timeline = api_client.get(f"/api/patients/{patient.id}/care-note/").json()["timeline"]
+    assert "open_threads" not in timeline[0] and "comment_count" not in timeline[0]
+    assert api_client.get(f"/api/entries/{entries['ai_patient'].id}/threads/").status_code == 403
+    assert api_client.get(f"/api/threads/{thread['id']}/comments/").status_code == 403
+    assert api_client.post(f"/api/threads/{thread['id']}/resolve/").status_code == 403
+
+@pytest.mark.django_db
+def test_cross_clinic_and_validation(api_client, users, patient, entries):
+    other = User.objects.create_user(username="clinB", password="pass1234", role="clinician", clinic_id="clinicB")
+    auth(api_client, other)
+    assert api_client.post(f"/api/entries/{entries['clin_note'].id}/threads/", {"content": "x"}, format="json").status_code == 403
+
+    auth(api_client, users["clin"])
+    assert api_client.post(f"/api/entries/{entries['clin_note'].id}/threads/", {"content": "  "}, format="json").status_code == 400
+    assert api_client.get(f"/api/entries/{entries['clin_note'].id}/threads/?status=maybe").status_code == 400
+    assert CommentThread.objects.count() == 0
+
+@pytest.mark.django_db
+def test_thread_listing_is_keyset_paginated_and_filtered(api_client, users, entries):
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    ids = [open_thread(api_client, note, f"thread {i}")["id"] for i in range(5)]
+    api_client.post(f"/api/threads/{ids[0]}/resolve/")
+
+    seen, cursor = [], ""
+    while True:
+        resp = api_client.get(f"/api/entries/{note.id}/threads/?limit=2&cursor={cursor}").json()
+        seen += [t["id"] for t in resp["threads"]]
+        if not resp["next_cursor"]:
+            break
+        cursor = resp["next_cursor"]
+    assert seen == ids[::-1]
+
+    open_ids = [t["id"] for t in api_client.get(f"/api/entries/{note.id}/threads/?status=open").json()["threads"]]
+    assert open_ids == ids[:0:-1]
+    resolved = api_client.get(f"/api/entries/{note.id}/threads/?status=resolved").json()["threads"]
+    assert [t["id"] for t in resolved] == [ids[0]]
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("n", [1, 30])
+def test_comment_endpoints_within_budget(api_client, users, patient, entries, n):
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    threads = CommentThread.objects.bulk_create([CommentThread(entry=e) for e in entries.values() for _ in range(n)])
+    Comment.objects.bulk_create([
+        Comment(thread=t, author=users["clin"], author_role="clinician", content=f"c{i}") for t in threads for i in range(2)
+    ])
+    thread = CommentThread.objects.filter(entry=note).first()
+
+    with within_budget(views.CareNoteView):
+        counts = timeline_counts(api_client, patient)
+    assert set(counts.values()) == {(n, 2 * n)}
+    with within_budget(views.EntryThreadsView):
+        assert len(api_client.get(f"/api/entries/{note.id}/threads/?limit=50").json()["threads"]) == n
+    with within_budget(views.EntryThreadsView):
+        open_thread(api_client, note)
+    with within_budget(views.ThreadCommentsView):
+        assert len(api_client.get(f"/api/threads/{thread.id}/comments/").json()["comments"]) == 2
+    with within_budget(views.ThreadCommentsView):
+        api_client.post(f"/api/threads/{thread.id}/comments/", {"content": "more"}, format="json")
+    with within_budget(views.ThreadResolveView):
+        api_client.post(f"/api/threads/{thread.id}/resolve/")
@@ -23,3 +23,50 @@ def test_if_match_conflict_returns_409(api_client, users, entries):
     )
     assert resp.status_code == 409
     assert "current_version" in resp.json()
+
+@pytest.mark.django_db
+def test_stale_if_match_loses_compare_and_swap(api_client, users, entries):
+    staff_note = entries["staff_note"]
+    auth(api_client, users["staff"])
+
+    # two editors both read version 0; only the first write wins
+    first = api_client.post(
+        f"/api/entries/{staff_note.id}/edit/", {"content": "editor A"}, format="json", HTTP_IF_MATCH="0"
+    )
+    second = api_client.post(
+        f"/api/entries/{staff_note.id}/edit/", {"content": "editor B"}, format="json", HTTP_IF_MATCH="0"
+    )
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert second.json()["current_version"] == 1
+
+    staff_note.refresh_from_db()
+    assert staff_note.content == "editor A"
+    assert staff_note.current_version == 1
+    assert staff_note.versions.count() == 1
+
+@pytest.mark.django_db
+def test_revert_honours_if_match(api_client, users, entries):
+    staff_note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    api_client.post(f"/api/entries/{staff_note.id}/edit/", {"content": "v1"}, format="json")
+    api_client.post(f"/api/entries/{staff_note.id}/edit/", {"content": "v2"}, format="json")
+
+    resp = api_client.post(f"/api/entries/{staff_note.id}/revert/1/", HTTP_IF_MATCH="1")
+    assert resp.status_code == 409
+
+    resp = api_client.post(f"/api/entries/{staff_note.id}/revert/1/", HTTP_IF_MATCH="2")
+    assert resp.status_code == 200
+    assert resp.json()["new_version"] == 3
+    staff_note.refresh_from_db()
+    assert get_latest_version(staff_note) == 3
+
+@pytest.mark.django_db
+def test_duplicate_snapshot_version_rejected(users, entries):
+    from django.db import IntegrityError, transaction
+    from notes.models import VersionSnapshot
+
+    staff_note = entries["staff_note"]
+    VersionSnapshot.objects.create(entry=staff_note, version=1, content="a", changed_by=users["staff"])
+    with pytest.raises(IntegrityError), transaction.atomic():
+        VersionSnapshot.objects.create(entry=staff_note, version=1, content="b", changed_by=users["staff"])
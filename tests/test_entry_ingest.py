@@ -0,0 +1,89 @@
+import json
+import pytest
+from django.core.management import call_command
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import AuditLog, Entry, Patient
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def ndjson(rows):
+    return "".join((r if isinstance(r, str) else json.dumps(r)) + "\n" for r in rows).encode()
+
+def feed_row(patient, i, **extra):
+    return {"patient_id": patient.id, "type": "clinician_note", "author_role": "clinician",
+            "provenance_pointer": f"ehr:note:{i}", "content": f"note {i}", **extra}
+
+def post(client, body, **params):
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    return client.post(f"/api/admin/entries/ingest/?{query}", data=body, content_type="application/x-ndjson")
+
+@pytest.mark.django_db
+def test_bulk_ingest_is_idempotent_and_keeps_source_timestamps(api_client, users, patient):
+    auth(api_client, users["admin"])
+    rows = [feed_row(patient, i) for i in range(1200)]
+    rows[0]["created_at"] = "2019-03-01T08:30:00Z"
+
+    first = post(api_client, ndjson(rows))
+    assert first.status_code == 200
+    assert first.json() | {"errors": []} == {
+        "received": 1200, "created": 1200, "duplicates": 0, "failed": 0, "errors": [], "errors_truncated": False,
+    }
+    assert Entry.objects.filter(patient=patient).count() == 1200
+    assert Entry.objects.get(patient=patient, provenance_pointer="ehr:note:0").created_at.year == 2019
+    assert AuditLog.objects.filter(action="ingest_entries").exists()
+
+    # a retried batch (plus one new row) only reports duplicates
+    retry = post(api_client, ndjson(rows + [feed_row(patient, "new")])).json()
+    assert (retry["created"], retry["duplicates"]) == (1, 1200)
+    assert Entry.objects.filter(patient=patient).count() == 1201
+
+@pytest.mark.django_db
+def test_bad_rows_are_reported_without_aborting_the_batch(api_client, users, patient):
+    other = Patient.objects.create(clinic_id="clinicB", display_name="Other")
+    auth(api_client, users["admin"])
+    body = ndjson([
+        feed_row(patient, 1),
+        "{not json",
+        feed_row(patient, 2, type="sticky_note"),
+        {"patient_id": patient.id, "type": "staff_note"},
+        feed_row(patient, 3, mood="calm"),
+        feed_row(patient, 4, patient_id=999999),
+        feed_row(patient, 5, author_id=999999),
+        feed_row(patient, 6, created_at="yesterday"),
+        feed_row(other, 7),
+        feed_row(patient, 1),  # duplicate within the batch
+        feed_row(patient, 8),
+    ])
+    report = post(api_client, body, clinic_id="clinicA").json()
+    assert (report["received"], report["created"], report["duplicates"], report["failed"]) == (11, 2, 1, 8)
+    errors = {e["line"]: e["error"] for e in report["errors"]}
+    assert errors[2] == "invalid JSON"
+    assert errors[3].startswith("type must be one of")
+    assert errors[4].startswith("missing field(s): author_role")
+    assert errors[5] == "unknown field(s): mood"
+    assert errors[6] == "unknown patient_id"
+    assert errors[7] == "unknown author_id"
+    assert errors[8] == "created_at must be an ISO 8601 datetime"
+    assert errors[9] == "patient belongs to another clinic"
+    assert set(Entry.objects.filter(patient=patient).values_list("provenance_pointer", flat=True)) == {
+        "ehr:note:1", "ehr:note:8",
+    }
+
+@pytest.mark.django_db
+def test_ingest_is_admin_only(api_client, users, patient):
+    auth(api_client, users["clin"])
+    assert post(api_client, ndjson([feed_row(patient, 1)])).status_code == 403
+
+@pytest.mark.django_db
+def test_ingest_command_reads_file(tmp_path, users, patient, capsys):
+    path = tmp_path / "feed.ndjson"
+    path.write_bytes(ndjson([feed_row(patient, i) for i in range(5)] + ["[]"]))
+    call_command("ingest_entries", str(path), "--chunk-size", "2")
+    call_command("ingest_entries", str(path))
+    out, err = capsys.readouterr()
+    assert "6 lines: 5 created, 0 duplicates, 1 failed" in out
+    assert "6 lines: 0 created, 5 duplicates, 1 failed" in out
+    assert "line 6: line must be a JSON object" in err
+    assert Entry.objects.filter(patient=patient).count() == 5
@@ -0,0 +1,81 @@
+import pytest
+from django.db import connection
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import Entry, Patient
+from notes.search import build_search_sql, to_match_query
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def hits(client, **params):
+    resp = client.get("/api/search/", params)
+    assert resp.status_code == 200, resp.content
+    return resp.json()["results"]
+
+@pytest.fixture
+def warfarin_notes(users, patient, entries):
+    other = Patient.objects.create(clinic_id="clinicB", display_name="Other clinic")
+    Entry.objects.create(patient=patient, author_role="clinician", type="clinician_note",
+                         provenance_pointer="ehr:1", content="Started warfarin 5mg; check INR <weekly>.")
+    Entry.objects.create(patient=patient, author_role="system", type="ai_patient_session_summary",
+                         provenance_pointer="ai:1", content="You are taking Warfarin, a blood thinner.")
+    Entry.objects.create(patient=other, author_role="clinician", type="clinician_note",
+                         provenance_pointer="ehr:2", content="warfarin held before surgery")
+    return other
+
+@pytest.mark.django_db
+def test_search_ranks_and_highlights_within_clinic(api_client, users, patient, warfarin_notes):
+    auth(api_client, users["staff"])
+    results = hits(api_client, q="warfarin")
+    assert {r["patient_id"] for r in results} == {patient.id}
+    assert len(results) == 2
+    note = next(r for r in results if r["type"] == "clinician_note")
+    assert "<mark>warfarin</mark>" in note["snippet"]
+    assert "&lt;weekly&gt;" in note["snippet"]  # entry text is escaped, only <mark> is markup
+
+    assert hits(api_client, q="warf*")
+    assert hits(api_client, q='warfarin" OR "x') == []  # FTS syntax is not passed through
+    assert api_client.get("/api/search/", {"q": "warfarin", "clinic_id": "clinicB"}).status_code == 403
+
+    auth(api_client, users["admin"])
+    assert len(hits(api_client, q="warfarin")) == 3
+    assert [r["patient_id"] for r in hits(api_client, q="warfarin", clinic_id="clinicB")] == [warfarin_notes.id]
+
+@pytest.mark.django_db
+def test_patient_search_only_sees_patient_facing_entries(api_client, users, patient, warfarin_notes):
+    auth(api_client, users["pat"])
+    results = hits(api_client, q="warfarin")
+    assert [r["type"] for r in results] == ["ai_patient_session_summary"]
+    assert hits(api_client, q="warfarin", patient_id=patient.id) == results
+    assert api_client.get("/api/search/", {"q": "warfarin", "patient_id": warfarin_notes.id}).status_code == 403
+
+@pytest.mark.django_db
+def test_index_follows_edits_reverts_and_bulk_writes(api_client, users, patient, entries):
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "apixaban started"}, format="json")
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "switched to heparin"}, format="json")
+    assert [r["entry_id"] for r in hits(api_client, q="heparin")] == [note.id]
+    assert hits(api_client, q="apixaban") == []
+
+    api_client.post(f"/api/entries/{note.id}/revert/1/")
+    assert [r["entry_id"] for r in hits(api_client, q="apixaban")] == [note.id]
+    assert hits(api_client, q="heparin") == []
+
+    Entry.objects.bulk_create([Entry(patient=patient, author_role="staff", type="staff_note",
+                                     provenance_pointer="bulk:1", content="dabigatran")])
+    assert len(hits(api_client, q="dabigatran")) == 1
+    Entry.objects.filter(provenance_pointer="bulk:1").delete()
+    assert hits(api_client, q="dabigatran") == []
+
+@pytest.mark.django_db
+def test_search_is_driven_by_the_fts_index():
+    sql, params = build_search_sql(to_match_query("warfarin"), {"clinic_id": "clinicA"}, 20)
+    with connection.cursor() as cur:
+        cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plan = [row[-1] for row in cur.fetchall()]
+    # the only scan is the FTS index lookup; entries and patients are fetched per hit by primary key
+    assert [step for step in plan if step.startswith("SCAN")] == [plan[0]]
+    assert plan[0].startswith("SCAN notes_entry_fts VIRTUAL TABLE INDEX")
+    assert any(step.startswith("SEARCH e USING INTEGER PRIMARY KEY") for step in plan)
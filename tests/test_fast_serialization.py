@@ -0,0 +1,74 @@
+import pytest
+from rest_framework.renderers import JSONRenderer
+from notes.fast_serializers import ENTRY_COLUMNS, serialize_entry_rows, serialize_highlights
+from notes.models import Entry, Highlight
+from notes.renderers import FastJSONRenderer
+from notes.serializers import EntrySerializer, HighlightSerializer
+
+@pytest.fixture
+def tricky(users, patient, entries):
+    e = Entry.objects.create(
+        patient=patient,
+        author=users["clin"],
+        author_role="clinician",
+        type="clinician_note",
+        provenance_pointer="manual:unicode",
+        content='Température 38°C — "quoted" \\ back slash  \U0001f600 \u2028 line sep chest pain',
+    )
+    Highlight.objects.create(
+        patient=patient, created_by=None, text="chest pain: …", risk_reason="cardiac",
+        entry=e, span_start=3, span_end=13, status="accepted",
+    )
+    return e
+
+@pytest.mark.django_db
+def test_fast_path_matches_drf_serializers_byte_for_byte(patient, tricky):
+    entries_qs = Entry.objects.filter(patient=patient).order_by("-created_at", "-id")
+    hl_qs = Highlight.objects.filter(patient=patient).order_by("-created_at")
+
+    drf = {
+        "timeline": EntrySerializer(entries_qs, many=True).data,
+        "highlights": HighlightSerializer(hl_qs, many=True).data,
+    }
+    fast = {
+        "timeline": serialize_entry_rows(entries_qs.values_list(*ENTRY_COLUMNS)),
+        "highlights": serialize_highlights(hl_qs),
+    }
+    assert fast == drf
+    assert FastJSONRenderer().render(fast) == JSONRenderer().render(drf)
+
+def test_fast_renderer_matches_stock_renderer_with_orjson():
+    pytest.importorskip("orjson")
+    import datetime, decimal, uuid
+    payload = {
+        "s": "a b c ü \U0001f600",
+        "n": [1, -2, None, True, 10**18],
+        "nested": {"k": [{"x": "y"}]},
+        # formatted differently by orjson: must go through the fallback
+        "dt": datetime.datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+        "dec": decimal.Decimal("1.10"),
+        "u": uuid.UUID(int=7),
+    }
+    assert FastJSONRenderer().render(payload) == JSONRenderer().render(payload)
+    del payload["dt"], payload["dec"]
+    assert FastJSONRenderer().render(payload) == JSONRenderer().render(payload)
+
+    # floats: orjson writes 0.00001 / 1e16 where json.dumps writes 1e-05 / 1e+16
+    for f in (0.0, -0.0, 1.5, 0.1 + 0.2, 1e-4, 1e-05, 2.5e-300, 1e15, 1e16, -1.5e300, 12345.678):
+        payload = {"elapsed_seconds": f, "rates": [{"entries_per_second": f}]}
+        assert FastJSONRenderer().render(payload) == JSONRenderer().render(payload), f
+    # the strict stock renderer refuses NaN/inf; orjson would write null
+    for f in (float("nan"), float("inf"), -float("inf")):
+        with pytest.raises(ValueError):
+            FastJSONRenderer().render({"n": [f]})
+
+def test_fast_renderer_without_orjson_warns_once(monkeypatch, caplog):
+    from notes import renderers
+    monkeypatch.setattr(renderers, "orjson", None)
+    monkeypatch.setattr(renderers, "_warned_no_orjson", False)
+    payload = {"s": "a b c ü", "n": [1, None]}
+    for _ in range(2):
+        assert FastJSONRenderer().render(payload) == JSONRenderer().render(payload)
+    assert [r.message for r in caplog.records].count(
+        "orjson is not installed; FastJSONRenderer falls back to the stock JSON encoder"
+    ) == 1
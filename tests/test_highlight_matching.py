@@ -0,0 +1,52 @@
+import json
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.matching import KeywordMatcher, get_highlight_matcher
+from notes.models import Entry
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def test_matcher_reports_every_match_with_true_spans():
+    m = KeywordMatcher([("chest pain", "cardiac"), ("pain", "pain"), ("bleeding", "bleed")])
+    text = "Chest pain at rest; no bleeding. Chest PAIN again."
+    found = [(x.start, x.end, x.term) for x in m.find_all(text)]
+    assert (0, 10, "chest pain") in found
+    assert (6, 10, "pain") in found
+    assert (23, 31, "bleeding") in found
+    assert (33, 43, "chest pain") in found
+    for start, end, term in found:
+        assert text[start:end].lower() == term
+
+def test_matcher_respects_word_boundaries():
+    m = KeywordMatcher([("pe", "pulmonary embolism")])
+    assert [x.start for x in m.find_all("rule out PE; pending repeat")] == [9]
+
+def test_rules_loaded_from_configured_file(tmp_path, settings):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({f"term{i}": f"reason {i}" for i in range(2000)}))
+    settings.HIGHLIGHT_RULES_FILE = str(path)
+    matcher = get_highlight_matcher()
+    assert len(matcher) == 2000
+    assert [x.reason for x in matcher.find_all("saw term1999 today")] == ["reason 1999"]
+
+@pytest.mark.django_db
+def test_generated_highlights_carry_match_spans(api_client, users, patient, entries):
+    content = "Staff note: reports chest pain overnight and minor bleeding from gums."
+    e = Entry.objects.create(
+        patient=patient,
+        author=users["staff"],
+        author_role="staff",
+        type="staff_note",
+        provenance_pointer="manual:risk",
+        content=content,
+    )
+    auth(api_client, users["staff"])
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    assert resp.status_code == 200
+    hs = resp.json()["highlights"]
+    assert {h["risk_reason"] for h in hs} == {"Potential cardiac symptom", "Bleeding risk signal"}
+    for h in hs:
+        assert h["entry_id"] == e.id
+        assert content[h["span_start"]:h["span_end"]] in {"chest pain", "bleeding"}
@@ -0,0 +1,87 @@
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import Entry, Highlight
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def make_note(patient, users, content, n):
+    return Entry.objects.create(
+        patient=patient,
+        author=users["staff"],
+        author_role="staff",
+        type="staff_note",
+        provenance_pointer=f"manual:risk:{n}",
+        content=content,
+    )
+
+@pytest.mark.django_db
+def test_regenerate_keeps_reviewed_highlights_and_scans_only_new_entries(api_client, users, patient, entries):
+    first = make_note(patient, users, "Staff note: chest pain reported.", 1)
+    auth(api_client, users["staff"])
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    assert resp.json()["created"] == 1
+    h = Highlight.objects.get(entry=first)
+    h.status = "accepted"
+    h.save(update_fields=["status"])
+
+    # nothing changed: nothing rescanned, nothing touched
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    assert resp.json()["created"] == 0
+    assert Highlight.objects.get(id=h.id).status == "accepted"
+
+    second = make_note(patient, users, "Staff note: gum bleeding.", 2)
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    assert resp.json()["created"] == 1
+    assert resp.json()["highlights"][0]["entry_id"] == second.id
+    assert Highlight.objects.get(id=h.id).status == "accepted"
+
+@pytest.mark.django_db
+def test_edited_entry_is_rescanned_and_decision_follows_span(api_client, users, patient, entries):
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "chest pain"}, format="json")
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    h = Highlight.objects.get(entry=note)
+    h.status = "rejected"
+    h.save(update_fields=["status"])
+
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "Overnight: chest pain; allergy to latex"}, format="json")
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    assert [x["risk_reason"] for x in resp.json()["highlights"]] == ["Possible allergy mentioned"]
+
+    h.refresh_from_db()
+    assert h.status == "rejected"
+    assert (h.span_start, h.span_end) == (11, 21)
+
+@pytest.mark.django_db
+def test_reviewed_highlight_whose_term_is_gone_is_marked_stale(api_client, users, patient, entries):
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "chest pain"}, format="json")
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    h = Highlight.objects.get(entry=note)
+    h.status = "accepted"
+    h.save(update_fields=["status"])
+
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "resolved overnight"}, format="json")
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    h.refresh_from_db()
+    assert h.status == "accepted" and h.stale
+
+    # the term comes back: the decision is rebased onto it and no longer stale
+    api_client.post(f"/api/entries/{note.id}/edit/", {"content": "recurring chest pain"}, format="json")
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    h.refresh_from_db()
+    assert not h.stale and (h.span_start, h.span_end) == (10, 20)
+    assert Highlight.objects.filter(entry=note).count() == 1
+
+@pytest.mark.django_db
+def test_full_mode_rebuilds_everything(api_client, users, patient, entries):
+    make_note(patient, users, "Staff note: chest pain reported.", 1)
+    auth(api_client, users["staff"])
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+    resp = api_client.post(f"/api/patients/{patient.id}/highlights/generate/?mode=full")
+    assert resp.json()["created"] == 1
+    assert Highlight.objects.filter(patient=patient).count() == 1
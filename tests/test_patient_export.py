@@ -0,0 +1,107 @@
+import gzip
+import json
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from accounts.tokens import PrincipalRefreshToken
+from notes.models import Entry, Highlight
+from notes.querybudget import record_queries
+
+def auth(client, user):
+    token = PrincipalRefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def read(resp):
+    assert resp.streaming
+    body = b"".join(resp.streaming_content)
+    if resp["Content-Type"] == "application/gzip":
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+def by_kind(lines, kind):
+    return [l for l in lines if l["kind"] == kind]
+
+@pytest.mark.django_db
+def test_export_streams_every_section_with_rebuilt_versions(api_client, users, patient, entries, settings):
+    settings.VERSION_KEYFRAME_INTERVAL = 2
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    texts = ["first draft", "first draft, chest pain", "second draft with chest pain"]
+    for t in texts:
+        assert api_client.post(f"/api/entries/{note.id}/edit/", {"content": t}, format="json").status_code == 200
+    api_client.post(f"/api/patients/{patient.id}/highlights/generate/")
+
+    resp = api_client.get(f"/api/patients/{patient.id}/export/")
+    assert resp.status_code == 200
+    assert 'filename="patient-' in resp["Content-Disposition"]
+    lines = read(resp)
+
+    assert lines[0]["kind"] == "header" and lines[0]["patient_id"] == patient.id
+    assert {e["id"] for e in by_kind(lines, "entry")} == {e.id for e in entries.values()}
+    versions = [(v["version"], v["content"]) for v in by_kind(lines, "version") if v["entry_id"] == note.id]
+    assert versions == list(enumerate(texts, 1))
+    assert len(by_kind(lines, "highlight")) == Highlight.objects.filter(patient=patient).count() > 0
+    assert "edit_entry" in {a["action"] for a in by_kind(lines, "audit")}
+
+@pytest.mark.django_db
+def test_patient_export_applies_care_note_rbac(api_client, users, patient, entries):
+    auth(api_client, users["clin"])
+    api_client.post(f"/api/entries/{entries['clin_note'].id}/edit/", {"content": "hidden"}, format="json")
+
+    auth(api_client, users["pat"])
+    lines = read(api_client.get(f"/api/patients/{patient.id}/export/"))
+    assert [e["type"] for e in by_kind(lines, "entry")] == ["ai_patient_session_summary"]
+    assert by_kind(lines, "version") == []
+    assert by_kind(lines, "audit") == []
+
+    users["staff"].clinic_id = "clinicB"
+    users["staff"].save()
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/patients/{patient.id}/export/").status_code == 403
+
+@pytest.mark.django_db
+def test_gzip_export_decodes_to_same_records(api_client, users, patient, entries):
+    auth(api_client, users["admin"])
+    plain = read(api_client.get(f"/api/patients/{patient.id}/export/"))
+    resp = api_client.get(f"/api/patients/{patient.id}/export/?compress=gzip")
+    assert resp["Content-Disposition"].endswith('.ndjson.gz"')
+    packed = read(resp)
+    # header timestamps and the audit row of the second export differ
+    assert by_kind(packed, "entry") == by_kind(plain, "entry")
+    assert by_kind(packed, "audit")[:len(by_kind(plain, "audit"))] == by_kind(plain, "audit")
+    assert api_client.get(f"/api/patients/{patient.id}/export/?compress=zip").status_code == 400
+
+@pytest.mark.django_db
+def test_export_query_count_does_not_grow_with_record(api_client, users, patient, entries):
+    auth(api_client, users["admin"])
+    counts = []
+    for n in (1, 300):
+        Entry.objects.bulk_create([
+            Entry(patient=patient, author_role="staff", type="staff_note", provenance_pointer=f"bulk:{n}:{i}", content="x")
+            for i in range(n)
+        ])
+        with record_queries() as recorder:
+            read(api_client.get(f"/api/patients/{patient.id}/export/"))
+        counts.append(len(recorder))
+    assert counts[0] == counts[1]
+
+@pytest.mark.django_db
+def test_export_streams_chunk_by_chunk_under_asgi(api_client, users, patient, entries):
+    Entry.objects.bulk_create([
+        Entry(patient=patient, author_role="staff", type="staff_note", provenance_pointer=f"big:{i}", content="x" * 500)
+        for i in range(300)
+    ])
+    auth(api_client, users["admin"])
+    plain = read(api_client.get(f"/api/patients/{patient.id}/export/"))
+    token = PrincipalRefreshToken.for_user(users["admin"]).access_token
+
+    async def scenario():
+        resp = await AsyncClient().get(f"/api/patients/{patient.id}/export/", headers={"Authorization": f"Bearer {token}"})
+        # an async iterator, so the ASGI handler sends each chunk as it is built instead of list()-ing the export
+        assert resp.is_async
+        return [chunk async for chunk in resp.streaming_content]
+
+    chunks = async_to_sync(scenario)()
+    assert len(chunks) > 1
+    lines = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert by_kind(lines, "entry") == by_kind(plain, "entry")
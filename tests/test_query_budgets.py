@@ -0,0 +1,196 @@
+import pytest
+from django.db import connection
+from accounts.tokens import PrincipalRefreshToken
+from notes import views
+from notes.models import Entry, Highlight
+from notes.querybudget import QueryBudgetExceeded, assert_query_budget, record_queries
+
+def auth(client, user):
+    # claims token: authentication itself runs no queries
+    token = PrincipalRefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def within_budget(view_class):
+    return assert_query_budget(view_class.query_budget, label=view_class.__name__)
+
+def insert_batches(n):
+    # bulk INSERT statements bulk_create needs for n new highlights (SQLite: 999 parameters each)
+    fields = [f for f in Highlight._meta.concrete_fields if not f.primary_key]
+    return -(-n // min(500, connection.ops.bulk_batch_size(fields, [None] * n))) if n else 0
+
+def generate_within_budget(client, patient, mode="incremental"):
+    # the declared budget covers one INSERT batch of highlights; every further batch adds one query
+    with record_queries() as recorder:
+        resp = client.post(f"/api/patients/{patient.id}/highlights/generate/?mode={mode}")
+    assert resp.status_code == 200
+    budget = views.GenerateHighlightsView.query_budget + max(0, insert_batches(resp.json()["created"]) - 1)
+    assert len(recorder) <= budget, recorder.report(budget, "GenerateHighlightsView")
+    return resp, len(recorder)
+
+def add_notes(patient, users, n):
+    Entry.objects.bulk_create([
+        Entry(patient=patient, author=users["clin"], author_role="clinician", type="clinician_note",
+              provenance_pointer=f"manual:bulk:{n}:{i}", content=f"reports chest pain and an allergy ({i})")
+        for i in range(n)
+    ])
+
+@pytest.mark.django_db
+# 2 highlights per note: 150 notes take several bulk INSERTs
+@pytest.mark.parametrize("rows", [1, 40, 150])
+def test_care_note_and_highlight_endpoints_are_flat_in_row_count(api_client, users, patient, entries, rows):
+    add_notes(patient, users, rows)
+    auth(api_client, users["admin"])
+
+    generate_within_budget(api_client, patient)
+    resp, _ = generate_within_budget(api_client, patient, mode="full")
+    assert resp.json()["created"] == Highlight.objects.filter(patient=patient).count() >= 2 * rows
+
+    with within_budget(views.CareNoteView):
+        first = api_client.get(f"/api/patients/{patient.id}/care-note/?limit=10")
+    assert len(first.json()["glance"]["highlights"]) >= 2 * rows
+    with assert_query_budget(1):
+        assert api_client.get(
+            f"/api/patients/{patient.id}/care-note/?limit=10", HTTP_IF_NONE_MATCH=first["ETag"]
+        ).status_code == 304
+    if first.json()["next_cursor"]:
+        with within_budget(views.CareNoteView):
+            api_client.get(f"/api/patients/{patient.id}/care-note/?limit=10&cursor={first.json()['next_cursor']}")
+
+@pytest.mark.django_db
+def test_highlight_generation_grows_by_one_query_per_insert_batch(api_client, users, patient, entries):
+    auth(api_client, users["admin"])
+    generate_within_budget(api_client, patient)  # creates the watermark
+    runs = []
+    for rows in (1, 150):
+        add_notes(patient, users, rows)
+        resp, queries = generate_within_budget(api_client, patient, mode="full")
+        runs.append((resp.json()["created"], queries))
+    (small, small_queries), (large, large_queries) = runs
+    assert insert_batches(large) - insert_batches(small) >= 2
+    assert large_queries - small_queries == insert_batches(large) - insert_batches(small)
+
+@pytest.mark.django_db
+def test_highlight_serializer_does_not_load_entries(users, patient, entries, django_assert_num_queries):
+    from notes.serializers import HighlightSerializer
+    for e in (entries["staff_note"], entries["clin_note"]):
+        Highlight.objects.create(patient=patient, entry=e, text="x", risk_reason="r", span_start=0, span_end=1)
+    hs = list(Highlight.objects.filter(patient=patient))
+    with django_assert_num_queries(0):
+        data = HighlightSerializer(hs, many=True).data
+    assert {d["entry_id"] for d in data} == {entries["staff_note"].id, entries["clin_note"].id}
+
+@pytest.mark.django_db
+def test_entry_endpoints_within_budget(api_client, users, entries):
+    note = entries["clin_note"]
+    auth(api_client, users["clin"])
+    for i in range(3):
+        with within_budget(views.EntryEditView):
+            assert api_client.post(f"/api/entries/{note.id}/edit/", {"content": f"v{i}"}, format="json").status_code == 200
+    with within_budget(views.EntryVersionsView):
+        assert api_client.get(f"/api/entries/{note.id}/versions/").status_code == 200
+    with within_budget(views.EntryVersionsView):
+        assert api_client.get(f"/api/entries/{note.id}/versions/?include=content").status_code == 200
+    with within_budget(views.EntryDiffView):
+        assert api_client.get(f"/api/entries/{note.id}/diff/1/3/").status_code == 200
+    with within_budget(views.EntryRevertView):
+        assert api_client.post(f"/api/entries/{note.id}/revert/1/").status_code == 200
+
+@pytest.mark.django_db
+def test_highlight_status_and_summary_within_budget(api_client, users, patient, entries):
+    h = Highlight.objects.create(patient=patient, entry=entries["clin_note"], text="x", risk_reason="r")
+    auth(api_client, users["clin"])
+    with within_budget(views.HighlightStatusView):
+        assert api_client.post(f"/api/highlights/{h.id}/status/", {"status": "accepted"}, format="json").status_code == 200
+    for _ in range(2):
+        with within_budget(views.GenerateMockPatientSummaryView):
+            resp = api_client.post(f"/api/patients/{patient.id}/ai/patient-summary-mock/")
+        assert resp.status_code == 202
+    with within_budget(views.JobStatusView):
+        assert api_client.get(resp["Location"]).status_code == 200
+
+@pytest.mark.django_db
+def test_clinic_batch_cost_does_not_grow_with_entries(api_client, users, patient, entries):
+    auth(api_client, users["admin"])
+    url = "/api/admin/clinics/clinicA/highlights/generate/"
+    api_client.post(url, {"wait": True}, format="json")  # creates the watermark
+    counts, created = [], []
+    # 2 highlights per note: 150 notes take several bulk INSERTs, which is all that may grow
+    for rows in (1, 150):
+        add_notes(patient, users, rows)
+        before = Highlight.objects.count()
+        with record_queries() as recorder:
+            run = api_client.post(url, {"wait": True}, format="json").json()
+        counts.append(len(recorder))
+        created.append(Highlight.objects.count() - before)
+    assert insert_batches(created[1]) > insert_batches(created[0])
+    assert counts[1] - counts[0] == insert_batches(created[1]) - insert_batches(created[0])
+
+    with within_budget(views.HighlightBatchRunView):
+        assert api_client.get(f"/api/admin/highlight-runs/{run['id']}/").status_code == 200
+
+@pytest.mark.django_db
+def test_middleware_enforces_declared_budget(api_client, users, patient, settings, monkeypatch):
+    settings.MIDDLEWARE = [*settings.MIDDLEWARE, "notes.querybudget.QueryBudgetMiddleware"]
+    settings.QUERY_BUDGET_ACTION = "raise"
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+    monkeypatch.setattr(views.CareNoteView, "query_budget", 1)
+    with pytest.raises(QueryBudgetExceeded, match="budget is 1"):
+        api_client.get(f"/api/patients/{patient.id}/care-note/?limit=7")
+
+@pytest.mark.django_db
+def test_export_view_within_budget(api_client, users, patient, entries):
+    auth(api_client, users["staff"])
+    with within_budget(views.PatientExportView):
+        resp = api_client.get(f"/api/patients/{patient.id}/export/")
+    assert resp.status_code == 200
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("rows", [1, 150])
+def test_search_within_budget(api_client, users, patient, entries, rows):
+    add_notes(patient, users, rows)
+    auth(api_client, users["pat"])
+    with within_budget(views.SearchView):
+        assert api_client.get("/api/search/", {"q": "summary"}).status_code == 200
+    auth(api_client, users["staff"])
+    with within_budget(views.SearchView):
+        resp = api_client.get("/api/search/", {"q": "chest pain", "patient_id": patient.id, "limit": 100})
+    assert len(resp.json()["results"]) == min(rows, 100)
+
+@pytest.mark.django_db
+def test_audit_log_within_budget_across_table_and_archive(api_client, users, patient, settings, tmp_path):
+    from datetime import timedelta
+    from django.utils import timezone
+    from notes.audit_archive import archive_audit_log
+    from notes.models import AuditLog
+    settings.AUDIT_ARCHIVE_DIR = tmp_path / "archive"
+    settings.AUDIT_RETENTION_DAYS = 30
+    now = timezone.now()
+    AuditLog.objects.bulk_create([
+        AuditLog(patient=patient, action="edit_entry", meta={}, created_at=now - timedelta(days=days))
+        for days in (1, 2, 40, 41, 50)
+    ])
+    archive_audit_log()
+    auth(api_client, users["admin"])
+
+    cursor, archived = None, []
+    for _ in range(3):
+        with within_budget(views.AuditLogView):
+            resp = api_client.get("/api/admin/audit/", {"patient_id": patient.id, "limit": 2, "cursor": cursor or ""})
+        archived += [e["archived"] for e in resp.json()["results"]]
+        cursor = resp.json()["next_cursor"]
+    assert archived == [False, False, True, True, True] and cursor is None
+
+@pytest.mark.django_db
+def test_admission_metrics_within_budget(api_client, users, patient):
+    from notes.admission import admit
+    from notes.models import Patient
+    for clinic_id in ("clinicA", "clinicB", "clinicC"):
+        Patient.objects.get_or_create(clinic_id=clinic_id, defaults={"display_name": f"Synthetic {clinic_id}"})
+        with admit(clinic_id):
+            pass
+    auth(api_client, users["admin"])
+    with within_budget(views.AdmissionMetricsView):
+        resp = api_client.get("/api/admin/admission/")
+    assert sorted(resp.json()["clinics"]) == ["clinicA", "clinicB", "clinicC"]
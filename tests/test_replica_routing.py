@@ -0,0 +1,105 @@
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from accounts.models import User
+from accounts.tokens import PrincipalRefreshToken
+from notes.models import Patient
+from notes.replicas import ReplicaRouter, replicate
+
+pytestmark = pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def timeline(client, user, patient):
+    auth(client, user)
+    resp = client.get(f"/api/patients/{patient.id}/care-note/")
+    assert resp.status_code == 200
+    return {e["content"] for e in resp.json()["timeline"]}
+
+def edit(client, user, entry, content):
+    auth(client, user)
+    resp = client.post(f"/api/entries/{entry.id}/edit/", {"content": content}, format="json")
+    assert resp.status_code == 200
+    return resp.json()["new_version"]
+
+@pytest.fixture
+def replica(settings, entries):
+    settings.REPLICA_DATABASE = "replica"
+    replicate()  # replica starts in sync; every later write lags until the next replicate()
+
+def test_other_users_read_the_lagging_replica(api_client, users, patient, entries, replica):
+    edit(api_client, users["clin"], entries["clin_note"], "edited on the primary")
+
+    assert "Clin note: baseline" in timeline(api_client, users["staff"], patient)
+    replicate()
+    assert "edited on the primary" in timeline(api_client, users["staff"], patient)
+
+def test_writer_reads_own_edit_until_the_pin_expires(api_client, users, patient, entries, replica):
+    note = entries["clin_note"]
+    edit(api_client, users["clin"], note, "my edit")
+
+    assert "my edit" in timeline(api_client, users["clin"], patient)
+    resp = api_client.get(f"/api/entries/{note.id}/versions/")
+    assert resp.json()["current_version"] == 1 and len(resp.json()["versions"]) == 1
+
+    cache.clear()  # REPLICA_STICKY_SECONDS elapsed
+    assert "my edit" not in timeline(api_client, users["clin"], patient)
+    assert api_client.get(f"/api/entries/{note.id}/versions/").json()["current_version"] == 0
+
+def test_revert_pins_the_writer(api_client, users, patient, entries, replica):
+    note = entries["clin_note"]
+    edit(api_client, users["clin"], note, "v1")
+    edit(api_client, users["clin"], note, "v2")
+    replicate()
+    cache.clear()
+
+    resp = api_client.post(f"/api/entries/{note.id}/revert/1/")
+    assert resp.status_code == 200
+    assert "v1" in timeline(api_client, users["clin"], patient)
+    assert "v2" in timeline(api_client, users["staff"], patient)
+
+def test_highlight_endpoints_pin_the_writer(api_client, users, patient, entries, replica):
+    note = entries["clin_note"]
+    note.content = "Patient reports chest pain"
+    note.save()
+    replicate()
+
+    auth(api_client, users["clin"])
+    created = api_client.post(f"/api/patients/{patient.id}/highlights/generate/").json()["highlights"]
+    assert len(created) == 1
+    assert len(api_client.get(f"/api/patients/{patient.id}/care-note/").json()["glance"]["highlights"]) == 1
+
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").json()["glance"]["highlights"] == []
+
+    replicate()
+    cache.clear()
+    auth(api_client, users["clin"])
+    resp = api_client.post(f"/api/highlights/{created[0]['id']}/status/", {"status": "accepted"}, format="json")
+    assert resp.status_code == 200
+    statuses = [h["status"] for h in api_client.get(f"/api/patients/{patient.id}/care-note/").json()["glance"]["highlights"]]
+    assert statuses == ["accepted"]
+
+def test_writes_and_write_paths_use_the_primary(api_client, users, patient, entries, replica):
+    other = User.objects.create_user(username="clin2", password="pass1234", role="clinician", clinic_id="clinicA")
+    note = entries["clin_note"]
+    edit(api_client, users["clin"], note, "first")
+
+    # not pinned, but the edit endpoint reads the entry from the primary: no stale base version
+    assert edit(api_client, other, note, "second") == 2
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/entries/{note.id}/diff/1/2/").status_code == 200
+
+def test_patient_page_reads_the_replica(client, users, entries, replica):
+    fresh = Patient.objects.create(clinic_id="clinicA", display_name="Admitted just now")
+    client.force_login(users["staff"])
+
+    assert client.get(f"/patients/{fresh.id}/").status_code == 404
+    call_command("simulate_replication", "--once")
+    assert client.get(f"/patients/{fresh.id}/").status_code == 200
+
+def test_routing_is_off_without_a_replica(settings, entries):
+    settings.REPLICA_DATABASE = None
+    assert ReplicaRouter().db_for_read(Patient) is None
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+from django.db import OperationalError, connection, transaction
+
+from accounts.tokens import PrincipalRefreshToken
+from notes.editing import snapshot_and_update_entry
+from notes.models import Entry
+from notes.sqlite import pragma, write_transaction
+
+def auth(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(user).access_token}")
+
+def in_thread(target, *args):
+    def run():
+        try:
+            target(*args)
+        finally:
+            connection.close()
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t
+
+def hold_write_lock(entry_id, content, locked, release):
+    # an edit whose transaction stays open (write lock held, nothing committed) until released
+    @write_transaction
+    def edit():
+        snapshot_and_update_entry(Entry.objects.get(id=entry_id), content, None)
+        locked.set()
+        release.wait(10)
+    edit()
+
+@pytest.mark.django_db
+def test_connections_use_the_production_profile(settings):
+    assert pragma("journal_mode") == "wal"
+    assert pragma("busy_timeout") == settings.SQLITE_PRAGMAS["busy_timeout"]
+    assert pragma("synchronous") == 1  # NORMAL
+    assert pragma("cache_size") == -64000
+    assert pragma("temp_store") == 2  # MEMORY
+
+@pytest.mark.django_db(transaction=True)
+def test_readers_are_not_blocked_by_an_open_edit(api_client, users, patient, entries):
+    note = entries["clin_note"]
+    locked, release = threading.Event(), threading.Event()
+    writer = in_thread(hold_write_lock, note.id, "edited while you read", locked, release)
+    assert locked.wait(5)
+    try:
+        auth(api_client, users["staff"])
+        started = time.monotonic()
+        resp = api_client.get(f"/api/patients/{patient.id}/care-note/")
+        # well under busy_timeout: the reader never waited for the writer's lock
+        assert resp.status_code == 200 and time.monotonic() - started < 1
+        contents = {e["content"] for e in resp.json()["timeline"]}
+        assert "Clin note: baseline" in contents and "edited while you read" not in contents
+    finally:
+        release.set()
+        writer.join(10)
+
+    resp = api_client.get(f"/api/patients/{patient.id}/care-note/")
+    assert "edited while you read" in {e["content"] for e in resp.json()["timeline"]}
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_edits_queue_instead_of_failing(users, entries):
+    note = entries["clin_note"]
+    locked, release, errors = threading.Event(), threading.Event(), []
+
+    def second_editor():
+        try:
+            snapshot_and_update_entry(Entry.objects.get(id=note.id), "second", users["clin"])
+        except Exception as exc:
+            errors.append(exc)
+
+    first = in_thread(hold_write_lock, note.id, "first", locked, release)
+    assert locked.wait(5)
+    second = in_thread(second_editor)
+    time.sleep(0.3)  # second editor is now waiting in BEGIN IMMEDIATE
+    release.set()
+    first.join(10)
+    second.join(10)
+
+    assert errors == []
+    note.refresh_from_db()
+    assert (note.current_version, note.content) == (2, "second")
+    assert list(note.versions.order_by("version").values_list("version", flat=True)) == [1, 2]
+
+@pytest.mark.django_db(transaction=True)
+def test_deferred_transaction_fails_where_begin_immediate_waits(entries):
+    note = entries["clin_note"]
+
+    def other_writer():
+        locked, release = threading.Event(), threading.Event()
+        release.set()
+        return locked, in_thread(hold_write_lock, note.id, "other writer", locked, release)
+
+    # plain BEGIN: another edit commits after our read, the snapshot is stale and the write fails at once
+    with pytest.raises(OperationalError, match="locked"):
+        with transaction.atomic():
+            Entry.objects.get(id=note.id)
+            locked, other = other_writer()
+            other.join(10)
+            Entry.objects.filter(id=note.id).update(content="late write")
+
+    # BEGIN IMMEDIATE: we hold the write lock from the start, so the other edit waits for us instead
+    @write_transaction
+    def read_then_write():
+        Entry.objects.get(id=note.id)
+        locked, other = other_writer()
+        time.sleep(0.2)
+        assert not locked.is_set()
+        Entry.objects.filter(id=note.id).update(content="late write")
+        return other
+
+    read_then_write().join(10)
+    note.refresh_from_db()
+    assert (note.current_version, note.content) == (2, "other writer")
+    assert note.versions.get(version=2).content == "other writer"
+
+@pytest.mark.django_db(transaction=True)
+def test_locked_writes_are_retried_with_backoff(settings, entries, monkeypatch):
+    note = entries["clin_note"]
+    settings.SQLITE_PRAGMAS = {**settings.SQLITE_PRAGMAS, "busy_timeout": 20}
+    settings.SQLITE_WRITE_BACKOFF = 0.05
+    connection.close()  # reconnect with the short busy_timeout
+
+    locked, release = threading.Event(), threading.Event()
+    holder = in_thread(hold_write_lock, note.id, "holder", locked, release)
+    assert locked.wait(5)
+    threading.Timer(0.3, release.set).start()
+
+    attempts = []
+    @write_transaction
+    def edit():
+        attempts.append(1)
+        return snapshot_and_update_entry(Entry.objects.get(id=note.id), "after retry", None)
+
+    settings.SQLITE_WRITE_RETRIES = 0
+    with pytest.raises(OperationalError, match="locked"):
+        edit()
+    settings.SQLITE_WRITE_RETRIES = 8
+    assert edit() == 2
+    holder.join(10)
@@ -0,0 +1,94 @@
+import time
+import pytest
+from django.core.cache import cache
+from django.db.models import F
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from accounts.authentication import PrincipalJWTAuthentication, TokenPrincipal
+from accounts.models import User, auth_version_cache_key
+from notes.models import VersionSnapshot
+
+def login(client, username):
+    resp = client.post("/api/auth/token/", {"username": username, "password": "pass1234"}, format="json")
+    assert resp.status_code == 200
+    return resp.json()
+
+def bearer(client, access):
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+@pytest.mark.django_db
+def test_access_token_carries_principal_claims(api_client, users, patient):
+    claims = AccessToken(login(api_client, "pat1")["access"])
+    assert claims["role"] == "patient"
+    assert claims["clinic_id"] == "clinicA"
+    assert claims["patient_id"] == patient.id
+
+@pytest.mark.django_db
+def test_authentication_builds_principal_without_queries(api_client, users, patient, django_assert_num_queries):
+    access = login(api_client, "clin1")["access"]
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+    with django_assert_num_queries(0):
+        user, _ = PrincipalJWTAuthentication().authenticate(request)
+    assert isinstance(user, TokenPrincipal)
+    assert (user.pk, user.role, user.clinic_id) == (users["clin"].id, "clinician", "clinicA")
+
+@pytest.mark.django_db
+def test_views_work_on_token_principal(api_client, users, patient, entries):
+    bearer(api_client, login(api_client, "clin1")["access"])
+    note = entries["clin_note"]
+    resp = api_client.post(f"/api/entries/{note.id}/edit/", {"content": "edited"}, format="json")
+    assert resp.status_code == 200
+    assert VersionSnapshot.objects.get(entry=note, version=1).changed_by_id == users["clin"].id
+
+    resp = api_client.get(f"/api/patients/{patient.id}/care-note/")
+    assert resp.status_code == 200
+
+@pytest.mark.django_db
+def test_role_change_revokes_issued_tokens(api_client, users, patient):
+    tokens = login(api_client, "staff1")
+    bearer(api_client, tokens["access"])
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+    staff = users["staff"]
+    staff.clinic_id = "clinicB"
+    staff.save()
+
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 401
+    api_client.credentials()
+    resp = api_client.post("/api/auth/refresh/", {"refresh": tokens["refresh"]}, format="json")
+    assert resp.status_code == 401
+
+    # a fresh login carries the new clinic and is scoped accordingly
+    bearer(api_client, login(api_client, "staff1")["access"])
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 403
+
+@pytest.mark.django_db
+def test_unrelated_user_change_keeps_tokens_valid(api_client, users, patient):
+    bearer(api_client, login(api_client, "staff1")["access"])
+    staff = users["staff"]
+    staff.first_name = "Sam"
+    staff.save()
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+@pytest.mark.django_db
+def test_tokens_without_claims_fall_back_to_user_lookup(api_client, users, patient):
+    bearer(api_client, RefreshToken.for_user(users["staff"]).access_token)
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+@pytest.mark.django_db
+def test_revocation_reaches_another_process_once_its_cache_entry_expires(api_client, users, patient, settings, monkeypatch):
+    bearer(api_client, login(api_client, "staff1")["access"])
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+    # another process changes the role: its save() updates only its own (per-process) cache,
+    # so this process still holds the old auth_version
+    staff = users["staff"]
+    User.objects.filter(pk=staff.pk).update(role="clinician", auth_version=F("auth_version") + 1)
+    assert cache.get(auth_version_cache_key(staff.pk)) == 0
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 200
+
+    # the entry expires (AUTH_VERSION_CACHE_SECONDS): the DB is read again and the token is revoked
+    later = time.time() + settings.AUTH_VERSION_CACHE_SECONDS + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert api_client.get(f"/api/patients/{patient.id}/care-note/").status_code == 401
+    assert cache.get(auth_version_cache_key(staff.pk)) == 1
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from accounts.tokens import PrincipalRefreshToken
+from notes import jobs
+from notes.models import Entry
+from notes.summaries import generate_patient_summary
+from notes.summarizer_stub import StubSummarizerServer
+from notes.summarizers import HTTPSummarizer, MockSummarizer, SummarizerError, SummarizerUnavailable
+
+ENTRIES = [{"id": 1, "type": "clinician_note", "content": "chest pain", "created_at": "2024-01-01T09:00:00+00:00"}]
+
+@pytest.fixture
+def stub():
+    server = StubSummarizerServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def backend_calls(monkeypatch):
+    calls = []
+    real = MockSummarizer.summarize
+    def counting(self, entries):
+        calls.append([e["id"] for e in entries])
+        return real(self, entries)
+    monkeypatch.setattr(MockSummarizer, "summarize", counting)
+    return calls
+
+@pytest.mark.django_db
+def test_unchanged_inputs_reuse_the_summary_without_backend_call(users, patient, entries, backend_calls):
+    first, cached = generate_patient_summary(patient, users["clin"])
+    assert not cached and backend_calls == [[entries["staff_note"].id, entries["clin_note"].id]]
+
+    again, cached = generate_patient_summary(patient, users["clin"])
+    assert cached and again.id == first.id and len(backend_calls) == 1
+
+    entries["staff_note"].content = "Staff note: updated"
+    entries["staff_note"].save()
+    third, cached = generate_patient_summary(patient, users["clin"])
+    assert not cached and len(backend_calls) == 2
+    assert third.provenance_pointer != first.provenance_pointer
+    assert list(Entry.objects.filter(patient=patient, type="ai_patient_session_summary")) == [third]
+
+@pytest.mark.django_db
+def test_endpoint_returns_memoized_summary_immediately(api_client, users, patient, entries, backend_calls):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {PrincipalRefreshToken.for_user(users['clin']).access_token}")
+    url = f"/api/patients/{patient.id}/ai/patient-summary-mock/"
+    assert api_client.post(url).status_code == 202
+    jobs.work("w1", once=True)
+
+    resp = api_client.post(url)
+    summary = Entry.objects.get(patient=patient, type="ai_patient_session_summary")
+    assert resp.status_code == 200
+    assert resp.json() == {"entry_id": summary.id, "provenance_pointer": summary.provenance_pointer, "cached": True}
+    assert len(backend_calls) == 1
+
+def test_http_backend_reuses_pooled_connections(stub):
+    backend = HTTPSummarizer(stub.url, timeout=2)
+    for _ in range(3):
+        assert "(clinician_note) chest pain" in backend.summarize(ENTRIES)
+    assert (stub.requests, stub.connections) == (3, 1)
+
+def test_http_backend_limits_concurrency(stub):
+    stub.delay = 0.2
+    backend = HTTPSummarizer(stub.url, timeout=2, max_concurrency=2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(backend.summarize(ENTRIES))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 6 and stub.max_in_flight == 2 and stub.connections == 2
+
+    busy = HTTPSummarizer(stub.url, timeout=2, max_concurrency=1, acquire_timeout=0)
+    worker = threading.Thread(target=busy.summarize, args=(ENTRIES,))
+    worker.start()
+    while not stub.in_flight:
+        time.sleep(0.01)
+    with pytest.raises(SummarizerUnavailable, match="concurrency"):
+        busy.summarize(ENTRIES)
+    worker.join()
+
+def test_http_backend_times_out(stub):
+    stub.delay = 0.5
+    with pytest.raises(SummarizerError, match="timed out"):
+        HTTPSummarizer(stub.url, timeout=0.1).summarize(ENTRIES)
+
+def test_circuit_breaker_opens_and_recovers(stub):
+    now = [0.0]
+    backend = HTTPSummarizer(stub.url, timeout=2, failure_threshold=2, reset_timeout=30)
+    backend.breaker.clock = lambda: now[0]
+
+    stub.status = 503
+    for _ in range(2):
+        with pytest.raises(SummarizerError, match="503"):
+            backend.summarize(ENTRIES)
+    with pytest.raises(SummarizerUnavailable, match="circuit"):
+        backend.summarize(ENTRIES)
+    assert stub.requests == 2 and backend.breaker.state == "open"
+
+    # half-open: a failed trial reopens, a successful one closes
+    now[0] = 31
+    with pytest.raises(SummarizerError, match="503"):
+        backend.summarize(ENTRIES)
+    assert backend.breaker.state == "open"
+    now[0] = 62
+    stub.status = 200
+    assert backend.summarize(ENTRIES)
+    assert backend.breaker.state == "closed" and stub.requests == 4
+
+@pytest.mark.django_db
+def test_summary_job_uses_configured_http_backend(users, patient, entries, settings, stub):
+    settings.SUMMARIZER_BACKEND = "notes.summarizers.HTTPSummarizer"
+    settings.SUMMARIZER_OPTIONS = {"url": stub.url, "timeout": 2}
+    settings.JOB_MAX_ATTEMPTS = 1
+
+    stub.status = 503
+    jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient)
+    job = jobs.run_job(jobs.claim_next("w1"))
+    assert job.status == "failed" and "503" in job.error
+
+    stub.status = 200
+    jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient)
+    job = jobs.run_job(jobs.claim_next("w1"))
+    assert job.status == "succeeded"
+    assert Entry.objects.get(id=job.result["entry_id"]).content.startswith("Patient Summary (Stub AI)")
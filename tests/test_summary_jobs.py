@@ -0,0 +1,122 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+
+from accounts.tokens import PrincipalRefreshToken
+from notes import jobs
+from notes.models import AuditLog, BackgroundJob, Entry
+
+def auth(client, user):
+    token = PrincipalRefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+def request_summary(client, patient):
+    return client.post(f"/api/patients/{patient.id}/ai/patient-summary-mock/")
+
+@pytest.mark.django_db
+def test_summary_request_is_queued_and_joined(api_client, users, patient, entries):
+    auth(api_client, users["clin"])
+    first = request_summary(api_client, patient)
+    assert first.status_code == 202
+    assert first.json()["joined"] is False and first.json()["status"] == "queued"
+    assert first["Location"] == f"/api/jobs/{first.json()['job_id']}/"
+
+    # nothing generated yet; a second request joins the job in flight
+    assert Entry.objects.filter(patient=patient, type="ai_patient_session_summary").get() == entries["ai_patient"]
+    second = request_summary(api_client, patient)
+    assert second.json() == {**first.json(), "joined": True}
+    assert BackgroundJob.objects.count() == 1
+
+    status = api_client.get(first["Location"]).json()
+    assert status["status"] == "queued" and status["progress"] == 0 and status["patient_id"] == patient.id
+
+@pytest.mark.django_db
+def test_worker_generates_summary_and_reports_result(api_client, users, patient, entries):
+    auth(api_client, users["clin"])
+    job_id = request_summary(api_client, patient).json()["job_id"]
+
+    assert jobs.work("w1", once=True) == 1
+    status = api_client.get(f"/api/jobs/{job_id}/").json()
+    assert status["status"] == "succeeded" and status["progress"] == 100 and status["attempts"] == 1
+
+    summary = Entry.objects.get(patient=patient, type="ai_patient_session_summary")
+    assert status["result"] == {"entry_id": summary.id, "provenance_pointer": summary.provenance_pointer, "cached": False}
+    assert "Clin note: baseline" in summary.content
+    assert AuditLog.objects.get(action="generate_patient_summary_mock").actor_id == users["clin"].id
+
+    # the finished job no longer absorbs new requests once the timeline changes
+    entries["clin_note"].content = "Clin note: follow-up"
+    entries["clin_note"].save()
+    again = request_summary(api_client, patient).json()
+    assert again["joined"] is False and again["job_id"] != job_id
+
+@pytest.mark.django_db
+def test_concurrent_enqueue_joins_the_winner(patient, monkeypatch):
+    key = jobs.summary_dedup_key(patient.id)
+    winner, _ = jobs.enqueue("patient_summary", key, patient=patient)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        BackgroundJob.objects.create(kind="patient_summary", dedup_key=key, patient=patient)
+
+    # lose the race: the first lookup misses, the insert hits the unique index, the retry joins
+    real_first, misses = QuerySet.first, [None]
+    monkeypatch.setattr(QuerySet, "first", lambda qs: misses.pop() if misses else real_first(qs))
+    job, created = jobs.enqueue("patient_summary", key, patient=patient)
+    assert (job.id, created) == (winner.id, False)
+
+@pytest.mark.django_db
+def test_failing_job_is_retried_then_failed(users, patient, settings, monkeypatch):
+    settings.JOB_MAX_ATTEMPTS = 2
+    def boom(job, progress):
+        progress(30, "calling model")
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr("notes.summaries.run_patient_summary_job", boom)
+
+    job, _ = jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient)
+    assert jobs.run_job(jobs.claim_next("w1")).status == "queued"
+    job = jobs.run_job(jobs.claim_next("w1"))
+    assert (job.status, job.attempts, job.progress) == ("failed", 2, 30)
+    assert "model unavailable" in job.error and job.finished_at is not None
+    assert jobs.claim_next("w1") is None
+
+@pytest.mark.django_db
+def test_expired_lease_is_requeued(patient, settings):
+    job, _ = jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient)
+    assert jobs.claim_next("dead-worker").id == job.id
+    assert jobs.claim_next("w2") is None
+
+    settings.JOB_LEASE_SECONDS = -1
+    claimed = jobs.claim_next("w2")
+    assert (claimed.id, claimed.locked_by, claimed.attempts) == (job.id, "w2", 2)
+    # the dead worker's late outcome is ignored; the new holder's counts
+    stale = BackgroundJob.objects.get(id=job.id)
+    stale.locked_by = "dead-worker"
+    assert jobs.run_job(stale).status == "running"
+    assert jobs.run_job(claimed).status == "succeeded"
+
+@pytest.mark.django_db
+def test_job_status_rbac(api_client, users, patient):
+    from notes.models import Patient
+    job, _ = jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient)
+    auth(api_client, users["pat"])
+    assert api_client.get(f"/api/jobs/{job.id}/").status_code == 403
+    assert request_summary(api_client, patient).status_code == 403
+
+    other = Patient.objects.create(clinic_id="clinicB", display_name="B")
+    other_job, _ = jobs.enqueue("patient_summary", jobs.summary_dedup_key(other.id), patient=other)
+    auth(api_client, users["staff"])
+    assert api_client.get(f"/api/jobs/{other_job.id}/").status_code == 403
+    auth(api_client, users["admin"])
+    assert api_client.get(f"/api/jobs/{other_job.id}/").status_code == 200
+
+@pytest.mark.django_db(transaction=True)
+def test_run_jobs_command_drains_queue_with_threads(users, patient):
+    jobs.enqueue("patient_summary", jobs.summary_dedup_key(patient.id), patient=patient, requested_by_id=users["clin"].id)
+    out = StringIO()
+    call_command("run_jobs", "--workers", "2", "--once", stdout=out)
+    assert "1 jobs run by 2 worker threads" in out.getvalue()
+    job = BackgroundJob.objects.get()
+    assert job.status == "succeeded"
+    assert job.locked_by.split(":")[-1] in {"t0", "t1"}
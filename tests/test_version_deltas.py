@@ -0,0 +1,46 @@
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+from notes.models import VersionSnapshot
+from notes.versioning import apply_delta, make_delta, rebuild_version
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+LONG_NOTE = " ".join(f"Observation {i}: vitals stable, continue current plan." for i in range(40))
+
+def test_delta_round_trip():
+    prev = "Patient reports mild cough.\nAdvise hydration and rest."
+    new = "Patient reports persistent cough.\nAdvise hydration, rest and follow-up."
+    assert apply_delta(prev, make_delta(prev, new)) == new
+    assert apply_delta("", make_delta("", new)) == new
+    assert apply_delta(prev, make_delta(prev, "")) == ""
+
+@pytest.mark.django_db
+def test_edits_store_deltas_between_keyframes(api_client, users, entries, settings):
+    settings.VERSION_KEYFRAME_INTERVAL = 4
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+
+    texts = {}
+    for v in range(1, 10):
+        texts[v] = LONG_NOTE + f" Addendum {v}."
+        resp = api_client.post(f"/api/entries/{note.id}/edit/", {"content": texts[v]}, format="json")
+        assert resp.json()["new_version"] == v
+
+    keyframes = set(VersionSnapshot.objects.filter(entry=note, is_keyframe=True).values_list("version", flat=True))
+    assert keyframes == {1, 5, 9}
+    stored = sum(len(s.content) + len(str(s.delta or "")) for s in VersionSnapshot.objects.filter(entry=note))
+    assert stored < sum(len(t) for t in texts.values()) / 2
+
+    for v, text in texts.items():
+        assert rebuild_version(note, v) == text
+
+    listed = api_client.get(f"/api/entries/{note.id}/versions/?include=content").json()["versions"]
+    assert {x["version"]: x["content"] for x in listed} == texts
+
+    resp = api_client.post(f"/api/entries/{note.id}/revert/7/")
+    assert resp.status_code == 200
+    note.refresh_from_db()
+    assert note.content == texts[7]
+    assert rebuild_version(note, 10) == texts[7]
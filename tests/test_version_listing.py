@@ -0,0 +1,79 @@
+import pytest
+from rest_framework_simplejwt.tokens import RefreshToken
+
+def auth(client, user):
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {str(token)}")
+
+@pytest.fixture
+def edited(api_client, users, entries, settings):
+    settings.VERSION_KEYFRAME_INTERVAL = 3
+    note = entries["staff_note"]
+    auth(api_client, users["staff"])
+    for v in range(1, 8):
+        api_client.post(f"/api/entries/{note.id}/edit/", {"content": f"Line one.\nDose {v} mg daily.\nLine three."}, format="json")
+    return note
+
+@pytest.mark.django_db
+def test_listing_is_paginated_metadata_only(api_client, edited):
+    resp = api_client.get(f"/api/entries/{edited.id}/versions/?limit=3")
+    data = resp.json()
+    assert data["current_version"] == 7
+    assert [v["version"] for v in data["versions"]] == [7, 6, 5]
+    assert "content" not in data["versions"][0]
+
+    seen = [v["version"] for v in data["versions"]]
+    cursor = data["next_cursor"]
+    while cursor:
+        page = api_client.get(f"/api/entries/{edited.id}/versions/", {"limit": 3, "cursor": cursor, "include": "content"}).json()
+        for v in page["versions"]:
+            assert v["content"] == f"Line one.\nDose {v['version']} mg daily.\nLine three."
+        seen.extend(v["version"] for v in page["versions"])
+        cursor = page["next_cursor"]
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+@pytest.mark.django_db
+def test_line_and_word_diff(api_client, edited):
+    resp = api_client.get(f"/api/entries/{edited.id}/diff/2/6/")
+    assert resp.status_code == 200
+    ops = resp.json()["ops"]
+    assert {"op": "delete", "text": "Dose 2 mg daily.\n"} in ops
+    assert {"op": "insert", "text": "Dose 6 mg daily.\n"} in ops
+
+    ops = api_client.get(f"/api/entries/{edited.id}/diff/2/6/?mode=word").json()["ops"]
+    assert [o for o in ops if o["op"] != "equal"] == [{"op": "delete", "text": "2"}, {"op": "insert", "text": "6"}]
+
+    assert api_client.get(f"/api/entries/{edited.id}/diff/2/99/").status_code == 404
+
+@pytest.mark.django_db
+def test_patient_cannot_read_staff_note_history(api_client, users, edited):
+    auth(api_client, users["pat"])
+    assert api_client.get(f"/api/entries/{edited.id}/versions/").status_code == 403
+    assert api_client.get(f"/api/entries/{edited.id}/diff/1/2/").status_code == 403
+
+@pytest.mark.django_db
+def test_listing_cost_does_not_follow_version_count(api_client, edited, django_assert_num_queries):
+    # 7 versions over 3 keyframes; besides the user lookup a page costs the entry and
+    # the page, plus the keyframe lookup and the rebuilt range with content, however
+    # many versions it lists
+    url = f"/api/entries/{edited.id}/versions/"
+    with django_assert_num_queries(3):
+        api_client.get(url, {"limit": 2})
+    with django_assert_num_queries(3):
+        api_client.get(url, {"limit": 7})
+    with django_assert_num_queries(5):
+        api_client.get(url, {"limit": 2, "include": "content"})
+    with django_assert_num_queries(5):
+        assert len(api_client.get(url, {"limit": 7, "include": "content"}).json()["versions"]) == 7
+
+@pytest.mark.django_db
+def test_diff_rebuilds_only_the_two_versions(api_client, edited, monkeypatch):
+    from notes import versioning
+    applied = []
+    apply_delta = versioning.apply_delta
+    monkeypatch.setattr(versioning, "apply_delta", lambda prev, ops: applied.append(1) or apply_delta(prev, ops))
+    # keyframes every 3 versions: 2 is a delta off keyframe 1, 6 off keyframe 4; 3..5 are never rebuilt
+    resp = api_client.get(f"/api/entries/{edited.id}/diff/2/6/")
+    assert resp.status_code == 200
+    assert [o["text"] for o in resp.json()["ops"] if o["op"] != "equal"] == ["Dose 2 mg daily.\n", "Dose 6 mg daily.\n"]
+    assert len(applied) == 3